@@ -64,6 +64,22 @@ class tools(SingletonMixin, metaclass=SingletonType):
         self.useEMA = False
         self.showunknowntrends = True
         self.enablePortfolioCalculations = False
+        self.incrementalIntradayRefresh = True
+        self.httpTransportLatency = 0.0
+        self.httpTransportMode = ""
+        self.circuitBreakerSessions = 3
+        self.downloadRetryAttempts = 3
+        self.asyncDownloadConcurrency = 0
+        self.fetchBrokerWindow = 0.05
+        self.pipelinedScan = False
+        self.persistentWorkerPool = False
+        self.taskChunkSize = 10
+        self.vectorizedScreening = False
+        self.costAwareScheduling = False
+        self.frameCacheSize = 500
+        self.enableSharedStockDB = False
+        self.enableIncrementalStockDataSave = False
+        self.enableColumnarStockStore = False
         self.logsEnabled = False
         self.generalTimeout = 2
         self.defaultIndex = 12
@@ -209,6 +225,7 @@ class tools(SingletonMixin, metaclass=SingletonType):
             parser.add_section("filters")
             parser.set("config", "alwaysHiddenDisplayColumns", str(self.alwaysHiddenDisplayColumns))
             parser.set("config", "anchoredAVWAPPercentage", str(self.anchoredAVWAPPercentage))
+            parser.set("config", "asyncDownloadConcurrency", str(self.asyncDownloadConcurrency))
             parser.set("config", "atrtrailingstopemaperiod", str(self.atrTrailingStopEMAPeriod))
             parser.set("config", "atrtrailingstopperiod", str(self.atrTrailingStopPeriod))
             parser.set("config", "atrtrailingstopsensitivity", str(self.atrTrailingStopSensitivity))
@@ -217,15 +234,30 @@ class tools(SingletonMixin, metaclass=SingletonType):
             parser.set("config", "baseIndex", str(self.baseIndex))
             parser.set("config", "cacheStockData", "y" if self.cacheEnabled else "n")
             parser.set("config", "calculatersiintraday", "y" if self.calculatersiintraday else "n")
+            parser.set("config", "circuitBreakerSessions", str(self.circuitBreakerSessions))
             parser.set("config", "daysToLookback", str(self.daysToLookback))
             parser.set("config", "defaultIndex", str(self.defaultIndex))
             parser.set("config", "defaultMonitorOptions", str(self.defaultMonitorOptions))
+            parser.set("config", "downloadRetryAttempts", str(self.downloadRetryAttempts))
             parser.set("config", "duration", self.duration)
             parser.set("config", "enableAdditionalVCPEMAFilters", "y" if (self.enableAdditionalVCPEMAFilters) else "n")
             parser.set("config", "enableAdditionalVCPFilters", "y" if (self.enableAdditionalVCPFilters) else "n")
+            parser.set("config", "enableColumnarStockStore", "y" if self.enableColumnarStockStore else "n")
+            parser.set("config", "enableIncrementalStockDataSave", "y" if self.enableIncrementalStockDataSave else "n")
             parser.set("config", "enablePortfolioCalculations", "y" if self.enablePortfolioCalculations else "n")
+            parser.set("config", "enableSharedStockDB", "y" if self.enableSharedStockDB else "n")
             parser.set("config", "enableUsageAnalytics", "y" if self.enableUsageAnalytics else "n")
+            parser.set("config", "fetchBrokerWindow", str(self.fetchBrokerWindow))
+            parser.set("config", "pipelinedScan", "y" if self.pipelinedScan else "n")
+            parser.set("config", "persistentWorkerPool", "y" if self.persistentWorkerPool else "n")
+            parser.set("config", "taskChunkSize", str(self.taskChunkSize))
+            parser.set("config", "vectorizedScreening", "y" if self.vectorizedScreening else "n")
+            parser.set("config", "costAwareScheduling", "y" if self.costAwareScheduling else "n")
+            parser.set("config", "frameCacheSize", str(self.frameCacheSize))
             parser.set("config", "generalTimeout", str(self.generalTimeout))
+            parser.set("config", "httpTransportLatency", str(self.httpTransportLatency))
+            parser.set("config", "httpTransportMode", str(self.httpTransportMode))
+            parser.set("config", "incrementalIntradayRefresh", "y" if self.incrementalIntradayRefresh else "n")
             parser.set("config", "logsEnabled", "y" if (self.logsEnabled or "PKDevTools_Default_Log_Level" in os.environ.keys()) else "n")
             parser.set("config", "longTimeout", str(self.longTimeout))
             parser.set("config", "marketOpen", str(self.marketOpen))
@@ -467,6 +499,7 @@ class tools(SingletonMixin, metaclass=SingletonType):
             try:
                 parser.set("config", "alwaysHiddenDisplayColumns", str(self.alwaysHiddenDisplayColumns))
                 parser.set("config", "anchoredAVWAPPercentage", str(self.anchoredAVWAPPercentage))
+                parser.set("config", "asyncDownloadConcurrency", str(self.asyncDownloadConcurrency))
                 parser.set("config", "atrtrailingstopemaperiod", str(self.atrTrailingStopEMAPeriod))
                 parser.set("config", "atrtrailingstopperiod", str(self.atrTrailingStopPeriod))
                 parser.set("config", "atrtrailingstopsensitivity", str(self.atrTrailingStopSensitivity))
@@ -475,18 +508,33 @@ class tools(SingletonMixin, metaclass=SingletonType):
                 parser.set("config", "baseIndex", str(self.baseIndex))
                 parser.set("config", "cacheStockData", str(self.cacheStockData))
                 parser.set("config", "calculatersiintraday", str(self.calculatersiintraday))
+                parser.set("config", "circuitBreakerSessions", str(self.circuitBreakerSessions))
                 parser.set("config", "daysToLookback", str(self.daysToLookback))
                 parser.set("config", "defaultIndex", str(self.defaultIndex))
                 parser.set("config", "defaultMonitorOptions", str(self.defaultMonitorOptions))
                 if self.duration:
                     endDuration = str(self.duration)[-1].lower()
                     endDuration = "d" if endDuration not in ["m","h","d","k","o"] else ""
+                parser.set("config", "downloadRetryAttempts", str(self.downloadRetryAttempts))
                 parser.set("config", "duration", str(self.duration + endDuration))
                 parser.set("config", "enableAdditionalVCPEMAFilters", str(self.enableAdditionalVCPEMAFilters))
                 parser.set("config", "enableAdditionalVCPFilters", str(self.enableAdditionalVCPFilters))
+                parser.set("config", "enableColumnarStockStore", "y" if self.enableColumnarStockStore else "n")
+                parser.set("config", "enableIncrementalStockDataSave", "y" if self.enableIncrementalStockDataSave else "n")
                 parser.set("config", "enablePortfolioCalculations", str(self.enablePortfolioCalculations))
+                parser.set("config", "enableSharedStockDB", "y" if self.enableSharedStockDB else "n")
                 parser.set("config", "enableUsageAnalytics", str(self.enableUsageAnalytics))
+                parser.set("config", "fetchBrokerWindow", str(self.fetchBrokerWindow))
+                parser.set("config", "pipelinedScan", "y" if self.pipelinedScan else "n")
+                parser.set("config", "persistentWorkerPool", "y" if self.persistentWorkerPool else "n")
+                parser.set("config", "taskChunkSize", str(self.taskChunkSize))
+                parser.set("config", "vectorizedScreening", "y" if self.vectorizedScreening else "n")
+                parser.set("config", "costAwareScheduling", "y" if self.costAwareScheduling else "n")
+                parser.set("config", "frameCacheSize", str(self.frameCacheSize))
                 parser.set("config", "generalTimeout", str(self.generalTimeout))
+                parser.set("config", "httpTransportLatency", str(self.httpTransportLatency))
+                parser.set("config", "httpTransportMode", str(self.httpTransportMode))
+                parser.set("config", "incrementalIntradayRefresh", "y" if self.incrementalIntradayRefresh else "n")
                 parser.set("config", "logsEnabled", str(self.logsEnabledPrompt))
                 parser.set("config", "longTimeout", str(self.longTimeout))
                 parser.set("config", "marketOpen", str(self.marketOpen))
@@ -657,6 +705,54 @@ class tools(SingletonMixin, metaclass=SingletonType):
                 self.longTimeout = float(parser.get("config", "longTimeout"))
                 self.maxdisplayresults = int(parser.get("config", "maxdisplayresults"))
                 self.maxNetworkRetryCount = int(parser.get("config", "maxNetworkRetryCount"))
+                self.incrementalIntradayRefresh = (
+                    False
+                    if "y" not in str(parser.get("config", "incrementalIntradayRefresh")).lower()
+                    else True
+                )
+                self.httpTransportLatency = float(parser.get("config", "httpTransportLatency"))
+                self.httpTransportMode = str(parser.get("config", "httpTransportMode"))
+                self.circuitBreakerSessions = int(parser.get("config", "circuitBreakerSessions"))
+                self.downloadRetryAttempts = int(parser.get("config", "downloadRetryAttempts"))
+                self.asyncDownloadConcurrency = int(parser.get("config", "asyncDownloadConcurrency"))
+                self.fetchBrokerWindow = float(parser.get("config", "fetchBrokerWindow"))
+                self.pipelinedScan = (
+                    False
+                    if "y" not in str(parser.get("config", "pipelinedScan")).lower()
+                    else True
+                )
+                self.persistentWorkerPool = (
+                    False
+                    if "y" not in str(parser.get("config", "persistentWorkerPool")).lower()
+                    else True
+                )
+                self.taskChunkSize = int(parser.get("config", "taskChunkSize"))
+                self.vectorizedScreening = (
+                    False
+                    if "y" not in str(parser.get("config", "vectorizedScreening")).lower()
+                    else True
+                )
+                self.costAwareScheduling = (
+                    False
+                    if "y" not in str(parser.get("config", "costAwareScheduling")).lower()
+                    else True
+                )
+                self.frameCacheSize = int(parser.get("config", "frameCacheSize"))
+                self.enableSharedStockDB = (
+                    False
+                    if "y" not in str(parser.get("config", "enableSharedStockDB")).lower()
+                    else True
+                )
+                self.enableIncrementalStockDataSave = (
+                    False
+                    if "y" not in str(parser.get("config", "enableIncrementalStockDataSave")).lower()
+                    else True
+                )
+                self.enableColumnarStockStore = (
+                    False
+                    if "y" not in str(parser.get("config", "enableColumnarStockStore")).lower()
+                    else True
+                )
                 self.backtestPeriod = int(parser.get("config", "backtestPeriod"))
                 self.maxBacktestWindow = int(parser.get("config", "maxBacktestWindow"))
                 self.morninganalysiscandlenumber = int(parser.get("config", "morninganalysiscandlenumber"))
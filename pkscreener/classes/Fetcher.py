@@ -40,6 +40,7 @@ from PKDevTools.classes.Fetcher import StockDataEmptyException
 from PKDevTools.classes.log import default_logger
 from PKDevTools.classes.SuppressOutput import SuppressOutput
 from PKNSETools.PKNSEStockDataFetcher import nseStockDataFetcher
+from pkscreener.classes.PKRecordReplayTransport import PKRecordReplayTransport
 from pkscreener.classes.PKTask import PKTask
 from PKDevTools.classes.OutputControls import OutputControls
 # This Class Handles Fetching of Stock Data over the internet
@@ -47,6 +48,7 @@ from PKDevTools.classes.OutputControls import OutputControls
 
 class screenerStockDataFetcher(nseStockDataFetcher):
     _tickersInfoDict={}
+    _replayWarned = False
     def fetchStockDataWithArgs(self, *args):
         task = None
         if isinstance(args[0], PKTask):
@@ -64,6 +66,49 @@ class screenerStockDataFetcher(nseStockDataFetcher):
                 task.result = result
         return result
 
+    def transportSession(self):
+        # The record/replay transport (if configured) for the yfinance downloads
+        if not hasattr(self, "_transportSession"):
+            self._transportSession = PKRecordReplayTransport.sessionFor(self.configManager)
+        return self._transportSession
+
+    def yfinanceAcceptsSession():
+        # Recent yfinance versions only take curl_cffi sessions (their data
+        # module imports curl_cffi's requests), which the transport adapter
+        # can't be mounted on.
+        try:
+            from yfinance import data as yfData
+            requestsModule = getattr(yfData, "requests", None)
+            return requestsModule is not None and not str(getattr(requestsModule, "__name__", "")).startswith("curl_cffi")
+        except Exception as e:  # pragma: no cover
+            default_logger().debug(e, exc_info=True)
+            return False
+
+    def yfinanceSession(self):
+        # The transport session, if yfinance can use it. Otherwise yfinance
+        # downloads go out with its own session, unrecorded (and are skipped
+        # when replaying).
+        session = self.transportSession()
+        if session is None:
+            return None
+        if not screenerStockDataFetcher.yfinanceAcceptsSession():
+            default_logger().debug("The installed yfinance only takes curl_cffi sessions. Its downloads are not recorded/replayed.")
+            return None
+        return session
+
+    def replaysWithoutYfinance(self):
+        # Replaying must stay off the network. When yfinance can't go through
+        # the transport, its downloads are skipped (no data) instead.
+        session = self.transportSession()
+        if session is None or session.get_adapter("https://").mode != PKRecordReplayTransport.REPLAY:
+            return False
+        if screenerStockDataFetcher.yfinanceAcceptsSession():
+            return False
+        if not screenerStockDataFetcher._replayWarned:
+            screenerStockDataFetcher._replayWarned = True
+            default_logger().warning("Replay mode: the installed yfinance can't use the replay transport. Its downloads are skipped.")
+        return True
+
     def get_stats(self,ticker):
         info = yf.Tickers(ticker).tickers[ticker].fast_info
         screenerStockDataFetcher._tickersInfoDict[ticker] = {"marketCap":info.market_cap}
@@ -110,21 +155,26 @@ class screenerStockDataFetcher(nseStockDataFetcher):
             start = None
             end = None
         data = None
+        replayOnly = self.replaysWithoutYfinance()
         with SuppressOutput(suppress_stdout=(not printCounter), suppress_stderr=(not printCounter)):
             try:
-                data = yf.download(
-                    tickers=stockCode,
-                    period=period,
-                    interval=duration,
-                    proxy=proxyServer,
-                    progress=False,
-                    rounding = True,
-                    group_by='ticker',
-                    timeout=self.configManager.generalTimeout/4,
-                    start=start,
-                    end=end
-                )
-                if (data is None or data.empty) and isinstance(stockCode,str):
+                if replayOnly:
+                    data = pd.DataFrame()
+                else:
+                    data = yf.download(
+                        tickers=stockCode,
+                        period=period,
+                        interval=duration,
+                        proxy=proxyServer,
+                        progress=False,
+                        rounding = True,
+                        group_by='ticker',
+                        timeout=self.configManager.generalTimeout/4,
+                        start=start,
+                        end=end,
+                        session=self.yfinanceSession()
+                    )
+                if (data is None or data.empty) and isinstance(stockCode,str) and not replayOnly:
                     for ticker in shared._ERRORS:
                         err = shared._ERRORS.get(ticker)
                         # Maybe this stock is recently listed. Let's try and fetch for the last month
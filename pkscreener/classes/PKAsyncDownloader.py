@@ -0,0 +1,172 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from PKDevTools.classes.log import default_logger
+from PKDevTools.classes.Utils import random_user_agent
+
+from pkscreener.classes.PKDownloadController import PKDownloadController
+from pkscreener.classes.PKStockDataSchema import PKStockDataSchema
+
+# Single process download engine for the latest candles of many symbols.
+# An asyncio event loop keeps the chart requests in flight in batches whose
+# size, concurrency and timeout come from a PKDownloadController, all of
+# them sharing one keep-alive connection pool. The Yahoo chart JSON
+# is decoded straight into the cached "split" dict format.
+# requests is blocking, so each request runs on a thread of its own while
+# the semaphore bounds how many of them are in flight.
+class PKAsyncDownloader:
+    serverBaseUrl = "https://query2.finance.yahoo.com/v8/finance/chart/"
+    COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+    DAILY_DURATIONS = ["1d", "5d", "1wk", "1mo", "3mo"]
+    ROUNDING = 2
+    THROTTLED_STATUS_CODES = [408, 429]
+
+    def sessionFor(concurrency, adapter=None):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concurrency), max_retries=1) if adapter is None else adapter
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"user-agent": random_user_agent(), "Connection": "keep-alive"})
+        return session
+
+    def tickerFor(stock, exchangeSuffix=".NS"):
+        if len(exchangeSuffix) > 0 and not stock.endswith(exchangeSuffix) and not stock.startswith("^"):
+            return f"{stock}{exchangeSuffix}"
+        return stock
+
+    def decodeChart(payload, duration="1d", timezone=None):
+        # Returns the "split" dict for the chart JSON or None if it has no candles.
+        # The index is in the local time of the exchange unless a timezone is given.
+        if isinstance(payload, (bytes, str)):
+            payload = json.loads(payload)
+        results = (payload.get("chart") or {}).get("result") or []
+        if len(results) == 0 or not results[0].get("timestamp"):
+            return None
+        result = results[0]
+        quote = result["indicators"]["quote"][0]
+        adjClose = (result["indicators"].get("adjclose") or [{}])[0].get("adjclose") or quote.get("close")
+        values = [quote.get("open"), quote.get("high"), quote.get("low"), quote.get("close"), adjClose, quote.get("volume")]
+        rows = len(result["timestamp"])
+        columns = np.column_stack([np.array(value if value is not None else [None] * rows, dtype=float) for value in values])
+        columns[:, :-1] = np.round(columns[:, :-1], PKAsyncDownloader.ROUNDING)
+        index = pd.to_datetime(np.array(result["timestamp"], dtype="int64"), unit="s", utc=True)
+        index = index.tz_convert(timezone) if timezone is not None else index.tz_convert(result.get("meta", {}).get("exchangeTimezoneName") or "UTC").tz_localize(None)
+        if duration in PKAsyncDownloader.DAILY_DURATIONS:
+            # Daily candles are stamped with the session open (or the last trade for today)
+            index = index.normalize()
+        valid = ~np.isnan(columns[:, :-2]).all(axis=1)
+        frame = pd.DataFrame(columns[valid], columns=PKAsyncDownloader.COLUMNS, index=index[valid])
+        frame = frame[~frame.index.duplicated(keep="last")]
+        if len(frame) == 0:
+            return None
+        return PKStockDataSchema.normalizeSplitDict(frame.to_dict("split"))
+
+    def paramsFor(period, duration, since=None):
+        params = {"interval": duration, "includePrePost": "false", "events": "div,splits"}
+        if since is None:
+            params["range"] = period
+        else:
+            # Only the candles from the given epoch seconds onwards
+            params["period1"] = int(since)
+            params["period2"] = int(time.time()) + 1
+        return params
+
+    async def fetchChart(session, semaphore, executor, ticker, params, duration, timeout, timezone=None):
+        # Returns (ticker, split dict or None, latency, payload size, whether it failed)
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                resp = await loop.run_in_executor(executor, lambda: session.get(f"{PKAsyncDownloader.serverBaseUrl}{ticker}", params=params, timeout=timeout))
+                latency = time.perf_counter() - started
+                if resp.status_code != 200:
+                    default_logger().debug(f"Chart request for {ticker} failed with status {resp.status_code}")
+                    # Unknown symbols are not a sign of throttling
+                    return ticker, None, latency, len(resp.content), resp.status_code in PKAsyncDownloader.THROTTLED_STATUS_CODES or resp.status_code >= 500
+                return ticker, PKAsyncDownloader.decodeChart(resp.content, duration, timezone), latency, len(resp.content), False
+            except Exception as e:
+                default_logger().debug(e, exc_info=True)
+                return ticker, None, time.perf_counter() - started, 0, True
+
+    async def fetchAll(stocks, period, duration, exchangeSuffix, controller, session, since, onBatch=None):
+        tickers = {PKAsyncDownloader.tickerFor(stock, exchangeSuffix): stock for stock in stocks}
+        pending = list(tickers.keys())
+        downloaded = {}
+        with ThreadPoolExecutor(max_workers=controller.maxConcurrency) as executor:
+            while len(pending) > 0:
+                # The controller decides the size, concurrency and timeout of every batch
+                batch, pending = pending[:controller.batchSize()], pending[controller.batchSize():]
+                semaphore = asyncio.Semaphore(controller.concurrency)
+                started = time.perf_counter()
+                results = await asyncio.gather(*[PKAsyncDownloader.fetchChart(session, semaphore, executor, ticker,
+                                                                              PKAsyncDownloader.paramsFor(period, duration, since.get(tickers[ticker], (None, None))[0]),
+                                                                              duration, controller.timeout,
+                                                                              since.get(tickers[ticker], (None, None))[1]) for ticker in batch])
+                controller.record([latency for _, _, latency, _, failed in results if not failed],
+                                  sum([payloadSize for _, _, _, payloadSize, _ in results]),
+                                  len([failed for _, _, _, _, failed in results if failed]),
+                                  time.perf_counter() - started)
+                batchData = {tickers[ticker]: data for ticker, data, _, _, _ in results if data is not None}
+                downloaded.update(batchData)
+                if onBatch is not None:
+                    onBatch(batchData)
+        return downloaded
+
+    def download(stocks, period, duration, exchangeSuffix=".NS", concurrency=32, timeout=2, session=None, controller=None, adapter=None, since={}, onBatch=None):
+        # Returns ({stock: split dict}, stocks that could not be downloaded).
+        # since maps stocks to (epoch seconds, timezone) for fetching only the candles from then on.
+        # onBatch (if given) gets the {stock: split dict} of every batch as soon as it's downloaded.
+        stocks = list(dict.fromkeys(stocks))
+        if len(stocks) == 0:
+            return {}, []
+        controller = PKDownloadController(maxConcurrency=concurrency, timeout=timeout) if controller is None else controller
+        default_logger().debug(f"Downloading {len(stocks)} symbols with {controller.describe()}")
+        ownSession = session is None
+        session = PKAsyncDownloader.sessionFor(controller.maxConcurrency, adapter) if ownSession else session
+        try:
+            def coroutine():
+                return PKAsyncDownloader.fetchAll(stocks, str(period), str(duration), exchangeSuffix, controller, session, since, onBatch)
+            try:
+                runningLoop = asyncio.get_running_loop()
+            except RuntimeError:
+                runningLoop = None
+            if runningLoop is None:
+                downloaded = asyncio.run(coroutine())
+            else:
+                # Already inside an event loop (e.g. the bot). Run ours on a separate thread.
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    downloaded = executor.submit(lambda: asyncio.run(coroutine())).result()
+        finally:
+            if ownSession:
+                session.close()
+        return downloaded, [stock for stock in stocks if stock not in downloaded.keys()]
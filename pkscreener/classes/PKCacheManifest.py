@@ -0,0 +1,182 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+from PKDevTools.classes.log import default_logger
+
+# Manifest of the local stock data cache files.
+# For every cache file it records the size, modification time, sha256,
+# number of symbols and the date of the latest candle. Validating a file is
+# then just an os.stat() as long as size and mtime still match the manifest.
+# The checksum is only recomputed when the file got touched. The copy_ file
+# remains the pristine copy of what was downloaded, but it's only copied over
+# the working file when that one is missing or no longer matches its own entry.
+class PKCacheManifest:
+    MANIFEST_FILE_NAME = "stock_data_manifest.json"
+    MANIFEST_VERSION = 1
+    COPY_PREFIX = "copy_"
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def manifestPathFor(filePath):
+        return os.path.join(os.path.dirname(os.path.abspath(filePath)), PKCacheManifest.MANIFEST_FILE_NAME)
+
+    def copyPathFor(filePath):
+        return os.path.join(os.path.dirname(filePath), f"{PKCacheManifest.COPY_PREFIX}{os.path.basename(filePath)}")
+
+    def load(manifestPath):
+        try:
+            with open(manifestPath, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == PKCacheManifest.MANIFEST_VERSION:
+                return manifest
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return {"version": PKCacheManifest.MANIFEST_VERSION, "files": {}}
+
+    def save(manifest, manifestPath):
+        tmpManifestPath = f"{manifestPath}.tmp"
+        with open(tmpManifestPath, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmpManifestPath, manifestPath)
+
+    def checksum(filePath):
+        sha256 = hashlib.sha256()
+        with open(filePath, "rb") as f:
+            for chunk in iter(lambda: f.read(PKCacheManifest.HASH_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def dataDateFor(stockData):
+        try:
+            lastDates = [data["index"][-1] for data in stockData.values() if isinstance(data, dict) and len(data.get("index", [])) > 0]
+            return str(pd.Timestamp(max(lastDates)).date()) if len(lastDates) > 0 else None
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+            return None
+
+    def entryFor(filePath):
+        manifest = PKCacheManifest.load(PKCacheManifest.manifestPathFor(filePath))
+        return manifest["files"].get(os.path.basename(filePath))
+
+    def _setEntry(filePath, entry):
+        manifestPath = PKCacheManifest.manifestPathFor(filePath)
+        manifest = PKCacheManifest.load(manifestPath)
+        if entry is None:
+            if manifest["files"].pop(os.path.basename(filePath), None) is None:
+                return
+        else:
+            manifest["files"][os.path.basename(filePath)] = entry
+        PKCacheManifest.save(manifest, manifestPath)
+
+    def record(filePath, stockData=None, sha256=None, rows=None, dataDate=None):
+        # Returns the manifest entry for the (freshly written) file or None if it
+        # could not be recorded.
+        try:
+            stat = os.stat(filePath)
+            entry = {"size": stat.st_size,
+                     "mtime": stat.st_mtime_ns,
+                     "sha256": sha256 if sha256 is not None else PKCacheManifest.checksum(filePath),
+                     "rows": rows if rows is not None else (len(stockData) if stockData is not None else None),
+                     "dataDate": dataDate if dataDate is not None else (PKCacheManifest.dataDateFor(stockData) if stockData is not None else None)}
+            PKCacheManifest._setEntry(filePath, entry)
+            return entry
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+            return None
+
+    def forget(filePath):
+        try:
+            PKCacheManifest._setEntry(filePath, None)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+
+    def isValid(filePath, allowUnknown=True):
+        # Files that predate the manifest are left for the reader to vouch for
+        # (allowUnknown), the rest must match what got recorded.
+        if not os.path.exists(filePath):
+            return False
+        entry = PKCacheManifest.entryFor(filePath)
+        if entry is None:
+            return allowUnknown
+        stat = os.stat(filePath)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime"]:
+            return True
+        if PKCacheManifest.checksum(filePath) != entry["sha256"]:
+            return False
+        # Same contents, just touched. No need to hash it again next time.
+        entry["mtime"] = stat.st_mtime_ns
+        PKCacheManifest._setEntry(filePath, entry)
+        return True
+
+    def backup(filePath, overwrite=False):
+        # (Re)creates the copy_ of a valid file, unless a valid copy already exists
+        copyFilePath = PKCacheManifest.copyPathFor(filePath)
+        try:
+            if not overwrite and PKCacheManifest.isValid(copyFilePath, allowUnknown=False):
+                return copyFilePath
+            entry = PKCacheManifest.entryFor(filePath)
+            if entry is None or not PKCacheManifest.isValid(filePath, allowUnknown=False):
+                return None
+            shutil.copy(filePath, copyFilePath)
+            PKCacheManifest.record(copyFilePath, sha256=entry["sha256"], rows=entry["rows"], dataDate=entry["dataDate"])
+            return copyFilePath
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+            return None
+
+    def restore(filePath):
+        # Makes sure filePath holds valid data, going back to the copy_ only if the
+        # file is missing or fails its own manifest entry. A file that was saved
+        # (and recorded) after the copy_ was made is newer, not corrupt, so it is
+        # left alone. A corrupt file without any usable copy gets removed so that
+        # it's downloaded again.
+        # Returns True if filePath can be used.
+        copyFilePath = PKCacheManifest.copyPathFor(filePath)
+        try:
+            if PKCacheManifest.isValid(filePath):
+                return True
+            if os.path.exists(copyFilePath) and PKCacheManifest.isValid(copyFilePath):
+                copyEntry = PKCacheManifest.entryFor(copyFilePath)
+                if copyEntry is None:
+                    copyEntry = PKCacheManifest.record(copyFilePath)
+                if copyEntry is not None:
+                    shutil.copy(copyFilePath, filePath)
+                    PKCacheManifest.record(filePath, sha256=copyEntry["sha256"], rows=copyEntry["rows"], dataDate=copyEntry["dataDate"])
+                    return True
+            if os.path.exists(filePath):
+                default_logger().debug(f"{filePath} does not match the cache manifest. Removing it.")
+                os.remove(filePath)
+            PKCacheManifest.forget(filePath)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return False
@@ -0,0 +1,521 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import copy
+import json
+import os
+import shutil
+import threading
+from collections.abc import MutableMapping
+
+import numpy as np
+import pandas as pd
+from PKDevTools.classes import Archiver
+from PKDevTools.classes.log import default_logger
+
+from pkscreener.classes.PKStockDataSchema import PKStockDataSchema
+
+# Read-only (memory-mapped) columnar store for the OHLCV cache.
+# Every numeric field of every symbol lives in one contiguous array per field
+# (in the compact dtypes of PKStockDataSchema) and each symbol is just an
+# (offset, length) window into those arrays. A symbol's DataFrame is
+# therefore built straight from the mapped arrays and no pickled python
+# lists need to be rebuilt when the cache is opened.
+# The store also behaves like the legacy dict-of-"split" stockDict so that it
+# can be handed over to the existing code as is. Any writes land in an
+# in-memory overlay and never touch the files on disk.
+# Incremental saves only append the new/corrected candles of each symbol to a
+# journal segment next to the store. Segments are applied when the store is
+# opened. Once MAX_JOURNAL_SEGMENTS of them pile up, the save that appended
+# the last one folds them back into the arrays (compact) before it returns.
+class PKColumnarStore(MutableMapping):
+    STORE_VERSION = 1
+    INDEX_FILE_NAME = "index.json"
+    TIMESTAMPS_FILE_NAME = "timestamps.npy"
+    SPLIT_KEYS = ["index", "columns", "data", PKStockDataSchema.NORMALIZED_KEY]
+    JOURNAL_SUFFIX = ".journal"
+    MAX_JOURNAL_SEGMENTS = 5
+    compactionLock = threading.Lock()
+
+    def __init__(self, storePath, mmapMode="c"):
+        self.storePath = storePath
+        # "c" (copy-on-write) keeps the arrays writable for the screening code
+        # while the changes stay private to the process and never hit the disk.
+        self.mmapMode = mmapMode
+        self._overlay = {}
+        self._removed = set()
+        self._written = set()
+        with open(os.path.join(storePath, PKColumnarStore.INDEX_FILE_NAME), "r") as f:
+            meta = json.load(f)
+        fieldArrays = [
+            np.load(os.path.join(storePath, f"field_{fieldIndex}.npy"), mmap_mode=mmapMode)
+            for fieldIndex in range(len(meta.get("fields", [])))
+        ]
+        timestamps = np.load(os.path.join(storePath, PKColumnarStore.TIMESTAMPS_FILE_NAME), mmap_mode=mmapMode)
+        self.attach(meta, timestamps, fieldArrays)
+        self.applyJournal()
+        self.symbols = dict.fromkeys(list(self.layout.keys()) + list(self._journalFrames.keys()))
+
+    def attach(self, meta, timestamps, fieldArrays):
+        if meta.get("version") != PKColumnarStore.STORE_VERSION:
+            raise ValueError(f"Unsupported store version:{meta.get('version')}")
+        self.meta = meta
+        self.fields = meta["fields"]
+        self.layout = meta["layout"]
+        self.sideColumns = meta.get("sideColumns", {})
+        self.extras = meta.get("extras", {})
+        self._fieldArrays = fieldArrays
+        self._timestamps = timestamps
+        self._journalFrames = {}
+        self._journalExtras = {}
+        self.journalSegments = []
+        self.symbols = dict.fromkeys(self.layout.keys())
+
+    @property
+    def cacheFile(self):
+        return self.meta.get("cacheFile")
+
+    def storePathForCacheFile(cacheFile, outputFolder=None):
+        if outputFolder is None:
+            outputFolder = Archiver.get_user_outputs_dir()
+        storeName = "intraday_stock_data.pkcs" if str(cacheFile).startswith("intraday_") else "stock_data.pkcs"
+        return os.path.join(outputFolder, storeName)
+
+    def journalPathFor(storePath):
+        return f"{storePath}{PKColumnarStore.JOURNAL_SUFFIX}"
+
+    def journalSegmentsFor(storePath):
+        journalPath = PKColumnarStore.journalPathFor(storePath)
+        if not os.path.isdir(journalPath):
+            return []
+        return sorted([os.path.join(journalPath, segment) for segment in os.listdir(journalPath) if segment.startswith("segment_") and segment.endswith(".json")])
+
+    def applyJournal(self):
+        for segmentPath in PKColumnarStore.journalSegmentsFor(self.storePath):
+            try:
+                with open(segmentPath, "r") as f:
+                    segment = json.load(f)
+            except Exception as e:  # pragma: no cover
+                # Probably a segment being written right now
+                default_logger().debug(e, exc_info=True)
+                continue
+            if segment.get("period") != self.meta.get("period") or segment.get("duration") != self.meta.get("duration"):
+                continue
+            for symbol, entry in segment.get("symbols", {}).items():
+                baseFrame = self._journalFrames.get(symbol)
+                if baseFrame is None:
+                    baseFrame = self.baseFrame(symbol)
+                self._journalFrames[symbol] = PKColumnarStore.applyJournalEntry(baseFrame, entry)
+                if len(entry.get("extras", {})) > 0:
+                    self._journalExtras[symbol] = self._journalExtras.get(symbol, {}) | entry["extras"]
+            self.meta["cacheFile"] = segment.get("cacheFile", self.meta.get("cacheFile"))
+            self.journalSegments.append(segmentPath)
+
+    def applyJournalEntry(baseFrame, entry):
+        journalFrame = pd.DataFrame(entry["data"], columns=entry["columns"],
+                                    index=PKColumnarStore.indexFromTimestamps(np.asarray(entry["index"], dtype=np.int64), entry["indexKind"], entry["tz"]))
+        if entry["mode"] == "append" and baseFrame is not None and len(journalFrame) > 0:
+            journalFrame = pd.concat([baseFrame[baseFrame.index < journalFrame.index[0]], journalFrame])
+        journalFrame.index.name = "Date"
+        return journalFrame
+
+    def openForCacheFile(cacheFile, configManager=None, storePath=None):
+        if storePath is None:
+            storePath = PKColumnarStore.storePathForCacheFile(cacheFile)
+        if not os.path.isfile(os.path.join(storePath, PKColumnarStore.INDEX_FILE_NAME)):
+            return None
+        try:
+            store = PKColumnarStore(storePath)
+        except Exception as e:  # pragma: no cover
+            default_logger().debug(e, exc_info=True)
+            return None
+        if store.cacheFile != cacheFile:
+            return None
+        if configManager is not None:
+            # A store saved for a different period/candle duration is stale
+            if store.meta.get("period") not in [None, configManager.period] or \
+                store.meta.get("duration") not in [None, configManager.duration]:
+                return None
+        return store
+
+    def frame(self, symbol):
+        if symbol in self._overlay:
+            return PKColumnarStore.frameFromSplitDict(self._overlay[symbol])
+        if symbol in self._removed:
+            return None
+        if symbol in self._journalFrames:
+            return self._journalFrames[symbol].copy(deep=False)
+        return self.baseFrame(symbol)
+
+    def indexFromTimestamps(timestamps, indexKind, tz):
+        if indexKind == "datetime":
+            index = pd.DatetimeIndex(timestamps.view("datetime64[ns]"))
+            if tz is not None:
+                index = index.tz_localize("UTC").tz_convert(tz)
+        else:
+            index = pd.Index(timestamps)
+        index.name = "Date"
+        return index
+
+    def baseFrame(self, symbol):
+        if symbol not in self.layout:
+            return None
+        offset, length, fieldIndices, columns, indexKind, tz = self.layout[symbol]
+        end = offset + length
+        index = PKColumnarStore.indexFromTimestamps(self._timestamps[offset:end], indexKind, tz)
+        fieldValues = {}
+        for fieldIndex in fieldIndices:
+            fieldValues[self.fields[fieldIndex]] = PKStockDataSchema.fromStorage(self._fieldArrays[fieldIndex][offset:end])
+        symbolSideColumns = self.sideColumns.get(symbol, {})
+        for column, values in symbolSideColumns.items():
+            sideValues = np.full(length, None, dtype=object)
+            for rowIndex, value in values.items():
+                sideValues[int(rowIndex)] = value
+            fieldValues[column] = sideValues
+        orderedValues = {column: fieldValues[column] for column in columns if column in fieldValues}
+        return pd.DataFrame(orderedValues, index=index, copy=False)
+
+    def extrasFor(self, symbol):
+        if symbol in self._overlay:
+            value = self._overlay[symbol]
+            return {key: extra for key, extra in value.items() if key not in PKColumnarStore.SPLIT_KEYS} if isinstance(value, dict) else {}
+        return self.extras.get(symbol, {}) | self._journalExtras.get(symbol, {})
+
+    def splitDict(self, symbol):
+        df = self.frame(symbol)
+        if df is None:
+            raise KeyError(symbol)
+        df.index.name = None
+        splitDict = df.to_dict("split")
+        splitDict.update(self.extrasFor(symbol))
+        # Frames of the store are always in the canonical shape
+        splitDict[PKStockDataSchema.NORMALIZED_KEY] = PKStockDataSchema.SCHEMA_VERSION
+        return splitDict
+
+    def frameFromSplitDict(splitDict):
+        if isinstance(splitDict, pd.DataFrame):
+            return splitDict
+        if not isinstance(splitDict, dict) or "data" not in splitDict.keys():
+            return None
+        columns = list(splitDict.get("columns") or [])
+        df = pd.DataFrame(splitDict["data"], index=splitDict.get("index"))
+        while len(columns) < len(df.columns):
+            # Same repair as the screening code: more values than column names
+            columns.append(f"temp{len(df.columns) - len(columns)}")
+        df.columns = columns[: len(df.columns)]
+        return df
+
+    def copy(self):
+        return {symbol: self[symbol] for symbol in self}
+
+    def takeWrites(self):
+        # What got written into the overlay since the last call. The overlay is
+        # private to each (worker) process, so this is what has to be sent back.
+        writes = {symbol: self._overlay[symbol] for symbol in self._written if symbol in self._overlay}
+        self._written = set()
+        return writes
+
+    def __getitem__(self, symbol):
+        if symbol in self._overlay:
+            return self._overlay[symbol]
+        if symbol in self._removed or symbol not in self.symbols:
+            raise KeyError(symbol)
+        return self.splitDict(symbol)
+
+    def __setitem__(self, symbol, value):
+        self._removed.discard(symbol)
+        self._overlay[symbol] = value
+        self._written.add(symbol)
+
+    def __delitem__(self, symbol):
+        self._written.discard(symbol)
+        if symbol in self._overlay:
+            del self._overlay[symbol]
+            if symbol not in self.symbols:
+                return
+        elif symbol in self._removed or symbol not in self.symbols:
+            raise KeyError(symbol)
+        self._removed.add(symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self._overlay or (symbol in self.symbols and symbol not in self._removed)
+
+    def __iter__(self):
+        for symbol in self.symbols.keys():
+            if symbol not in self._removed:
+                yield symbol
+        for symbol in self._overlay.keys():
+            if symbol not in self.symbols:
+                yield symbol
+
+    def __len__(self):
+        return len(self.symbols) - len(self._removed) + len([symbol for symbol in self._overlay.keys() if symbol not in self.symbols])
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.copy(), memo)
+
+    def __reduce__(self):
+        # Worker processes (spawned on Windows) re-map the files instead of
+        # receiving a pickled copy of the whole universe.
+        return (PKColumnarStore._reopen, (self.storePath, self.mmapMode, self._overlay, self._removed))
+
+    def _reopen(storePath, mmapMode, overlay, removed):
+        store = PKColumnarStore(storePath, mmapMode=mmapMode)
+        store._overlay = overlay
+        store._removed = removed
+        return store
+
+    def jsonValue(value):
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, (pd.Timestamp, np.datetime64)):
+            return str(value)
+        if isinstance(value, float) and np.isnan(value):
+            return None
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return str(value)
+
+    def indexTimestamps(index):
+        if not isinstance(index, pd.DatetimeIndex):
+            try:
+                return "raw", None, np.asarray(index, dtype=np.int64)
+            except (TypeError, ValueError):
+                try:
+                    index = pd.DatetimeIndex(index)
+                except (TypeError, ValueError):
+                    index = pd.to_datetime(index, utc=True)
+        tz = str(index.tz) if index.tz is not None else None
+        return "datetime", tz, index.asi8
+
+    def pack(stockDict):
+        fields = []
+        fieldPositions = {}
+        layout = {}
+        sideColumns = {}
+        extras = {}
+        frames = []
+        totalRows = 0
+        isStore = isinstance(stockDict, PKColumnarStore)
+        for symbol in list(stockDict.keys()):
+            try:
+                if isStore:
+                    df = stockDict.frame(symbol)
+                    symbolExtras = stockDict.extrasFor(symbol)
+                else:
+                    value = PKStockDataSchema.normalizeSplitDict(stockDict.get(symbol))
+                    df = PKColumnarStore.frameFromSplitDict(value)
+                    symbolExtras = {key: extra for key, extra in value.items() if key not in PKColumnarStore.SPLIT_KEYS} if isinstance(value, dict) else {}
+                if df is None or len(df) == 0:
+                    continue
+                indexKind, tz, timestamps = PKColumnarStore.indexTimestamps(df.index)
+            except Exception as e:
+                default_logger().debug(f"{symbol}: {e}", exc_info=True)
+                continue
+            symbolFields = []
+            symbolSideColumns = {}
+            for position, column in enumerate(df.columns):
+                series = df.iloc[:, position]
+                if not pd.api.types.is_numeric_dtype(series):
+                    try:
+                        series = pd.to_numeric(series)
+                    except (TypeError, ValueError):
+                        symbolSideColumns[column] = {
+                            str(rowIndex): PKColumnarStore.jsonValue(sideValue)
+                            for rowIndex, sideValue in enumerate(series.values)
+                            if PKColumnarStore.jsonValue(sideValue) is not None
+                        }
+                        continue
+                if column not in fieldPositions:
+                    fieldPositions[column] = len(fields)
+                    fields.append(column)
+                symbolFields.append((fieldPositions[column], series.to_numpy(dtype=np.float64, na_value=np.nan)))
+            if len(symbolSideColumns) > 0:
+                sideColumns[symbol] = symbolSideColumns
+            if len(symbolExtras) > 0:
+                extras[symbol] = {key: PKColumnarStore.jsonValue(extra) for key, extra in symbolExtras.items()}
+            layout[symbol] = [totalRows, len(df), [fieldIndex for fieldIndex, _ in symbolFields], [str(column) for column in df.columns], indexKind, tz]
+            frames.append((totalRows, timestamps, symbolFields))
+            totalRows += len(df)
+        if totalRows == 0:
+            return None, None, None
+        allTimestamps = np.zeros(totalRows, dtype=np.int64)
+        for offset, timestamps, _ in frames:
+            allTimestamps[offset : offset + len(timestamps)] = timestamps
+        fieldArrays = [PKStockDataSchema.emptyField(field, totalRows) for field in fields]
+        for offset, _, symbolFields in frames:
+            for fieldIndex, values in symbolFields:
+                fieldArrays[fieldIndex][offset : offset + len(values)] = PKStockDataSchema.toStorage(fields[fieldIndex], values)
+        meta = {
+            "version": PKColumnarStore.STORE_VERSION,
+            "rows": totalRows,
+            "fields": [str(field) for field in fields],
+            "dtypes": [np.dtype(fieldArray.dtype).str for fieldArray in fieldArrays],
+            "layout": layout,
+            "sideColumns": sideColumns,
+            "extras": extras,
+        }
+        return meta, allTimestamps, fieldArrays
+
+    def write(stockDict, storePath, cacheFile=None, period=None, duration=None, journalSegments=None):
+        meta, timestamps, fieldArrays = PKColumnarStore.pack(stockDict)
+        if meta is None:
+            return None
+        meta.update({"cacheFile": cacheFile, "period": period, "duration": duration})
+        tmpStorePath = f"{storePath}.tmp"
+        shutil.rmtree(tmpStorePath, ignore_errors=True)
+        os.makedirs(tmpStorePath, exist_ok=True)
+        np.save(os.path.join(tmpStorePath, PKColumnarStore.TIMESTAMPS_FILE_NAME), timestamps)
+        for fieldIndex, fieldArray in enumerate(fieldArrays):
+            np.save(os.path.join(tmpStorePath, f"field_{fieldIndex}.npy"), fieldArray)
+        with open(os.path.join(tmpStorePath, PKColumnarStore.INDEX_FILE_NAME), "w") as f:
+            json.dump(meta, f)
+        # The old store is moved aside and only deleted once the new one is in
+        # place, so that there's always a complete store at storePath.
+        oldStorePath = f"{storePath}.old"
+        shutil.rmtree(oldStorePath, ignore_errors=True)
+        if os.path.exists(storePath):
+            try:
+                os.replace(storePath, oldStorePath)
+            except OSError as e:
+                # Windows doesn't let go of a store that's still mapped. The
+                # old store (and its journal) stays as it is until next time.
+                default_logger().debug(e, exc_info=True)
+                shutil.rmtree(tmpStorePath, ignore_errors=True)
+                return None
+        os.replace(tmpStorePath, storePath)
+        shutil.rmtree(oldStorePath, ignore_errors=True)
+        # The new arrays already contain everything from the journal
+        if journalSegments is None:
+            shutil.rmtree(PKColumnarStore.journalPathFor(storePath), ignore_errors=True)
+        else:
+            for segmentPath in journalSegments:
+                try:
+                    os.remove(segmentPath)
+                except FileNotFoundError:  # pragma: no cover
+                    pass
+        return storePath
+
+    def sameRows(df, otherDf):
+        if list(df.columns) != list(otherDf.columns) or len(df) != len(otherDf):
+            return False
+        try:
+            return np.allclose(df.to_numpy(dtype=np.float64), otherDf.to_numpy(dtype=np.float64), equal_nan=True)
+        except (TypeError, ValueError):
+            return df.reset_index(drop=True).equals(otherDf.reset_index(drop=True))
+
+    def journalEntry(mode, df, indexKind, tz, timestamps, extras):
+        return {
+            "mode": mode,
+            "indexKind": indexKind,
+            "tz": tz,
+            "index": [int(timestamp) for timestamp in timestamps],
+            "columns": [str(column) for column in df.columns],
+            "data": [[PKColumnarStore.jsonValue(value) for value in row] for row in df.itertuples(index=False)],
+            "extras": {key: PKColumnarStore.jsonValue(extra) for key, extra in extras.items()},
+        }
+
+    def journalEntries(stockDict, frameFor, extrasFor):
+        # Diffs stockDict against the previously saved frames (frameFor/extrasFor)
+        # and returns the journal entries for the symbols that changed.
+        entries = {}
+        for symbol in list(stockDict.keys()):
+            value = stockDict.get(symbol)
+            try:
+                df = PKColumnarStore.frameFromSplitDict(value)
+                if df is None or len(df) == 0:
+                    continue
+                indexKind, tz, timestamps = PKColumnarStore.indexTimestamps(df.index)
+            except Exception as e:
+                default_logger().debug(f"{symbol}: {e}", exc_info=True)
+                continue
+            extras = {key: extra for key, extra in value.items() if key not in PKColumnarStore.SPLIT_KEYS} if isinstance(value, dict) else {}
+            storedFrame = frameFor(symbol)
+            if storedFrame is None or len(storedFrame) == 0:
+                entries[symbol] = PKColumnarStore.journalEntry("replace", df, indexKind, tz, timestamps, extras)
+                continue
+            storedTimestamps = PKColumnarStore.indexTimestamps(storedFrame.index)[2]
+            start = int(np.searchsorted(timestamps, storedTimestamps[-1]))
+            # Anything older than the last stored candle must be unchanged for
+            # an append. Otherwise (splits/bonus adjustments etc.) replace it all.
+            historyUnchanged = start == 0 or (len(storedTimestamps) > 1 and timestamps[start - 1] == storedTimestamps[-2]
+                                              and PKColumnarStore.sameRows(df.iloc[start - 1 : start], storedFrame.iloc[-2:-1]))
+            if not historyUnchanged:
+                entries[symbol] = PKColumnarStore.journalEntry("replace", df, indexKind, tz, timestamps, extras)
+                continue
+            newRows = df.iloc[start:]
+            if len(newRows) == 0 or (len(newRows) == 1 and timestamps[start] == storedTimestamps[-1]
+                                     and PKColumnarStore.sameRows(newRows, storedFrame.iloc[-1:])
+                                     and {key: PKColumnarStore.jsonValue(extra) for key, extra in extras.items()} == extrasFor(symbol)):
+                continue
+            entries[symbol] = PKColumnarStore.journalEntry("append", newRows, indexKind, tz, timestamps[start:], extras)
+        return entries
+
+    def appendJournal(stockDict, storePath, cacheFile=None, period=None, duration=None):
+        # Returns None when there's no matching store to append to, so that
+        # the caller falls back to a full save.
+        if not os.path.isfile(os.path.join(storePath, PKColumnarStore.INDEX_FILE_NAME)):
+            return None
+        try:
+            store = PKColumnarStore(storePath)
+        except Exception as e:  # pragma: no cover
+            default_logger().debug(e, exc_info=True)
+            return None
+        if store.meta.get("period") != period or store.meta.get("duration") != duration:
+            return None
+        entries = PKColumnarStore.journalEntries(stockDict, store.frame, store.extrasFor)
+        # An empty segment still moves the store over to the new cache date
+        if len(entries) > 0 or (cacheFile is not None and store.cacheFile != cacheFile):
+            journalPath = PKColumnarStore.journalPathFor(storePath)
+            os.makedirs(journalPath, exist_ok=True)
+            segments = PKColumnarStore.journalSegmentsFor(storePath)
+            lastSegmentNumber = int(os.path.basename(segments[-1]).split("_")[1].split(".")[0]) if len(segments) > 0 else 0
+            segmentPath = os.path.join(journalPath, f"segment_{str(lastSegmentNumber + 1).zfill(6)}.json")
+            segment = {"cacheFile": cacheFile, "period": period, "duration": duration, "symbols": entries}
+            with open(f"{segmentPath}.tmp", "w") as f:
+                json.dump(segment, f)
+            os.replace(f"{segmentPath}.tmp", segmentPath)
+            default_logger().debug(f"Journaled {len(entries)} symbols into {segmentPath}")
+        if len(PKColumnarStore.journalSegmentsFor(storePath)) >= PKColumnarStore.MAX_JOURNAL_SEGMENTS:
+            # Not in a daemon thread: that would be killed halfway at exit
+            PKColumnarStore.compact(storePath)
+        return storePath
+
+    def compact(storePath):
+        if not PKColumnarStore.compactionLock.acquire(blocking=False):
+            return None
+        try:
+            store = PKColumnarStore(storePath)
+            if len(store.journalSegments) == 0:
+                return None
+            return PKColumnarStore.write(store, storePath,
+                                         cacheFile=store.cacheFile,
+                                         period=store.meta.get("period"),
+                                         duration=store.meta.get("duration"),
+                                         journalSegments=store.journalSegments)
+        except Exception as e:  # pragma: no cover
+            default_logger().debug(e, exc_info=True)
+        finally:
+            PKColumnarStore.compactionLock.release()
+        return None
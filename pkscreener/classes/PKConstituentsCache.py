@@ -0,0 +1,100 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import json
+import os
+import time
+
+from PKDevTools.classes import Archiver
+from PKDevTools.classes.log import default_logger
+
+# Snapshot of the index constituent lists, so that every run (cron jobs and
+# monitor loops in particular) does not have to go to NSE or NASDAQ for a
+# list that changes a few times a year.
+# A list is fetched again once it's older than ttlHours. If that fails, the
+# older snapshot is used anyway. Lists with fewer than MIN_CONSTITUENTS
+# symbols are never saved because the fetchers return those on failures.
+class PKConstituentsCache:
+    FILE_NAME = "index_constituents.json"
+    CACHE_VERSION = 1
+    TTL_HOURS = 24
+    MIN_CONSTITUENTS = 10
+
+    def __init__(self, filePath=None, ttlHours=TTL_HOURS):
+        self.filePath = os.path.join(Archiver.get_user_outputs_dir(), PKConstituentsCache.FILE_NAME) if filePath is None else filePath
+        self.ttlHours = ttlHours
+        self.indices = self.load()
+
+    def load(self):
+        try:
+            with open(self.filePath, "r") as f:
+                cache = json.load(f)
+            if cache.get("version") == PKConstituentsCache.CACHE_VERSION:
+                return cache.get("indices", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return {}
+
+    def save(self):
+        try:
+            tmpFilePath = f"{self.filePath}.tmp"
+            with open(tmpFilePath, "w") as f:
+                json.dump({"version": PKConstituentsCache.CACHE_VERSION, "indices": self.indices}, f)
+            os.replace(tmpFilePath, self.filePath)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+
+    def get(self, key, allowStale=False, now=None):
+        # A copy of the saved list or None if there's none (or it's stale)
+        entry = self.indices.get(str(key))
+        now = time.time() if now is None else now
+        if entry is None or (not allowStale and now - entry["fetchedOn"] > self.ttlHours * 3600):
+            return None
+        return list(entry["symbols"])
+
+    def put(self, key, symbols, now=None):
+        if symbols is None or len(symbols) < PKConstituentsCache.MIN_CONSTITUENTS:
+            return False
+        self.indices[str(key)] = {"symbols": list(symbols), "fetchedOn": time.time() if now is None else now}
+        self.save()
+        return True
+
+    def fetch(self, key, fetchFn):
+        # The saved list if it's fresh, else whatever fetchFn returns (or the stale list if that fails)
+        symbols = self.get(key)
+        if symbols is not None:
+            default_logger().debug(f"Using {len(symbols)} saved constituents for {key}")
+            return symbols
+        try:
+            symbols = fetchFn()
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+            symbols = None
+        if not self.put(key, symbols):
+            staleSymbols = self.get(key, allowStale=True)
+            if staleSymbols is not None:
+                return staleSymbols
+        return symbols
@@ -0,0 +1,111 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import json
+import os
+
+from PKDevTools.classes import Archiver
+from PKDevTools.classes.log import default_logger
+
+from pkscreener.classes.PKTaskBatch import PKScanContext
+
+# How long (in seconds) each stock took to screen for each execute option,
+# as a moving average over the earlier scans. Scans queue the stocks that
+# are expected to take the longest first, so that they don't land at the
+# end of the queue with one worker grinding through them while the rest
+# of the workers have nothing left to do.
+class PKCostModel:
+    FILE_NAME = "scan_costs.json"
+    MODEL_VERSION = 1
+    # Weight of the latest scan in the moving average
+    SMOOTHING = 0.3
+    EXECUTE_OPTION_INDEX = 2
+
+    def __init__(self, filePath=None):
+        self.filePath = os.path.join(Archiver.get_user_outputs_dir(), PKCostModel.FILE_NAME) if filePath is None else filePath
+        self.costs = self.load()
+        self.changed = False
+
+    def load(self):
+        try:
+            with open(self.filePath, "r") as f:
+                model = json.load(f)
+            if model.get("version") == PKCostModel.MODEL_VERSION:
+                return model.get("costs", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return {}
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            tmpFilePath = f"{self.filePath}.tmp"
+            with open(tmpFilePath, "w") as f:
+                json.dump({"version": PKCostModel.MODEL_VERSION, "costs": self.costs}, f)
+            os.replace(tmpFilePath, self.filePath)
+            self.changed = False
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+
+    def costFor(self, stock, executeOption, default=None):
+        return self.costs.get(str(executeOption), {}).get(stock, default)
+
+    def record(self, stock, executeOption, seconds):
+        if stock is None or seconds is None or seconds < 0:
+            return
+        optionCosts = self.costs.setdefault(str(executeOption), {})
+        previous = optionCosts.get(stock)
+        optionCosts[stock] = round(seconds if previous is None else (PKCostModel.SMOOTHING * seconds + (1 - PKCostModel.SMOOTHING) * previous), 4)
+        self.changed = True
+
+    def recordResults(self, answer):
+        # Timings that came along with a worker's answer (PKBatchResults)
+        stocks = getattr(answer, "stocks", None)
+        costs = getattr(answer, "costs", None)
+        if stocks is None or costs is None:
+            return
+        for stock, seconds in zip(stocks, costs):
+            self.record(stock, answer.executeOption, seconds)
+
+    def order(self, items):
+        # items with the most expensive stocks first. Stocks that have not
+        # been timed yet are expected to take as long as an average stock.
+        # Items of different scan contexts (backtest days) are not mixed up
+        # so that they still go to the workers in batches.
+        averages = {}
+        for executeOption in set(item[PKCostModel.EXECUTE_OPTION_INDEX] for item in items):
+            optionCosts = self.costs.get(str(executeOption), {})
+            averages[executeOption] = (sum(optionCosts.values()) / len(optionCosts)) if len(optionCosts) > 0 else None
+        if all(average is None for average in averages.values()):
+            return items
+        contextOrder = {}
+        def sortKey(item):
+            contextPosition = contextOrder.setdefault(PKScanContext.keyFor(item), len(contextOrder))
+            executeOption = item[PKCostModel.EXECUTE_OPTION_INDEX]
+            average = averages[executeOption]
+            return (contextPosition, -self.costFor(item[PKScanContext.STOCK_INDEX], executeOption, 0 if average is None else average))
+        return sorted(items, key=sortKey)
@@ -25,39 +25,103 @@
 """
 
 import json
-from pkscreener.classes.PKTask import PKTask
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+from PKDevTools.classes import Archiver
 from PKDevTools.classes.SuppressOutput import SuppressOutput
-from pkscreener.classes.PKScheduler import PKScheduler
 from PKDevTools.classes.log import default_logger
 
+# Symbol and sector/industry info of stocks. Every payload is a small JSON,
+# so they're fetched on a thread pool instead of a process per symbol.
+# What was fetched is cached in symbol_sector_info.json in the outputs
+# directory. Entries younger than CACHE_TTL_DAYS are used as they are. Older
+# ones are fetched again, and if that fails, the older info is used anyway.
+# The fetches show a progress bar and get as long as the process pool used
+# to. Whatever is not in by then is left out (and fetched on the next run).
 class PKDataService():
-    def getSymbolsAndSectorInfo(self,configManager,stockCodes=[]):
-        from PKNSETools.PKCompanyGeneral import download, initialize
-        stockDictList = []
-        tasksList = []
-        for symbol in stockCodes:
-            fn_args = (symbol)
-            task = PKTask(f"DataDownload-{symbol}",long_running_fn=download,long_running_fn_args=fn_args)
-            task.userData = symbol
-            tasksList.append(task)
-        
-        processedStocks = []
-        if len(tasksList) > 0:
-            # Suppress any multiprocessing errors/warnings
+    CACHE_FILE_NAME = "symbol_sector_info.json"
+    CACHE_VERSION = 1
+    CACHE_TTL_DAYS = 30
+    CONCURRENCY = 16
+
+    def __init__(self, cacheFilePath=None):
+        self.cacheFilePath = os.path.join(Archiver.get_user_outputs_dir(), PKDataService.CACHE_FILE_NAME) if cacheFilePath is None else cacheFilePath
+
+    def loadCache(self):
+        try:
+            with open(self.cacheFilePath, "r") as f:
+                cache = json.load(f)
+            if cache.get("version") == PKDataService.CACHE_VERSION:
+                return cache.get("symbols", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return {}
+
+    def saveCache(self, symbols):
+        try:
+            tmpFilePath = f"{self.cacheFilePath}.tmp"
+            with open(tmpFilePath, "w") as f:
+                json.dump({"version": PKDataService.CACHE_VERSION, "symbols": symbols}, f)
+            os.replace(tmpFilePath, self.cacheFilePath)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+
+    def fetchSymbolInfo(self, symbol):
+        # The "info" dict of the symbol or None
+        from PKNSETools.PKCompanyGeneral import download
+        try:
+            result = json.loads(download(symbol))
+            if result is not None and isinstance(result,dict) and "info" in result.keys():
+                return result.get("info")
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return None
+
+    def getSymbolsAndSectorInfo(self,configManager,stockCodes=[],maxAgeDays=CACHE_TTL_DAYS,concurrency=CONCURRENCY,timeout=None):
+        from PKNSETools.PKCompanyGeneral import initialize
+        from rich.console import Console
+        from rich.progress import Progress, BarColumn, TimeRemainingColumn, TimeElapsedColumn
+        symbols = self.loadCache()
+        now = time.time()
+        staleStocks = [symbol for symbol in dict.fromkeys(stockCodes) if now - symbols.get(symbol, {}).get("fetchedOn", 0) > maxAgeDays * 86400]
+        if len(staleStocks) > 0:
+            # 5 seconds additional time for getting the cookies set-up
+            timeout = (5+2.5*configManager.longTimeout*4) if timeout is None else timeout
+            deadline = time.time() + timeout
+            # The progress goes to the console even though everything else is suppressed
+            console = Console(file=sys.stdout)
+            # Suppress any errors/warnings
             with SuppressOutput(suppress_stderr=True, suppress_stdout=True):
                 initialize() # Let's get the cookies set-up right
-                PKScheduler.scheduleTasks(tasksList=tasksList,
-                                        label=f"Downloading latest symbol/sector info. (Total={len(stockCodes)} records in {len(tasksList)} batches){'Be Patient!' if len(stockCodes)> 2000 else ''}",
-                                        timeout=(5+2.5*configManager.longTimeout*4), # 5 seconds additional time for getting multiprocessing ready
-                                        minAcceptableCompletionPercentage=100,
-                                        submitTaskAsArgs=True,
-                                        showProgressBars=True)
-            for task in tasksList:
-                if task.result is not None:
-                    taskResult = json.loads(task.result)
-                    if taskResult is not None and isinstance(taskResult,dict) and "info" in taskResult.keys():
-                        stockDictList.append(taskResult.get("info"))
-                        processedStocks.append(task.userData)
+                executor = ThreadPoolExecutor(max_workers=max(1, int(concurrency)))
+                futures = {executor.submit(self.fetchSymbolInfo, symbol): symbol for symbol in staleStocks}
+                try:
+                    with Progress("[progress.description]{task.description}",
+                                  BarColumn(),
+                                  "[progress.percentage]{task.percentage:>3.0f}%",
+                                  TimeRemainingColumn(),
+                                  TimeElapsedColumn(),
+                                  console=console,
+                                  transient=True) as progress:
+                        progressTask = progress.add_task(f"[green]Downloading latest symbol/sector info. (Total={len(staleStocks)} records){' Be Patient!' if len(staleStocks)> 2000 else ''}", total=len(staleStocks))
+                        for future in as_completed(futures, timeout=max(0, deadline - time.time())):
+                            info = future.result()
+                            if info is not None:
+                                symbols[futures[future]] = {"info": info, "fetchedOn": now}
+                            progress.advance(progressTask)
+                except TimeoutError:
+                    default_logger().debug(f"Symbol/sector info of {len([future for future in futures if not future.done()])} stocks did not come in within {timeout} seconds")
+                finally:
+                    # Don't wait for the ones still in flight
+                    executor.shutdown(wait=False, cancel_futures=True)
+            self.saveCache(symbols)
+        stockDictList = [symbols[symbol]["info"] for symbol in stockCodes if symbol in symbols.keys()]
+        processedStocks = [symbol for symbol in stockCodes if symbol in symbols.keys()]
         leftOutStocks = list(set(stockCodes)-set(processedStocks))
-        default_logger().debug(f"Attempted fresh download of {len(stockCodes)} stocks and downloaded {len(processedStocks)} stocks. {len(leftOutStocks)} stocks remaining.")
+        default_logger().debug(f"Attempted fresh download of {len(staleStocks)} of {len(stockCodes)} stocks and got info for {len(processedStocks)} stocks. {len(leftOutStocks)} stocks remaining.")
         return stockDictList, leftOutStocks
@@ -0,0 +1,177 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import datetime
+import gzip
+import json
+import os
+import re
+
+from PKDevTools.classes.log import default_logger
+
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+from pkscreener.classes.PKStreamingCache import PKStreamingCache
+
+# Day-to-day deltas for the published daily stock data cache.
+# The publisher diffs the freshly downloaded data against the previously
+# published cache and writes only the new/corrected candles (plus full
+# histories of symbols that got adjusted) into a small gzipped json delta.
+# A manifest lists the recent deltas so that clients holding an older
+# cache can catch up without pulling the full cache again.
+class PKDeltaSync:
+    MANIFEST_FILE_NAME = "stock_data_delta_manifest.json"
+    MANIFEST_VERSION = 1
+    MAX_DELTAS_IN_MANIFEST = 10
+    CACHE_FILE_PATTERN = re.compile(r"^stock_data_(\d{6})\.pkl$")
+    serverBaseUrl = PKStreamingCache.serverBaseUrl
+
+    def cacheDate(cache_file):
+        matched = PKDeltaSync.CACHE_FILE_PATTERN.match(os.path.basename(str(cache_file)))
+        if matched is None:
+            return None
+        try:
+            return datetime.datetime.strptime(matched.group(1), "%d%m%y").date()
+        except ValueError:
+            return None
+
+    def deltaFileNameFor(cache_file):
+        return os.path.basename(cache_file).replace("stock_data_", "stock_data_delta_").replace(".pkl", ".json.gz")
+
+    def latestLocalCacheFile(cache_file, folder):
+        # The most recent daily cache in folder that's older than cache_file
+        targetDate = PKDeltaSync.cacheDate(cache_file)
+        if targetDate is None or not os.path.isdir(folder):
+            return None
+        candidates = []
+        for fileName in os.listdir(folder):
+            fileDate = PKDeltaSync.cacheDate(fileName)
+            if fileDate is not None and fileDate < targetDate:
+                candidates.append((fileDate, fileName))
+        return max(candidates)[1] if len(candidates) > 0 else None
+
+    def publish(stockDict, previousStockDict, previousCacheFile, cache_file, outputFolder, period, duration):
+        # Returns the paths of the delta and the manifest that got written
+        if previousStockDict is None or PKDeltaSync.cacheDate(previousCacheFile) is None or PKDeltaSync.cacheDate(cache_file) is None:
+            return []
+        def previousFrame(symbol):
+            return PKColumnarStore.frameFromSplitDict(previousStockDict.get(symbol))
+        def previousExtras(symbol):
+            previousData = previousStockDict.get(symbol)
+            if not isinstance(previousData, dict):
+                return {}
+            return {key: PKColumnarStore.jsonValue(extra) for key, extra in previousData.items() if key not in PKColumnarStore.SPLIT_KEYS}
+        entries = PKColumnarStore.journalEntries(stockDict.copy(), previousFrame, previousExtras)
+        deltaFileName = PKDeltaSync.deltaFileNameFor(cache_file)
+        deltaFilePath = os.path.join(outputFolder, deltaFileName)
+        delta = {"from": previousCacheFile, "cacheFile": cache_file, "period": period, "duration": duration, "symbols": entries}
+        with gzip.open(f"{deltaFilePath}.tmp", "wt", encoding="utf-8") as f:
+            json.dump(delta, f)
+        os.replace(f"{deltaFilePath}.tmp", deltaFilePath)
+        manifestPath = os.path.join(outputFolder, PKDeltaSync.MANIFEST_FILE_NAME)
+        manifest = {"version": PKDeltaSync.MANIFEST_VERSION, "deltas": []}
+        if os.path.exists(manifestPath):
+            try:
+                with open(manifestPath, "r") as f:
+                    manifest = json.load(f)
+            except Exception as e:  # pragma: no cover
+                default_logger().debug(e, exc_info=True)
+        deltas = [record for record in manifest.get("deltas", []) if record.get("to") != cache_file]
+        deltas.append({
+            "from": previousCacheFile,
+            "to": cache_file,
+            "file": deltaFileName,
+            "period": period,
+            "duration": duration,
+            "symbols": len(entries),
+            "bytes": os.stat(deltaFilePath).st_size,
+        })
+        deltas = sorted(deltas, key=lambda record: PKDeltaSync.cacheDate(record["to"]))
+        for staleRecord in deltas[: -PKDeltaSync.MAX_DELTAS_IN_MANIFEST]:
+            try:
+                os.remove(os.path.join(outputFolder, staleRecord["file"]))
+            except FileNotFoundError:
+                pass
+        manifest = {"version": PKDeltaSync.MANIFEST_VERSION, "deltas": deltas[-PKDeltaSync.MAX_DELTAS_IN_MANIFEST :]}
+        with open(manifestPath, "w") as f:
+            json.dump(manifest, f, indent=1)
+        return [deltaFilePath, manifestPath]
+
+    def deltaChain(manifest, fromCacheFile, toCacheFile, period, duration):
+        # The deltas to apply (in order) to go from fromCacheFile to toCacheFile
+        recordsByFrom = {}
+        for record in manifest.get("deltas", []):
+            if record.get("period") == period and record.get("duration") == duration:
+                recordsByFrom[record.get("from")] = record
+        chain = []
+        currentCacheFile = fromCacheFile
+        while currentCacheFile != toCacheFile:
+            record = recordsByFrom.get(currentCacheFile)
+            if record is None or len(chain) > PKDeltaSync.MAX_DELTAS_IN_MANIFEST:
+                return None
+            chain.append(record)
+            currentCacheFile = record.get("to")
+        return chain if len(chain) > 0 else None
+
+    def applyDelta(stockDict, delta):
+        for symbol, entry in delta.get("symbols", {}).items():
+            existingData = stockDict.get(symbol)
+            baseFrame = PKColumnarStore.frameFromSplitDict(existingData) if existingData is not None else None
+            df = PKColumnarStore.applyJournalEntry(baseFrame, entry)
+            df.index.name = None
+            extras = {key: extra for key, extra in existingData.items() if key not in PKColumnarStore.SPLIT_KEYS} if isinstance(existingData, dict) else {}
+            stockDict[symbol] = df.to_dict("split") | extras | entry.get("extras", {})
+        return len(delta.get("symbols", {}))
+
+    def fetchJson(fetcher, url, headers=None, compressed=False):
+        # stream=True skips the (hours long) response cache of the fetcher
+        resp = fetcher.fetchURL(url, headers=headers, stream=True)
+        if resp is None or resp.status_code != 200:
+            return None
+        content = gzip.decompress(resp.content) if compressed else resp.content
+        return json.loads(content.decode("utf-8"))
+
+    def sync(stockDict, fromCacheFile, toCacheFile, fetcher, period, duration, headers=None):
+        # Applies the published deltas since fromCacheFile to stockDict in place.
+        # Returns False (with stockDict possibly partially updated) when the
+        # deltas are not available, so that the caller does a full download.
+        try:
+            manifest = PKDeltaSync.fetchJson(fetcher, f"{PKDeltaSync.serverBaseUrl}{PKDeltaSync.MANIFEST_FILE_NAME}", headers=headers)
+            chain = PKDeltaSync.deltaChain(manifest or {}, fromCacheFile, toCacheFile, period, duration)
+            if chain is None:
+                return False
+            deltas = []
+            for record in chain:
+                delta = PKDeltaSync.fetchJson(fetcher, f"{PKDeltaSync.serverBaseUrl}{record['file']}", headers=headers, compressed=True)
+                if delta is None:
+                    return False
+                deltas.append(delta)
+            # Only touch stockDict once every delta has arrived
+            symbolsUpdated = 0
+            for delta in deltas:
+                symbolsUpdated += PKDeltaSync.applyDelta(stockDict, delta)
+            default_logger().debug(f"Applied {len(deltas)} deltas ({symbolsUpdated} symbol updates) from {fromCacheFile} to {toCacheFile}")
+            return True
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+            return False
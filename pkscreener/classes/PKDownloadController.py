@@ -0,0 +1,109 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import math
+import threading
+
+from PKDevTools.classes.log import default_logger
+
+# AIMD controller for the symbol downloads.
+# After every batch it gets the per-request latencies, payload sizes and
+# failures. Clean batches grow the number of requests in flight (and the
+# batch size along with it) additively. Batches that see throttling or
+# failures, requests that come close to timing out, or a throughput that
+# collapses in spite of more requests in flight, halve them.
+# The request timeout follows the observed latency (srtt + 4 * rttvar as in
+# TCP) instead of being a fixed multiple of the configured timeout.
+class PKDownloadController:
+    MAX_FAILURE_RATIO = 0.1
+    SLOW_REQUEST_RATIO = 0.8
+    THROUGHPUT_DROP_RATIO = 0.5
+    BATCHES_PER_CONCURRENCY = 4
+    MIN_TIMEOUT = 1
+    # Upper bound of the controller that sizes the PKScheduler download batches
+    # (when the async downloader is turned off)
+    SCHEDULER_CONCURRENCY = 8
+    sharedLock = threading.Lock()
+    shared = None
+
+    def __init__(self, maxConcurrency=32, timeout=4, minConcurrency=2, maxTimeout=30):
+        self.maxConcurrency = max(1, int(maxConcurrency))
+        self.minConcurrency = max(1, min(int(minConcurrency), self.maxConcurrency))
+        # Slow start at a quarter of the allowed concurrency
+        self.concurrency = max(self.minConcurrency, self.maxConcurrency // 4)
+        self.maxTimeout = max(maxTimeout, timeout)
+        self.timeout = timeout
+        self.srtt = None
+        self.rttvar = None
+        self.bestThroughput = 0
+        self.batches = 0
+
+    def sharedFor(maxConcurrency, timeout=4):
+        # One controller per process so that retries and later downloads start from what was learnt
+        with PKDownloadController.sharedLock:
+            controller = PKDownloadController.shared
+            if controller is None or controller.maxConcurrency != max(1, int(maxConcurrency)):
+                controller = PKDownloadController(maxConcurrency=maxConcurrency, timeout=timeout)
+                PKDownloadController.shared = controller
+            return controller
+
+    def batchSize(self):
+        return self.concurrency * PKDownloadController.BATCHES_PER_CONCURRENCY
+
+    def updateLatency(self, latency):
+        if self.srtt is None:
+            self.srtt = latency
+            self.rttvar = latency / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - latency)
+            self.srtt = 0.875 * self.srtt + 0.125 * latency
+        self.timeout = min(self.maxTimeout, max(PKDownloadController.MIN_TIMEOUT, self.srtt + 4 * self.rttvar))
+
+    def record(self, latencies, payloadBytes, failures, elapsed):
+        # latencies of the requests that completed, their total payload size, the failed request count
+        # and the wall clock time the batch took
+        requests = len(latencies) + failures
+        if requests == 0:
+            return
+        self.batches += 1
+        usedTimeout = self.timeout
+        for latency in latencies:
+            self.updateLatency(latency)
+        failureRatio = failures / requests
+        throughput = payloadBytes / elapsed if elapsed > 0 else 0
+        slowRequests = len([latency for latency in latencies if latency >= PKDownloadController.SLOW_REQUEST_RATIO * usedTimeout])
+        congested = (failureRatio > PKDownloadController.MAX_FAILURE_RATIO or
+                     slowRequests > PKDownloadController.MAX_FAILURE_RATIO * requests or
+                     (requests >= self.concurrency and throughput < PKDownloadController.THROUGHPUT_DROP_RATIO * self.bestThroughput))
+        if congested:
+            self.concurrency = max(self.minConcurrency, math.ceil(self.concurrency / 2))
+            # Let the throughput be learnt again at the lower concurrency
+            self.bestThroughput = throughput
+        else:
+            self.concurrency = min(self.maxConcurrency, self.concurrency + 1)
+            self.bestThroughput = max(self.bestThroughput, throughput)
+        default_logger().debug(f"Download batch {self.batches}: {requests} requests, {failures} failed, {payloadBytes} bytes in {elapsed:.2f}s ({throughput/1024:.1f} KB/s). {'Backing off' if congested else 'Growing'} -> {self.describe()}")
+
+    def describe(self):
+        return f"concurrency={self.concurrency}, batchSize={self.batchSize()}, timeout={self.timeout:.2f}s, srtt={(self.srtt or 0):.2f}s"
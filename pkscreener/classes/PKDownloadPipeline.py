@@ -0,0 +1,113 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import queue
+import threading
+
+from PKDevTools.classes.log import default_logger
+from PKDevTools.classes.PKDateUtilities import PKDateUtilities
+
+from pkscreener.classes.PKAsyncDownloader import PKAsyncDownloader
+from pkscreener.classes.PKDownloadController import PKDownloadController
+from pkscreener.classes.PKRecordReplayTransport import PKRecordReplayTransport
+
+# Downloads the latest data on a background thread while the stocks get
+# screened. Every batch that the async downloader completes is handed over
+# (through readyQueue) as soon as it's in, so that the scan can queue those
+# stocks for the workers right away instead of waiting for the whole
+# download to finish.
+# The stocks that could not be downloaded come last. The workers fetch
+# those on their own as they always did for stocks missing from the cache.
+# Stocks that the retry queue holds back (open circuit) are not scanned.
+class PKDownloadPipeline:
+    def __init__(self, stockCodes, configManager, stockDict=None, exchangeSuffix=".NS", retryQueue=None):
+        self.stockCodes = list(dict.fromkeys(stockCodes))
+        self.configManager = configManager
+        self.stockDict = {} if stockDict is None else stockDict
+        self.exchangeSuffix = exchangeSuffix
+        self.retryQueue = retryQueue
+        self.readyQueue = queue.Queue()
+        self.downloadedStocks = set()
+        self.leftOutStocks = []
+        self.heldBackStocks = []
+        self.thread = None
+
+    def isApplicable(configManager, menuOption, downloadOnly=False, userPassedArgs=None):
+        # Only fresh scans during trading hours download everything before screening
+        if not configManager.pipelinedScan or configManager.asyncDownloadConcurrency <= 0:
+            return False
+        if menuOption not in ["X"] or downloadOnly or configManager.isIntradayConfig():
+            return False
+        if userPassedArgs is not None and (userPassedArgs.monitor is not None or userPassedArgs.backtestdaysago is not None or
+                                           "|" in str(userPassedArgs.options) or userPassedArgs.testbuild):
+            return False
+        return PKDateUtilities.isTradingTime() and (PKDateUtilities.wasTradedOn() or not PKDateUtilities.isTodayHoliday()[0])
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="PKDownloadPipeline", daemon=True)
+            self.thread.start()
+        return self
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+
+    def run(self):
+        stocks = self.stockCodes
+        try:
+            if self.retryQueue is not None:
+                stocks = self.retryQueue.admit(stocks, protectedStocks=[self.configManager.baseIndex])
+                self.heldBackStocks = [stock for stock in self.stockCodes if stock not in stocks]
+            controller = PKDownloadController.sharedFor(self.configManager.asyncDownloadConcurrency, timeout=self.configManager.longTimeout)
+            _, self.leftOutStocks = PKAsyncDownloader.download(stocks, self.configManager.period, self.configManager.duration,
+                                                               exchangeSuffix=self.exchangeSuffix,
+                                                               controller=controller,
+                                                               adapter=PKRecordReplayTransport.adapterFor(self.configManager, pool_maxsize=controller.maxConcurrency),
+                                                               onBatch=self.onBatch)
+            if self.retryQueue is not None:
+                self.retryQueue.record(list(set(stocks) - set(self.leftOutStocks)), self.leftOutStocks, str(PKDateUtilities.tradingDate()))
+                self.retryQueue.save()
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        finally:
+            # Whatever got admitted but did not come through is left to the workers
+            self.leftOutStocks = [stock for stock in stocks if stock not in self.downloadedStocks]
+            default_logger().debug(f"Pipelined download of {len(stocks)} stocks is done. {len(self.leftOutStocks)} stocks remaining, {len(self.heldBackStocks)} held back.")
+            self.readyQueue.put(self.leftOutStocks)
+            self.readyQueue.put(None)
+
+    def onBatch(self, batchData):
+        for stock, splitDict in batchData.items():
+            self.stockDict[stock] = splitDict
+            self.downloadedStocks.add(stock)
+        if len(batchData) > 0:
+            self.readyQueue.put(list(batchData.keys()))
+
+    def readyStocks(self, timeout=None):
+        # The next list of stocks that are ready to be screened, [] if none got ready in time, None when done
+        try:
+            return self.readyQueue.get(timeout=timeout)
+        except queue.Empty:
+            return []
@@ -0,0 +1,182 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import multiprocessing
+import queue
+import threading
+import time
+
+import pandas as pd
+from PKDevTools.classes.log import default_logger
+
+from pkscreener.classes.PKAsyncDownloader import PKAsyncDownloader
+
+# Parent side service for the stocks that are not in the cache. Instead of
+# every worker calling fetchStockData for its one stock, the workers send
+# their requests to the broker. It waits for a short window to collect the
+# requests from the other workers, downloads them together with one
+# multi-ticker yfinance request per (period, duration, exchange, start, end)
+# and sends each worker back its own stock's data. Stocks that are missing
+# from the multi-ticker result are fetched one by one, just like the workers
+# would have done.
+class PKFetchBroker:
+    MAX_BATCH_SIZE = 50
+
+    def __init__(self, fetcher, window=0.05, maxBatchSize=MAX_BATCH_SIZE):
+        self.fetcher = fetcher
+        self.window = window
+        self.maxBatchSize = max(1, int(maxBatchSize))
+        self.requestsQueue = multiprocessing.Queue()
+        self.replyQueues = []
+        self.thread = None
+        self.requests = 0
+        self.downloads = 0
+
+    def startFor(fetcher, configManager):
+        # Returns the started broker or None if it's disabled
+        if configManager.fetchBrokerWindow <= 0:
+            return None
+        broker = PKFetchBroker(fetcher, window=configManager.fetchBrokerWindow)
+        broker.start()
+        return broker
+
+    def clientFor(self, timeout=16):
+        replyQueue = multiprocessing.Queue()
+        self.replyQueues.append(replyQueue)
+        return PKFetchBrokerClient(self.requestsQueue, replyQueue, len(self.replyQueues) - 1, timeout=timeout)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="PKFetchBroker", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.requestsQueue.put(None)
+            self.thread.join(timeout=5)
+            self.thread = None
+        default_logger().debug(f"Fetch broker served {self.requests} requests with {self.downloads} downloads.")
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            request = self.requestsQueue.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = time.time() + self.window
+            while len(batch) < self.maxBatchSize:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requestsQueue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self.serve(batch)
+
+    def serve(self, batch):
+        # Each request is (clientId, requestId, stock, period, duration, exchangeSuffix, start, end)
+        groups = {}
+        for request in batch:
+            groups.setdefault(tuple(request[3:]), []).append(request)
+        for (period, duration, exchangeSuffix, start, end), requests in groups.items():
+            stocks = list(dict.fromkeys([request[2] for request in requests]))
+            frames = self.download(stocks, period, duration, exchangeSuffix, start, end)
+            self.requests += len(requests)
+            self.downloads += 1
+            for clientId, requestId, stock, *_ in requests:
+                try:
+                    self.replyQueues[clientId].put((requestId, frames.get(stock)))
+                except Exception as e:  # pragma: no cover
+                    default_logger().debug(e, exc_info=True)
+
+    def download(self, stocks, period, duration, exchangeSuffix, start, end):
+        proxyServer = self.fetcher.proxyServer
+        try:
+            data = self.fetcher.fetchStockData(stocks, period, duration, proxyServer, 0, 0, 0,
+                                               start=start, end=end, exchangeSuffix=exchangeSuffix)
+            frames = PKFetchBroker.splitByTicker(data, stocks, exchangeSuffix)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+            frames = {}
+        for stock in [stock for stock in stocks if stock not in frames.keys()]:
+            try:
+                data = self.fetcher.fetchStockData(stock, period, duration, proxyServer, 0, 0, 0,
+                                                   start=start, end=end, exchangeSuffix=exchangeSuffix)
+                frames.update(PKFetchBroker.splitByTicker(data, [stock], exchangeSuffix))
+            except Exception as e:
+                default_logger().debug(e, exc_info=True)
+        return frames
+
+    def splitByTicker(data, stocks, exchangeSuffix=".NS"):
+        # {stock: frame} out of the multi-ticker frame (grouped by ticker) from yfinance
+        frames = {}
+        if data is None or len(data) == 0:
+            return frames
+        isMultiTicker = isinstance(data.columns, pd.MultiIndex)
+        tickers = set(data.columns.get_level_values(0)) if isMultiTicker else set()
+        for stock in stocks:
+            ticker = PKAsyncDownloader.tickerFor(stock, exchangeSuffix)
+            if isMultiTicker and ticker in tickers:
+                frame = data[ticker]
+            elif not isMultiTicker and len(stocks) == 1:
+                frame = data
+            else:
+                continue
+            frame = frame.dropna(how="all")
+            if len(frame) > 0:
+                frames[stock] = frame.copy()
+        return frames
+
+# Worker side of the broker. It travels to the worker process along with
+# the PKMultiProcessorClient.
+class PKFetchBrokerClient:
+    def __init__(self, requestsQueue, replyQueue, clientId, timeout=16):
+        self.requestsQueue = requestsQueue
+        self.replyQueue = replyQueue
+        self.clientId = clientId
+        self.timeout = timeout
+        self.requestId = 0
+
+    def fetch(self, stock, period, duration, exchangeSuffix=".NS", start=None, end=None):
+        # Returns the data (or None) for the stock. Raises TimeoutError if the broker did not respond in time.
+        self.requestId += 1
+        self.requestsQueue.put((self.clientId, self.requestId, stock, period, duration, exchangeSuffix, start, end))
+        deadline = time.time() + self.timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Fetch broker did not respond for {stock}")
+            try:
+                requestId, data = self.replyQueue.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError(f"Fetch broker did not respond for {stock}")
+            # Late replies for earlier requests that had timed out
+            if requestId == self.requestId:
+                return data
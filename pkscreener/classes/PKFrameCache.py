@@ -0,0 +1,89 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import multiprocessing
+from collections import OrderedDict
+
+# Bounded LRU of the DataFrames a worker has built out of the cached
+# "split" dicts (hostData) along with the column repairs and the "Date"
+# index normalisation. In monitor mode and piped scans, the same worker
+# otherwise rebuilds the same frames again on every cycle.
+# Each worker process holds its own LRU. The generation counter is shared
+# with the parent which bumps it whenever it swaps the stock dictionaries,
+# so that all workers drop their frames on their next lookup.
+class PKFrameCache:
+    def __init__(self, maxSize, generation=None):
+        self.maxSize = maxSize
+        self.generation = multiprocessing.Value("i", 0) if generation is None else generation
+        self.seenGeneration = self.generation.value
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # Frames stay with the process that built them
+        state = self.__dict__.copy()
+        state["frames"] = OrderedDict()
+        return state
+
+    def keyFor(symbol, hostData, duration):
+        try:
+            index = hostData["index"]
+            return (symbol, str(index[-1]) if len(index) > 0 else None, len(index), str(duration))
+        except (KeyError, TypeError):
+            return None
+
+    def invalidate(self):
+        with self.generation.get_lock():
+            self.generation.value += 1
+
+    def _checkGeneration(self):
+        generation = self.generation.value
+        if generation != self.seenGeneration:
+            self.frames.clear()
+            self.seenGeneration = generation
+
+    def get(self, key):
+        # Hands out a copy because the screeners modify the frames they get
+        if key is None or self.maxSize <= 0:
+            return None
+        self._checkGeneration()
+        frame = self.frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.frames.move_to_end(key)
+        self.hits += 1
+        return frame.copy()
+
+    def put(self, key, frame):
+        # Returns the copy that the caller should use from here on
+        if key is None or frame is None or self.maxSize <= 0:
+            return frame
+        self._checkGeneration()
+        self.frames[key] = frame
+        self.frames.move_to_end(key)
+        while len(self.frames) > self.maxSize:
+            self.frames.popitem(last=False)
+        return frame.copy()
@@ -0,0 +1,156 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PKDevTools.classes import Archiver
+from PKDevTools.classes.log import default_logger
+
+# Keyed store of the fundamentals (fair value and MF/FII ownership changes)
+# of every stock. A batch job (refresh) fetches them for the whole universe
+# with a bounded number of requests in flight and saves them into
+# NSEStockFairValueStore.pkl and NSEStockMFIStore.pkl in the outputs directory
+# (next to, but apart from, the NSEStock*DB.pkl caches of the service client).
+# Screening only looks them up (a dict lookup) and never has to go to the
+# network for them.
+# The download job refreshes them before the cache is built. End users'
+# scans refresh the stale ones on a background thread (refreshInBackground),
+# a few at a time and saving them as they come in, so the next runs find them
+# even if this one exits first.
+# Each entry is (value, epoch seconds when it was fetched).
+class PKFundamentalsStore:
+    STORE_VERSION = 1
+    FAIR_VALUE = "FairValue"
+    MFI = "MFI"
+    FILE_NAMES = {FAIR_VALUE: "StockFairValueStore.pkl", MFI: "StockMFIStore.pkl"}
+    EXCHANGE_PREFIXES = {"INDIA": "NSE"}
+    MAX_AGE_DAYS = 7
+    CONCURRENCY = 8
+    BACKGROUND_CONCURRENCY = 2
+    SAVE_EVERY = 25
+    sharedLock = threading.Lock()
+    shared = {}
+    backgroundRefresh = None
+
+    def __init__(self, filePath):
+        self.filePath = filePath
+        self.values = self.load()
+
+    def filePathFor(kind, exchangeName="INDIA", directory=None):
+        directory = Archiver.get_user_outputs_dir() if directory is None else directory
+        return os.path.join(directory, f"{PKFundamentalsStore.EXCHANGE_PREFIXES.get(exchangeName, exchangeName)}{PKFundamentalsStore.FILE_NAMES[kind]}")
+
+    def sharedFor(kind, exchangeName="INDIA"):
+        # One store per kind and exchange per process, loaded on first use
+        with PKFundamentalsStore.sharedLock:
+            store = PKFundamentalsStore.shared.get((kind, exchangeName))
+            if store is None:
+                store = PKFundamentalsStore(PKFundamentalsStore.filePathFor(kind, exchangeName))
+                PKFundamentalsStore.shared[(kind, exchangeName)] = store
+            return store
+
+    def load(self):
+        try:
+            with open(self.filePath, "rb") as f:
+                store = pickle.load(f)
+            if store.get("version") == PKFundamentalsStore.STORE_VERSION:
+                return store.get("values", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return {}
+
+    def save(self):
+        try:
+            tmpFilePath = f"{self.filePath}.tmp"
+            with open(tmpFilePath, "wb") as f:
+                pickle.dump({"version": PKFundamentalsStore.STORE_VERSION, "values": self.values}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpFilePath, self.filePath)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+
+    def get(self, stock):
+        # The saved value of the stock or None
+        entry = self.values.get(stock)
+        return None if entry is None else entry[0]
+
+    def put(self, stock, value, fetchedOn=None):
+        self.values[stock] = (value, time.time() if fetchedOn is None else fetchedOn)
+
+    def isStale(self, stock, maxAgeDays=MAX_AGE_DAYS, now=None):
+        entry = self.values.get(stock)
+        now = time.time() if now is None else now
+        return entry is None or now - entry[1] > maxAgeDays * 86400
+
+    def refreshStocks(self, stocks, fetchFn, concurrency=CONCURRENCY, maxAgeDays=MAX_AGE_DAYS, saveEvery=SAVE_EVERY):
+        # Fetches (with fetchFn) the stocks whose values are missing or stale. They're saved
+        # every saveEvery stocks and once more on the way out, so that whatever got fetched
+        # survives the process exiting half way through. Returns the number refreshed.
+        staleStocks = [stock for stock in dict.fromkeys(stocks) if self.isStale(stock, maxAgeDays)]
+        if len(staleStocks) == 0:
+            return 0
+        refreshed = 0
+        saved = 0
+        saveEvery = max(1, int(saveEvery))
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, int(concurrency))) as executor:
+                for start in range(0, len(staleStocks), saveEvery):
+                    batch = staleStocks[start:start + saveEvery]
+                    for stock, value in zip(batch, executor.map(fetchFn, batch)):
+                        if value is not None:
+                            self.put(stock, value)
+                            refreshed += 1
+                    if refreshed > saved:
+                        self.save()
+                        saved = refreshed
+        finally:
+            if refreshed > saved:
+                self.save()
+        default_logger().debug(f"Refreshed {refreshed} of {len(staleStocks)} stale entries in {self.filePath}")
+        return refreshed
+
+    def refresh(stocks, screener, exchangeName="INDIA", concurrency=CONCURRENCY, maxAgeDays=MAX_AGE_DAYS):
+        # Batch job for the whole universe. screener is a ScreeningStatistics that knows how to fetch them.
+        stocks = [stock for stock in stocks if not stock.startswith("^")]
+        fairValues = PKFundamentalsStore.sharedFor(PKFundamentalsStore.FAIR_VALUE, exchangeName)
+        mfiStatuses = PKFundamentalsStore.sharedFor(PKFundamentalsStore.MFI, exchangeName)
+        return (fairValues.refreshStocks(stocks, lambda stock: screener.getFreshFairValue(stock, exchangeName=exchangeName), concurrency, maxAgeDays),
+                mfiStatuses.refreshStocks(stocks, lambda stock: screener.getFreshMFIStatus(stock, exchangeName=exchangeName), concurrency, maxAgeDays))
+
+    def refreshInBackground(stocks, screener, exchangeName="INDIA", concurrency=BACKGROUND_CONCURRENCY, maxAgeDays=MAX_AGE_DAYS):
+        # Starts refresh on a daemon thread, once per process. Returns the thread.
+        with PKFundamentalsStore.sharedLock:
+            if PKFundamentalsStore.backgroundRefresh is not None:
+                return PKFundamentalsStore.backgroundRefresh
+            thread = threading.Thread(target=PKFundamentalsStore.refresh, args=(list(stocks), screener),
+                                      kwargs={"exchangeName": exchangeName, "concurrency": concurrency, "maxAgeDays": maxAgeDays},
+                                      name="PKFundamentalsStore", daemon=True)
+            PKFundamentalsStore.backgroundRefresh = thread
+        thread.start()
+        return thread
@@ -0,0 +1,264 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from PKDevTools.classes import Archiver
+from PKDevTools.classes.log import default_logger
+
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+
+# Intraday (1-minute) candles kept per symbol as contiguous numpy arrays
+# with a sorted int64 timestamp index, partitioned by trading session and
+# by BUCKET_MINUTES time buckets within the sessions.
+# A "candles up to hh:mm" query finds the bucket and then does a binary
+# search within it plus a slice, instead of building (and filtering) a
+# DataFrame per symbol.
+# The partitions are saved next to the intraday cache (STORE_NAME) and
+# mapped back from there as long as they're for the same cache file.
+class PKIntradayCandleStore:
+    DAY_NS = 86400 * 10**9
+    BUCKET_MINUTES = 15
+    BUCKET_NS = BUCKET_MINUTES * 60 * 10**9
+    STORE_NAME = "intraday_candles.pkis"
+    INDEX_FILE_NAME = "index.json"
+    STORE_VERSION = 1
+    ARRAY_NAMES = ["timestamps", "sessionStarts", "bucketStarts", "bucketKeys"]
+    # cacheFile -> PKIntradayCandleStore, for the repeated simulations of a run
+    loaded = {}
+
+    def __init__(self, stockDict):
+        # symbol -> (timestamps, {column: values}, tz, sessionStarts, bucketStarts, bucketKeys)
+        self.partitions = {}
+        self.cacheFile = None
+        if stockDict is None:
+            return
+        for symbol in list(stockDict.keys()):
+            try:
+                partition = PKIntradayCandleStore.partitionFor(stockDict, symbol)
+            except Exception as e:
+                default_logger().debug(f"{symbol}: {e}", exc_info=True)
+                continue
+            if partition is not None:
+                self.partitions[symbol] = partition
+
+    def __len__(self):
+        return len(self.partitions)
+
+    def __contains__(self, symbol):
+        return symbol in self.partitions
+
+    def partitionFor(stockDict, symbol):
+        if isinstance(stockDict, PKColumnarStore):
+            # Straight from the (mapped) store arrays, no pickled lists involved
+            df = stockDict.frame(symbol)
+            if df is None or len(df) == 0:
+                return None
+            index = df.index
+            columns = {column: df[column].to_numpy(dtype=np.float64) for column in df.columns if pd.api.types.is_numeric_dtype(df[column])}
+        else:
+            value = stockDict.get(symbol)
+            if not isinstance(value, dict) or len(value.get("data", [])) == 0:
+                return None
+            values = np.asarray(value["data"], dtype=np.float64)
+            index = value["index"]
+            columns = dict(zip(value["columns"], np.ascontiguousarray(values.T)))
+        timestamps, tz = PKIntradayCandleStore.timestampsFor(index)
+        if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind="stable")
+            timestamps = timestamps[order]
+            columns = {column: values[order] for column, values in columns.items()}
+        # A new session starts wherever the (exchange local) calendar day changes
+        localTimestamps = PKColumnarStore.indexFromTimestamps(timestamps, "datetime", tz).tz_localize(None).asi8 if tz is not None else timestamps
+        localDays = localTimestamps // PKIntradayCandleStore.DAY_NS
+        sessionStarts = np.concatenate(([0], np.flatnonzero(np.diff(localDays)) + 1))
+        # Buckets never straddle sessions because the days are whole buckets
+        buckets = timestamps // PKIntradayCandleStore.BUCKET_NS
+        bucketStarts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1)) if len(buckets) > 0 else np.zeros(0, dtype=np.int64)
+        return timestamps, columns, tz, sessionStarts, bucketStarts.astype(np.int64), buckets[bucketStarts].astype(np.int64)
+
+    def timestampsFor(index):
+        # int64 (UTC) nanoseconds and the time zone of the index
+        if not isinstance(index, pd.DatetimeIndex):
+            try:
+                # Much quicker than pd.DatetimeIndex() for a list of Timestamps
+                tz = index[0].tz
+                return np.fromiter((timestamp.value for timestamp in index), dtype=np.int64, count=len(index)), (str(tz) if tz is not None else None)
+            except (AttributeError, TypeError):
+                index = pd.DatetimeIndex(index)
+        _, tz, timestamps = PKColumnarStore.indexTimestamps(index)
+        return timestamps, tz
+
+    def window(self, symbol, end=None, maxCandles=None):
+        # Row range [start, stop) of the session holding the last candle at or
+        # before `end`, optionally limited to the first maxCandles of that session.
+        # Naive `end` values are compared as UTC, same as datetime64 comparisons.
+        partition = self.partitions.get(symbol)
+        if partition is None:
+            return 0, 0
+        timestamps, _, _, sessionStarts, bucketStarts, bucketKeys = partition
+        stop = len(timestamps) if end is None else PKIntradayCandleStore.stopFor(timestamps, bucketStarts, bucketKeys, pd.Timestamp(end).value)
+        if stop == 0:
+            return 0, 0
+        start = int(sessionStarts[np.searchsorted(sessionStarts, stop - 1, side="right") - 1])
+        if maxCandles is not None and maxCandles > 0:
+            stop = min(stop, start + maxCandles)
+        return start, stop
+
+    def stopFor(timestamps, bucketStarts, bucketKeys, endValue):
+        # Number of candles at or before endValue: the bucket of endValue first,
+        # then a binary search over the candles of that bucket only
+        bucket = int(np.searchsorted(bucketKeys, endValue // PKIntradayCandleStore.BUCKET_NS, side="right")) - 1
+        if bucket < 0:
+            return 0
+        first = int(bucketStarts[bucket])
+        last = int(bucketStarts[bucket + 1]) if bucket + 1 < len(bucketStarts) else len(timestamps)
+        return first + int(np.searchsorted(timestamps[first:last], endValue, side="right"))
+
+    def candles(self, symbol, end=None, maxCandles=None):
+        start, stop = self.window(symbol, end=end, maxCandles=maxCandles)
+        if stop <= start:
+            return None
+        timestamps, columns, tz = self.partitions[symbol][:3]
+        index = PKColumnarStore.indexFromTimestamps(timestamps[start:stop], "datetime", tz)
+        return pd.DataFrame({column: values[start:stop] for column, values in columns.items()}, index=index)
+
+    def firstValid(values):
+        valid = np.flatnonzero(~np.isnan(values))
+        return values[valid[0]] if len(valid) > 0 else np.nan
+
+    def combinedCandle(self, symbol, end=None, maxCandles=None):
+        # All the candles in the window combined into one OHLCV candle as a "split" dict
+        start, stop = self.window(symbol, end=end, maxCandles=maxCandles)
+        if stop <= start:
+            return None
+        timestamps, columns, tz = self.partitions[symbol][:3]
+        block = {column: values[start:stop] for column, values in columns.items()}
+        # Same as dropna(how="all")
+        rows = np.flatnonzero(~np.all(np.isnan(np.vstack(list(block.values()))), axis=0))
+        if len(rows) == 0:
+            return None
+        block = {column: values[rows] for column, values in block.items()}
+        highs = block["High"][~np.isnan(block["High"])]
+        lows = block["Low"][~np.isnan(block["Low"])]
+        combined = {"Open": PKIntradayCandleStore.firstValid(block["Open"]),
+                    "High": highs.max() if len(highs) > 0 else np.nan,
+                    "Low": lows.min() if len(lows) > 0 else np.nan,
+                    "Close": PKIntradayCandleStore.firstValid(block["Close"][::-1]),
+                    "Adj Close": block["Adj Close"][-1],
+                    "Volume": np.nansum(block["Volume"])}
+        lastTimestamp = pd.Timestamp(timestamps[start + rows[-1]])
+        if tz is not None:
+            lastTimestamp = lastTimestamp.tz_localize("UTC").tz_convert(tz).tz_localize(None)
+        return {"index": [lastTimestamp],
+                "columns": list(columns.keys()),
+                "data": [[float(combined.get(column, np.nan)) for column in columns.keys()]]}
+
+    def save(self, storePath, cacheFile=None):
+        # All the partitions as concatenated arrays, with their offsets in the index
+        symbols = {}
+        arrays = {name: [] for name in PKIntradayCandleStore.ARRAY_NAMES}
+        columnNames = []
+        columnArrays = {}
+        offsets = {name: 0 for name in PKIntradayCandleStore.ARRAY_NAMES}
+        rows = 0
+        for symbol, (timestamps, columns, tz, sessionStarts, bucketStarts, bucketKeys) in self.partitions.items():
+            entry = {"tz": tz, "columns": [], "rows": [rows, len(timestamps)]}
+            for name, values in zip(PKIntradayCandleStore.ARRAY_NAMES, [timestamps, sessionStarts, bucketStarts, bucketKeys]):
+                arrays[name].append(np.asarray(values, dtype=np.int64))
+                entry[name] = [offsets[name], len(values)]
+                offsets[name] += len(values)
+            for column, values in columns.items():
+                if column not in columnNames:
+                    columnNames.append(column)
+                    columnArrays[column] = []
+                entry["columns"].append(columnNames.index(column))
+                columnArrays[column].append((rows, np.asarray(values, dtype=np.float64)))
+            rows += len(timestamps)
+            symbols[symbol] = entry
+        tmpStorePath = f"{storePath}.tmp"
+        shutil.rmtree(tmpStorePath, ignore_errors=True)
+        os.makedirs(tmpStorePath, exist_ok=True)
+        for name, values in arrays.items():
+            np.save(os.path.join(tmpStorePath, f"{name}.npy"), np.concatenate(values) if len(values) > 0 else np.zeros(0, dtype=np.int64))
+        for columnIndex, column in enumerate(columnNames):
+            values = np.full(rows, np.nan)
+            for offset, columnValues in columnArrays[column]:
+                values[offset:offset + len(columnValues)] = columnValues
+            np.save(os.path.join(tmpStorePath, f"column_{columnIndex}.npy"), values)
+        with open(os.path.join(tmpStorePath, PKIntradayCandleStore.INDEX_FILE_NAME), "w") as f:
+            json.dump({"version": PKIntradayCandleStore.STORE_VERSION, "cacheFile": cacheFile, "columns": columnNames, "symbols": symbols}, f)
+        shutil.rmtree(storePath, ignore_errors=True)
+        os.replace(tmpStorePath, storePath)
+        self.cacheFile = cacheFile
+        return storePath
+
+    def load(storePath):
+        # The saved store with its arrays mapped read only, or None
+        try:
+            with open(os.path.join(storePath, PKIntradayCandleStore.INDEX_FILE_NAME), "r") as f:
+                meta = json.load(f)
+            if meta.get("version") != PKIntradayCandleStore.STORE_VERSION:
+                return None
+            arrays = {name: np.load(os.path.join(storePath, f"{name}.npy"), mmap_mode="r") for name in PKIntradayCandleStore.ARRAY_NAMES}
+            columnArrays = [np.load(os.path.join(storePath, f"column_{columnIndex}.npy"), mmap_mode="r") for columnIndex in range(len(meta["columns"]))]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+            return None
+        store = PKIntradayCandleStore(None)
+        store.cacheFile = meta.get("cacheFile")
+        for symbol, entry in meta["symbols"].items():
+            views = [arrays[name][entry[name][0]:entry[name][0] + entry[name][1]] for name in PKIntradayCandleStore.ARRAY_NAMES]
+            rowStart, rowCount = entry["rows"]
+            columns = {meta["columns"][columnIndex]: columnArrays[columnIndex][rowStart:rowStart + rowCount] for columnIndex in entry["columns"]}
+            store.partitions[symbol] = (views[0], columns, entry["tz"], views[1], views[2], views[3])
+        return store
+
+    def forCacheFile(cacheFile, stockDict, storePath=None):
+        # The store for the intraday cache file: from this run, from disk or
+        # built from stockDict (and saved) if it doesn't cover all its symbols
+        if cacheFile is None:
+            return PKIntradayCandleStore(stockDict)
+        cacheFile = os.path.basename(cacheFile)
+        symbols = set(stockDict.keys()) if stockDict is not None else set()
+        store = PKIntradayCandleStore.loaded.get(cacheFile)
+        storePath = os.path.join(Archiver.get_user_outputs_dir(), PKIntradayCandleStore.STORE_NAME) if storePath is None else storePath
+        if store is None:
+            store = PKIntradayCandleStore.load(storePath)
+            if store is not None and store.cacheFile != cacheFile:
+                store = None
+        if store is None or not symbols.issubset(store.partitions.keys()):
+            store = PKIntradayCandleStore(stockDict)
+            try:
+                store.save(storePath, cacheFile=cacheFile)
+            except Exception as e:  # pragma: no cover
+                default_logger().debug(e, exc_info=True)
+        PKIntradayCandleStore.loaded = {cacheFile: store}
+        return store
@@ -0,0 +1,138 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import pandas as pd
+from PKDevTools.classes.log import default_logger
+
+from pkscreener.classes.PKAsyncDownloader import PKAsyncDownloader
+from pkscreener.classes.PKDownloadController import PKDownloadController
+from pkscreener.classes.PKRecordReplayTransport import PKRecordReplayTransport
+from pkscreener.classes.PKStockDataSchema import PKStockDataSchema
+
+# Incremental refresh of the intraday data (stockDictSecondary) in monitor
+# mode. Instead of downloading the whole intraday period again on every
+# cycle, only the candles from the last cached candle onwards get requested
+# and merged into the cached "split" dicts.
+# The last cached candle is requested again because it was most likely
+# still forming (partial) when it got cached. The newer copy replaces it.
+# Candles older than the configured period are dropped after the merge, so
+# that the cache holds what a full download of the period would.
+# The candles are fetched with the async downloader (it can ask for the
+# candles since a point in time), which is used for this even when it's
+# turned off (asyncDownloadConcurrency = 0) for the other downloads.
+class PKIntradayTopUp:
+    # Naive intraday timestamps are in the local time of the exchange
+    EXCHANGE_TIMEZONES = {".NS": "Asia/Kolkata", ".BO": "Asia/Kolkata", "": "America/New_York"}
+    PERIOD_OFFSETS = {"mo": "months", "y": "years"}
+    # Requests in flight when asyncDownloadConcurrency does not say
+    CONCURRENCY = 8
+
+    def isApplicable(configManager):
+        return configManager.incrementalIntradayRefresh
+
+    def concurrencyFor(configManager):
+        return configManager.asyncDownloadConcurrency if configManager.asyncDownloadConcurrency > 0 else PKIntradayTopUp.CONCURRENCY
+
+    def sinceFor(splitDict, exchangeSuffix=".NS"):
+        # (epoch seconds, timezone) of the last candle. The timezone is None for naive timestamps.
+        try:
+            index = splitDict["index"]
+            if len(index) == 0:
+                return None
+            lastCandle = pd.Timestamp(index[-1])
+            if lastCandle.tzinfo is None:
+                return lastCandle.tz_localize(PKIntradayTopUp.EXCHANGE_TIMEZONES.get(exchangeSuffix, "Asia/Kolkata")).timestamp(), None
+            return lastCandle.timestamp(), str(lastCandle.tz)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+            return None
+
+    def merge(existing, newer):
+        # Replaces the cached candles from the first newer candle onwards with the newer candles
+        existing = PKStockDataSchema.normalizeSplitDict(existing)
+        if newer is None or len(newer["index"]) == 0:
+            return existing
+        index = list(existing["index"])
+        data = list(existing["data"])
+        firstNewCandle = pd.Timestamp(newer["index"][0])
+        cut = len(index)
+        while cut > 0 and pd.Timestamp(index[cut - 1]) >= firstNewCandle:
+            cut -= 1
+        positions = [newer["columns"].index(column) if column in newer["columns"] else None for column in existing["columns"]]
+        newerData = [[row[position] if position is not None else None for position in positions] for row in newer["data"]]
+        merged = {key: value for key, value in existing.items() if key not in ["index", "data"]}
+        merged["index"] = index[:cut] + list(newer["index"])
+        merged["data"] = data[:cut] + newerData
+        return merged
+
+    def trim(splitDict, period):
+        # Keeps the candles of the last period (e.g. the last 5 sessions for "5d"),
+        # counted back from the last candle. ytd/max and unknown periods are kept as they are.
+        index = splitDict["index"]
+        period = str(period)
+        if len(index) == 0 or not period[:1].isdigit():
+            return splitDict
+        count = int("".join([character for character in period if character.isdigit()]))
+        unit = period[len(str(count)):]
+        timestamps = [pd.Timestamp(candle) for candle in index]
+        if unit == "d":
+            sessions = sorted(set([timestamp.date() for timestamp in timestamps]))
+            if len(sessions) <= count:
+                return splitDict
+            firstSession = sessions[-count]
+            cut = next(position for position, timestamp in enumerate(timestamps) if timestamp.date() >= firstSession)
+        elif unit in PKIntradayTopUp.PERIOD_OFFSETS.keys():
+            cutoff = timestamps[-1] - pd.DateOffset(**{PKIntradayTopUp.PERIOD_OFFSETS[unit]: count})
+            cut = next(position for position, timestamp in enumerate(timestamps) if timestamp > cutoff)
+        else:
+            return splitDict
+        if cut == 0:
+            return splitDict
+        trimmed = {key: value for key, value in splitDict.items() if key not in ["index", "data"]}
+        trimmed["index"] = list(index[cut:])
+        trimmed["data"] = list(splitDict["data"][cut:])
+        return trimmed
+
+    def topUp(stockDict, stocks, configManager, exchangeSuffix=".NS"):
+        # Returns the stocks that could not be refreshed. Stocks without cached candles get the whole period.
+        since = {}
+        cachedData = {}
+        for stock in stocks:
+            splitDict = stockDict.get(stock)
+            stockSince = PKIntradayTopUp.sinceFor(splitDict, exchangeSuffix) if isinstance(splitDict, dict) else None
+            if stockSince is not None:
+                since[stock] = stockSince
+                cachedData[stock] = splitDict
+        controller = PKDownloadController.sharedFor(PKIntradayTopUp.concurrencyFor(configManager), timeout=configManager.longTimeout)
+        downloadedData, leftOutStocks = PKAsyncDownloader.download(stocks, configManager.period, configManager.duration,
+                                                                   exchangeSuffix=exchangeSuffix,
+                                                                   controller=controller,
+                                                                   adapter=PKRecordReplayTransport.adapterFor(configManager, pool_maxsize=controller.maxConcurrency),
+                                                                   since=since)
+        newCandles = 0
+        for stock, splitDict in downloadedData.items():
+            newCandles += len(splitDict["index"])
+            stockDict[stock] = PKIntradayTopUp.trim(PKIntradayTopUp.merge(cachedData[stock], splitDict), configManager.period) if stock in cachedData.keys() else splitDict
+        default_logger().debug(f"Topped up {len(downloadedData)} of {len(stocks)} stocks ({len(since)} incrementally) with {newCandles} candles.")
+        return leftOutStocks
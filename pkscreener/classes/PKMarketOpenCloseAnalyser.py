@@ -24,14 +24,14 @@
 
 """
 import copy
-import datetime
-import shutil
 import sys
 import os
 import numpy as np
 import pandas as pd
 import pkscreener.classes.Utility as Utility
 from pkscreener.classes.ConfigManager import parser, tools
+from pkscreener.classes.PKCacheManifest import PKCacheManifest
+from pkscreener.classes.PKIntradayCandleStore import PKIntradayCandleStore
 from pkscreener.classes.ScreeningStatistics import ScreeningStatistics
 from PKDevTools.classes.ColorText import colorText
 from PKDevTools.classes import Archiver
@@ -106,17 +106,10 @@ class PKMarketOpenCloseAnalyser:
     def ensureIntradayStockDataExists(listStockCodes=[]):
         # Ensure that the intraday_stock_data_<date>.pkl file exists
         exists, cache_file = Utility.tools.afterMarketStockDataExists(intraday=True)
-        copyFilePath = os.path.join(Archiver.get_user_outputs_dir(), f"copy_{cache_file}")
         srcFilePath = os.path.join(Archiver.get_user_outputs_dir(), cache_file)
-        srcFileSize = os.stat(srcFilePath).st_size if os.path.exists(srcFilePath) else 0
         stockDict = None
-        if exists and srcFileSize < 1024*1024*40:
-             # File less than 30MB ? Must have been corrupted
-            try:
-                os.remove(srcFilePath)
-                exists = False
-            except:
-                pass
+        # Corrupt files (as per the cache manifest) get replaced from the saved copy or removed
+        exists = PKCacheManifest.restore(srcFilePath)
         isTrading = PKDateUtilities.isTradingTime()
         if not exists or isTrading:
             savedPeriod = PKMarketOpenCloseAnalyser.configManager.period
@@ -126,14 +119,6 @@ class PKMarketOpenCloseAnalyser:
             PKMarketOpenCloseAnalyser.configManager.setConfig(parser, default=True, showFileCreatedText=False)
             OutputControls().printOutput(f"[+] {colorText.FAIL}{cache_file}{colorText.END} not found under {Archiver.get_user_outputs_dir()} !")
             OutputControls().printOutput(f"[+] {colorText.GREEN}Trying to download {cache_file}{colorText.END}. Please wait ...")
-            if os.path.exists(copyFilePath) and not isTrading:
-                copyFileSize = os.stat(copyFilePath).st_size if os.path.exists(copyFilePath) else 0
-                if copyFileSize >= 1024*1024*40:
-                    shutil.copy(copyFilePath,srcFilePath) # copy is the saved source of truth
-                    PKMarketOpenCloseAnalyser.configManager.period = savedPeriod
-                    PKMarketOpenCloseAnalyser.configManager.duration = savedDuration
-                    PKMarketOpenCloseAnalyser.configManager.setConfig(parser, default=True, showFileCreatedText=False)
-                    return True, cache_file, stockDict
             stockDict = Utility.tools.loadStockData(stockDict={},configManager=PKMarketOpenCloseAnalyser.configManager,downloadOnly=False,defaultAnswer='Y',retrial=False,forceLoad=False,stockCodes=listStockCodes,isIntraday=True)
             exists, cache_file = Utility.tools.afterMarketStockDataExists(intraday=True)
             PKMarketOpenCloseAnalyser.configManager.period = savedPeriod
@@ -143,29 +128,17 @@ class PKMarketOpenCloseAnalyser:
                 OutputControls().printOutput(f"[+] {colorText.FAIL}{cache_file}{colorText.END} not found under {Archiver.get_user_outputs_dir()}/ !")
                 OutputControls().printOutput(f"[+] Please run {colorText.FAIL}pkscreener{colorText.END}{colorText.GREEN} -a Y -e -d -i 1m{colorText.END} and then run this menu option again.")
                 input("Press any key to continue...")
-        try:
-            if os.path.exists(copyFilePath) and exists:
-                shutil.copy(copyFilePath,srcFilePath) # copy is the saved source of truth
-            if not os.path.exists(copyFilePath) and exists: # Let's make a copy of the original one
-                shutil.copy(srcFilePath,copyFilePath)
-        except:
-            pass
+        if exists: # Let's make a copy of the original one
+            PKCacheManifest.backup(srcFilePath)
         return exists, cache_file, stockDict
 
     def ensureDailyStockDataExists(listStockCodes=[]):
         # Ensure that the stock_data_<date>.pkl file exists
         exists, cache_file = Utility.tools.afterMarketStockDataExists(intraday=False)
-        copyFilePath = os.path.join(Archiver.get_user_outputs_dir(), f"copy_{cache_file}")
         srcFilePath = os.path.join(Archiver.get_user_outputs_dir(), cache_file)
-        srcFileSize = os.stat(srcFilePath).st_size if os.path.exists(srcFilePath) else 0
         stockDict = None
-        if exists and srcFileSize < 1024*1024*40:
-             # File less than 30MB ? Must have been corrupted
-            try:
-                os.remove(srcFilePath)
-                exists = False
-            except:
-                pass
+        # Corrupt files (as per the cache manifest) get replaced from the saved copy or removed
+        exists = PKCacheManifest.restore(srcFilePath)
         isTrading = PKDateUtilities.isTradingTime()
         if not exists or isTrading:
             savedPeriod = PKMarketOpenCloseAnalyser.configManager.period
@@ -177,14 +150,6 @@ class PKMarketOpenCloseAnalyser:
         # We should download a fresh copy anyways because we may have altered the existing copy in
         # the previous run. -- !!!! Not required if we saved at the end of last operation !!!!
             OutputControls().printOutput(f"[+] {colorText.GREEN}Trying to download {cache_file}{colorText.END}. Please wait ...")
-            if os.path.exists(copyFilePath) and not isTrading:
-                copyFileSize = os.stat(copyFilePath).st_size if os.path.exists(copyFilePath) else 0
-                if copyFileSize >= 1024*1024*40:
-                    shutil.copy(copyFilePath,srcFilePath) # copy is the saved source of truth
-                    PKMarketOpenCloseAnalyser.configManager.period = savedPeriod
-                    PKMarketOpenCloseAnalyser.configManager.duration = savedDuration
-                    PKMarketOpenCloseAnalyser.configManager.setConfig(parser, default=True, showFileCreatedText=False)
-                    return True, cache_file, stockDict
             stockDict = Utility.tools.loadStockData(stockDict={},configManager=PKMarketOpenCloseAnalyser.configManager,downloadOnly=False,defaultAnswer='Y',retrial=False,forceLoad=False,stockCodes=listStockCodes,isIntraday=False,forceRedownload=True)
             exists, cache_file = Utility.tools.afterMarketStockDataExists(intraday=False)
             PKMarketOpenCloseAnalyser.configManager.period = savedPeriod
@@ -194,13 +159,8 @@ class PKMarketOpenCloseAnalyser:
                 OutputControls().printOutput(f"[+] {colorText.FAIL}{cache_file}{colorText.END} not found under {Archiver.get_user_outputs_dir()}/ !")
                 OutputControls().printOutput(f"[+] Please run {colorText.FAIL}pkscreener{colorText.END}{colorText.GREEN} -a Y -e -d{colorText.END} and then run this menu option again.")
                 input("Press any key to continue...")
-        try:
-            if os.path.exists(copyFilePath) and exists:
-                shutil.copy(copyFilePath,srcFilePath) # copy is the saved source of truth
-            if not os.path.exists(copyFilePath) and exists: # Let's make a copy of the original one
-                shutil.copy(srcFilePath,copyFilePath)
-        except:
-            pass
+        if exists: # Let's make a copy of the original one
+            PKCacheManifest.backup(srcFilePath)
         return exists, cache_file, stockDict
     
     def simulateMorningTrade(updatedCandleData):
@@ -250,57 +210,24 @@ class PKMarketOpenCloseAnalyser:
         numOfCandles = PKMarketOpenCloseAnalyser.configManager.morninganalysiscandlenumber
         duration = PKMarketOpenCloseAnalyser.configManager.morninganalysiscandleduration
         numOfCandles = numOfCandles * int(duration.replace("m",""))
+        # Let's get the saved data from the DB. Then we need to only
+        # get those candles which are earlier than 9:57AM which is
+        # the time when the morning alerts collect data for generating alerts
+        # We'd then combine the data from 9:15 to 9:57 as a single candle of 
+        # OHLCV and replace the last daily candle with this one candle to
+        # simulate the scan outcome from morning.
+        candleStore = PKIntradayCandleStore.forCacheFile(int_cache_file, allDailyIntradayCandles)
+        alertCandleTimestamp = sliceWindowDatetime if sliceWindowDatetime is not None else f'{PKDateUtilities.tradingDate().strftime(f"%Y-%m-%d")} {MarketHours().openHour:02}:{MarketHours().openMinute+candle1MinuteNumberSinceMarketStarted}:00+05:30'
         for stock in stocks:
             try:
-                # Let's get the saved data from the DB. Then we need to only
-                # get those candles which are earlier than 9:57AM which is
-                # the time when the morning alerts collect data for generating alerts
-                # We'd then combine the data from 9:15 to 9:57 as a single candle of 
-                # OHLCV and replace the last daily candle with this one candle to
-                # simulate the scan outcome from morning.
-                df = pd.DataFrame(data=allDailyIntradayCandles[stock]["data"],
-                                columns=allDailyIntradayCandles[stock]["columns"],
-                                index=allDailyIntradayCandles[stock]["index"])
-                if sliceWindowDatetime is None:
-                    df = df.head(numOfCandles)
-                try:
-                    alertCandleTimestamp = sliceWindowDatetime if sliceWindowDatetime is not None else f'{PKDateUtilities.tradingDate().strftime(f"%Y-%m-%d")} {MarketHours().openHour:02}:{MarketHours().openMinute+candle1MinuteNumberSinceMarketStarted}:00+05:30'
-                    df = df[df.index <=  pd.to_datetime(alertCandleTimestamp).to_datetime64()]
-                except:
-                    alertCandleTimestamp = sliceWindowDatetime if sliceWindowDatetime is not None else f'{PKDateUtilities.tradingDate().strftime(f"%Y-%m-%d")} {MarketHours().openHour:02}:{MarketHours().openMinute+candle1MinuteNumberSinceMarketStarted}:00+05:30'
-                    df = df[df.index <=  pd.to_datetime(alertCandleTimestamp, utc=True)]
-                    pass
-                with pd.option_context('mode.chained_assignment', None):
-                    df.dropna(axis=0, how="all", inplace=True)
-                if df is not None and len(df) > 0:
-                    combinedCandle = {"Open":PKMarketOpenCloseAnalyser.getMorningOpen(df), "High":max(df["High"]), 
-                                    "Low":min(df["Low"]),"Close":PKMarketOpenCloseAnalyser.getMorningClose(df),
-                                    "Adj Close":df["Adj Close"][-1],"Volume":sum(df["Volume"])}
-                    tradingDate = df.index[-1] #PKDateUtilities.tradingDate()
-                    timestamp = datetime.datetime.strptime(tradingDate.strftime("%Y-%m-%d %H:%M:%S"),"%Y-%m-%d %H:%M:%S")
-                    df = pd.DataFrame([combinedCandle], columns=df.columns, index=[timestamp])
-                    morningIntradayCandle[stock] = df.to_dict("split")
+                combinedCandle = candleStore.combinedCandle(stock,end=alertCandleTimestamp,maxCandles=(numOfCandles if sliceWindowDatetime is None else None))
+                if combinedCandle is not None:
+                    morningIntradayCandle[stock] = combinedCandle
             except Exception as e:
                 OutputControls().printOutput(f"{stock}:    {e}")
                 continue
         return morningIntradayCandle
 
-    def getMorningOpen(df):
-        open = df["Open"][0]
-        index = 0
-        while np.isnan(open) and index < len(df):
-            open = df["Open"][index + 1]
-            index += 1
-        return open
-    
-    def getMorningClose(df):
-        close = df["Close"][-1]
-        index = len(df)
-        while np.isnan(close) and index >= 0:
-            close = df["Close"][index - 1]
-            index -= 1
-        return close
-    
     def combineDailyStockDataWithMorningSimulation(allDailyCandles,morningIntradayCandle):
         mutableAllDailyCandles = copy.deepcopy(allDailyCandles)
         stocks = list(mutableAllDailyCandles.keys())
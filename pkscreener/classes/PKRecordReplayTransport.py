@@ -0,0 +1,140 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import hashlib
+import os
+import pickle
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from PKDevTools.classes import Archiver
+from PKDevTools.classes.log import default_logger
+
+# Pluggable HTTP transport for the stock data downloads (yfinance and the
+# async downloader both accept a requests session).
+# In "record" mode, it goes to the network as usual and stores every
+# response, zlib compressed, in a file named after the hash of the request
+# (method, url without volatile parameters like the crumb, and body).
+# In "replay" mode, it never touches the network. Recorded responses are
+# served after a synthetic latency and everything else gets a 404. This
+# allows reproducible download+scan benchmarks on an air-gapped machine.
+class PKRecordReplayTransport(HTTPAdapter):
+    RECORD = "record"
+    REPLAY = "replay"
+    MODES = [RECORD, REPLAY]
+    DIRECTORY_NAME = "http_recordings"
+    FILE_EXTENSION = ".pkz"
+    VOLATILE_PARAMS = ["crumb", "_"]
+    COMPRESSION_LEVEL = 6
+    # The stored content is already decoded
+    DROPPED_HEADERS = ["content-encoding", "transfer-encoding", "content-length"]
+    __attrs__ = HTTPAdapter.__attrs__ + ["mode", "directory", "latency", "hits", "misses"]
+
+    def __init__(self, mode, directory=None, latency=0, **kwargs):
+        if mode not in PKRecordReplayTransport.MODES:
+            raise ValueError(f"Unknown transport mode: {mode}")
+        super().__init__(**kwargs)
+        self.mode = mode
+        self.directory = directory or os.path.join(Archiver.get_user_outputs_dir(), PKRecordReplayTransport.DIRECTORY_NAME)
+        self.latency = max(0, float(latency))
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def adapterFor(configManager, **kwargs):
+        # None unless the transport was configured
+        mode = str(getattr(configManager, "httpTransportMode", "")).strip().lower()
+        if mode not in PKRecordReplayTransport.MODES:
+            return None
+        return PKRecordReplayTransport(mode, latency=getattr(configManager, "httpTransportLatency", 0), **kwargs)
+
+    def sessionFor(configManager, **kwargs):
+        adapter = PKRecordReplayTransport.adapterFor(configManager, **kwargs)
+        if adapter is None:
+            return None
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def keyFor(request):
+        scheme, netloc, path, query, _ = urlsplit(request.url)
+        params = sorted([(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if key not in PKRecordReplayTransport.VOLATILE_PARAMS])
+        body = request.body or b""
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        digest = hashlib.sha256(f"{request.method} {urlunsplit((scheme, netloc.lower(), path, urlencode(params), ''))}\n".encode("utf-8"))
+        digest.update(body)
+        return digest.hexdigest()
+
+    def filePathFor(self, request):
+        return os.path.join(self.directory, f"{PKRecordReplayTransport.keyFor(request)}{PKRecordReplayTransport.FILE_EXTENSION}")
+
+    def store(self, request, response):
+        recording = {"url": request.url,
+                     "method": request.method,
+                     "status": response.status_code,
+                     "reason": response.reason,
+                     "headers": {key: value for key, value in response.headers.items() if key.lower() not in PKRecordReplayTransport.DROPPED_HEADERS},
+                     "content": response.content}
+        filePath = self.filePathFor(request)
+        tmpFilePath = f"{filePath}.{os.getpid()}.tmp"
+        with open(tmpFilePath, "wb") as f:
+            f.write(zlib.compress(pickle.dumps(recording, protocol=pickle.HIGHEST_PROTOCOL), PKRecordReplayTransport.COMPRESSION_LEVEL))
+        os.replace(tmpFilePath, filePath)
+
+    def responseFor(self, request, recording):
+        response = requests.Response()
+        response.status_code = recording["status"]
+        response.reason = recording.get("reason")
+        response.headers = CaseInsensitiveDict(recording.get("headers", {}))
+        response._content = recording["content"]
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def send(self, request, **kwargs):
+        if self.mode == PKRecordReplayTransport.RECORD:
+            response = super().send(request, **kwargs)
+            try:
+                self.store(request, response)
+            except Exception as e:
+                default_logger().debug(e, exc_info=True)
+            return response
+        if self.latency > 0:
+            time.sleep(self.latency)
+        try:
+            with open(self.filePathFor(request), "rb") as f:
+                recording = pickle.loads(zlib.decompress(f.read()))
+            self.hits += 1
+        except FileNotFoundError:
+            self.misses += 1
+            default_logger().debug(f"No recording for {request.method} {request.url}")
+            recording = {"status": 404, "reason": "Not Recorded", "headers": {}, "content": b""}
+        return self.responseFor(request, recording)
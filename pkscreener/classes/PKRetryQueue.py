@@ -0,0 +1,159 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import json
+import os
+import random
+import time
+
+from PKDevTools.classes.log import default_logger
+
+# Persistent retry schedule and circuit breaker for symbols that could not
+# be downloaded. It's stored next to the stock data cache so that it
+# survives between runs.
+# Every failure pushes the next attempt of a symbol out with exponential
+# backoff (and jitter, so that retries of many symbols don't come back in
+# one burst). A symbol that failed on circuitBreakerSessions consecutive
+# trading sessions gets its circuit opened and is no longer requested at
+# all until the cool down is over. After that it gets one probe: a success
+# clears its history and a failure opens the circuit again for twice as long.
+# When (nearly) a whole batch fails, it's the network or the data source
+# that's down and not the symbols, so those failures don't count. Retry
+# rounds only happen when more than RETRY_RATIO of a batch is left out,
+# same as the single retry there used to be.
+class PKRetryQueue:
+    FILE_NAME = "symbol_retry_queue.json"
+    QUEUE_VERSION = 1
+    BASE_DELAY = 1
+    MAX_DELAY = 60
+    COOL_DOWN_DAYS = 7
+    MAX_COOL_DOWN_DAYS = 56
+    RETRY_RATIO = 0.05
+    OUTAGE_RATIO = 0.9
+    MIN_OUTAGE_BATCH = 20
+
+    def __init__(self, filePath, exchangeSuffix=".NS", circuitBreakerSessions=3):
+        self.filePath = filePath
+        self.exchangeSuffix = exchangeSuffix
+        self.circuitBreakerSessions = max(1, int(circuitBreakerSessions))
+        self.symbols = self.load()
+
+    def filePathFor(cacheFilePath):
+        return os.path.join(os.path.dirname(os.path.abspath(cacheFilePath)), PKRetryQueue.FILE_NAME)
+
+    def load(self):
+        try:
+            with open(self.filePath, "r") as f:
+                queue = json.load(f)
+            if queue.get("version") == PKRetryQueue.QUEUE_VERSION:
+                return queue.get("symbols", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return {}
+
+    def save(self):
+        try:
+            tmpFilePath = f"{self.filePath}.tmp"
+            with open(tmpFilePath, "w") as f:
+                json.dump({"version": PKRetryQueue.QUEUE_VERSION, "symbols": self.symbols}, f, indent=1, sort_keys=True)
+            os.replace(tmpFilePath, self.filePath)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+
+    def keyFor(self, stock):
+        if len(self.exchangeSuffix) > 0 and not stock.endswith(self.exchangeSuffix) and not stock.startswith("^"):
+            return f"{stock}{self.exchangeSuffix}"
+        return stock
+
+    def backoff(failures):
+        # Equal jitter: at least half of the exponential delay
+        delay = min(PKRetryQueue.MAX_DELAY, PKRetryQueue.BASE_DELAY * (2 ** max(0, failures - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def isOpen(self, stock, now=None):
+        entry = self.symbols.get(self.keyFor(stock))
+        now = time.time() if now is None else now
+        return entry is not None and entry.get("openUntil", 0) > now
+
+    def admit(self, stocks, protectedStocks=[], now=None):
+        # Leaves out the symbols whose circuit is open
+        brokenStocks = [stock for stock in stocks if stock not in protectedStocks and self.isOpen(stock, now)]
+        if len(brokenStocks) > 0:
+            default_logger().debug(f"Skipping {len(brokenStocks)} symbols with an open circuit: {brokenStocks}")
+        return [stock for stock in stocks if stock not in brokenStocks]
+
+    def recordSuccess(self, stock):
+        self.symbols.pop(self.keyFor(stock), None)
+
+    def recordFailure(self, stock, sessionDate, now=None):
+        now = time.time() if now is None else now
+        entry = self.symbols.setdefault(self.keyFor(stock), {"failures": 0, "sessions": 0, "lastSession": None, "trips": 0, "openUntil": 0})
+        entry["failures"] += 1
+        if entry["lastSession"] != sessionDate:
+            entry["sessions"] += 1
+            entry["lastSession"] = sessionDate
+            # Every session starts with prompt retries again
+            entry["failures"] = 1
+        entry["lastFailure"] = now
+        entry["nextAttempt"] = now + PKRetryQueue.backoff(entry["failures"])
+        if entry["sessions"] >= self.circuitBreakerSessions and entry["openUntil"] <= now:
+            entry["trips"] += 1
+            coolDownDays = min(PKRetryQueue.MAX_COOL_DOWN_DAYS, PKRetryQueue.COOL_DOWN_DAYS * (2 ** (entry["trips"] - 1)))
+            entry["openUntil"] = now + coolDownDays * 86400
+            default_logger().debug(f"Opened the circuit for {stock} for {coolDownDays} days after {entry['sessions']} failed sessions")
+
+    def isOutage(succeededStocks, failedStocks):
+        attempted = len(succeededStocks) + len(failedStocks)
+        return attempted >= PKRetryQueue.MIN_OUTAGE_BATCH and len(failedStocks) >= attempted * PKRetryQueue.OUTAGE_RATIO
+
+    def needsRetry(attemptedStocks, failedStocks):
+        return len(failedStocks) > int(len(attemptedStocks) * PKRetryQueue.RETRY_RATIO)
+
+    def record(self, succeededStocks, failedStocks, sessionDate, now=None):
+        # Returns False if the failures were not held against the symbols
+        for stock in succeededStocks:
+            self.recordSuccess(stock)
+        if PKRetryQueue.isOutage(succeededStocks, failedStocks):
+            default_logger().debug(f"{len(failedStocks)} of {len(succeededStocks) + len(failedStocks)} symbols failed. Not counting those failures.")
+            return False
+        for stock in failedStocks:
+            self.recordFailure(stock, sessionDate, now)
+        return True
+
+    def due(self, stocks, maxWait=MAX_DELAY, now=None):
+        # Returns the stocks that can be retried within maxWait seconds and how long to wait for all of them
+        now = time.time() if now is None else now
+        dueStocks = []
+        wait = 0
+        for stock in stocks:
+            entry = self.symbols.get(self.keyFor(stock), {})
+            if entry.get("openUntil", 0) > now:
+                continue
+            nextAttempt = entry.get("nextAttempt", now)
+            if nextAttempt - now <= maxWait:
+                dueStocks.append(stock)
+                wait = max(wait, nextAttempt - now)
+        return dueStocks, wait
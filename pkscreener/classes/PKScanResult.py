@@ -0,0 +1,47 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+
+# A stock that met the scan criteria, as a worker reports it. Workers answer
+# with (screenDict, saveDict, data, stock, backtestDuration) tuples, or None
+# for stocks that didn't qualify.
+class PKScanResult:
+    def __init__(self, screenDict, saveDict, data, stock, backtestDuration=0):
+        self.screenDict = screenDict
+        self.saveDict = saveDict
+        self.data = data
+        self.stock = stock
+        self.backtestDuration = backtestDuration
+
+    def fromResult(result):
+        if result is None or len(result) < 5:
+            return None
+        return PKScanResult(*result[:5])
+
+    def asTuple(self):
+        # What processResults and the rest of the scan code work with
+        return (self.screenDict, self.saveDict, self.data, self.stock, self.backtestDuration)
+
+    def __repr__(self):
+        return f"PKScanResult(stock={self.stock}, backtestDuration={self.backtestDuration})"
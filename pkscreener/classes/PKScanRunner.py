@@ -22,11 +22,13 @@
     SOFTWARE.
 
 """
+import asyncio
 import os
 import sys
 import time
 import pandas as pd
 import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 from halo import Halo
 
@@ -41,6 +43,14 @@ from PKDevTools.classes.SuppressOutput import SuppressOutput
 from PKDevTools.classes.FunctionTimeouts import exit_after
 
 from pkscreener.classes.StockScreener import StockScreener
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+from pkscreener.classes.PKSharedStockDB import PKSharedStockDB
+from pkscreener.classes.PKFrameCache import PKFrameCache
+from pkscreener.classes.PKFetchBroker import PKFetchBroker
+from pkscreener.classes.PKWorkerPool import PKWorkerPool
+from pkscreener.classes.PKTaskBatch import PKTaskBatch
+from pkscreener.classes.PKScanResult import PKScanResult
+from pkscreener.classes.PKCostModel import PKCostModel
 from pkscreener.classes.CandlePatterns import CandlePatterns
 from pkscreener.classes.ConfigManager import parser, tools
 from PKDevTools.classes.OutputControls import OutputControls
@@ -58,6 +68,19 @@ class PKScanRunner:
     results_queue = None
     scr = None
     consumers = None
+    fetchBroker = None
+    downloadPipeline = None
+    # Position of the stock in the task items
+    STOCK_ITEM_INDEX = 12
+    # Parameters of the tasks ({key: PKScanContext}) and the ones the workers already have
+    scanContexts = None
+    workerContextIds = set()
+    # Workers (process ids) that answered with a context, until all of them have it
+    contextWorkers = {}
+    # Screening times of the stocks from the earlier scans (costAwareScheduling)
+    costModel = None
+    # The parent's stock database, where the data the workers fetched ends up
+    stockDictPrimary = None
 
     def initDataframes():
         screenResults = pd.DataFrame(
@@ -112,15 +135,73 @@ class PKScanRunner:
 
     def populateQueues(items, tasks_queue, exit=False,userPassedArgs=None):
         # default_logger().debug(f"Unfinished items in task_queue: {tasks_queue.qsize()}")
-        for item in items:
-            tasks_queue.put(item)
+        for batch in PKScanRunner.batchesFor(items):
+            tasks_queue.put((batch,))
         mayBePiped = userPassedArgs is not None and (userPassedArgs.monitor is not None or "|" in userPassedArgs.options)
-        if exit and not mayBePiped:
+        if exit and not mayBePiped and not PKWorkerPool.owns(PKScanRunner.consumers):
             # Append exit signal for each process indicated by None
             for _ in range(multiprocessing.cpu_count()):
                 tasks_queue.put(None)
 
 
+    def batchesFor(items):
+        if PKScanRunner.scanContexts is None:
+            PKScanRunner.scanContexts = {}
+        workers = None
+        if PKScanRunner.configManager.costAwareScheduling:
+            workers = len(PKScanRunner.consumers) if PKScanRunner.consumers else multiprocessing.cpu_count()
+        return PKTaskBatch.batchesFor(items, PKScanRunner.configManager.taskChunkSize, PKScanRunner.scanContexts, PKScanRunner.workerContextIds, workers=workers)
+
+    def scheduled(items):
+        # The stocks that took the longest in the earlier scans go first
+        if not PKScanRunner.configManager.costAwareScheduling:
+            return items
+        if PKScanRunner.costModel is None:
+            PKScanRunner.costModel = PKCostModel()
+        return PKScanRunner.costModel.order(items)
+
+    def recordCosts(answer):
+        if PKScanRunner.costModel is not None:
+            PKScanRunner.costModel.recordResults(answer)
+
+    def mergeFetchedData(answer):
+        # Workers attached to a (shared) columnar store keep what they fetch for
+        # the stocks missing from it in their own overlay. It comes back with
+        # their answer, so that it's saved along with the rest.
+        fetchedData = getattr(answer, "fetchedData", None)
+        if not fetchedData or PKScanRunner.stockDictPrimary is None:
+            return
+        for stock, splitDict in fetchedData.items():
+            PKScanRunner.stockDictPrimary[stock] = splitDict
+
+    def saveCosts():
+        if PKScanRunner.costModel is not None:
+            PKScanRunner.costModel.save()
+
+    def recordWorkerContext(answer):
+        # A worker that answered a batch has its context from then on. Once every
+        # worker has it (e.g. the consumers reused across monitor/piped scans),
+        # the batches stop carrying it.
+        contextId = getattr(answer, "contextId", None)
+        if contextId is None or contextId in PKScanRunner.workerContextIds or not PKScanRunner.consumers:
+            return
+        workers = PKScanRunner.contextWorkers.setdefault(contextId, set())
+        workers.add(answer.workerId)
+        if len(workers) >= len(PKScanRunner.consumers):
+            PKScanRunner.workerContextIds.add(contextId)
+            del PKScanRunner.contextWorkers[contextId]
+
+    def answered(answer):
+        # Bookkeeping for every answer of the workers. Returns its results.
+        PKScanRunner.recordCosts(answer)
+        PKScanRunner.mergeFetchedData(answer)
+        PKScanRunner.recordWorkerContext(answer)
+        return PKScanRunner.resultsIn(answer)
+
+    def resultsIn(answer):
+        # Workers answer a PKTaskBatch with the list of results for its stocks
+        return answer if isinstance(answer, list) else [answer]
+
     def getScanDurationParameters(testing, menuOption):
         # Number of days from past, including the backtest duration chosen by the user
         # that we will need to consider to evaluate the data. If the user choses 10-period
@@ -165,6 +246,8 @@ class PKScanRunner:
                             # assumption is that fetcher.fetchStockData would be
                             # mocked to avoid calling yf.download again and again
                             PKScanRunner.fetcher.fetchStockData() if testing else None,
+                            # pipelinedData, filled in by pipelinedResultsFor
+                            None,
                         )
                         for stock in listStockCodes
                     ]
@@ -247,6 +330,15 @@ class PKScanRunner:
         return choices
 
     def refreshDatabase(consumers,stockDictPrimary,stockDictSecondary):
+        if consumers is not None and len(consumers) > 0:
+            # Running workers re-attach to the re-published shared database on their own
+            stockDictPrimary = PKSharedStockDB.republish(consumers[0].objectDictionaryPrimary, stockDictPrimary)
+            stockDictSecondary = PKSharedStockDB.republish(consumers[0].objectDictionarySecondary, stockDictSecondary)
+            if isinstance(getattr(consumers[0], "frameCache", None), PKFrameCache):
+                # Frames built from the previous data are of no use anymore
+                consumers[0].frameCache.invalidate()
+            if PKWorkerPool.owns(consumers):
+                PKWorkerPool.warmPool.invalidateData()
         for worker in consumers:
             worker.objectDictionaryPrimary = stockDictPrimary
             worker.objectDictionarySecondary = stockDictSecondary
@@ -273,6 +365,7 @@ class PKScanRunner:
         PKScanRunner.tasks_queue = tasks_queue
         PKScanRunner.results_queue = results_queue
         PKScanRunner.consumers = consumers
+        PKScanRunner.stockDictPrimary = stockDictPrimary
         screenResults, saveResults, backtest_df = scanningCb(
                     menuOption,
                     items,
@@ -289,11 +382,17 @@ class PKScanRunner:
                 )
 
         OutputControls().printOutput(colorText.END)
+        PKScanRunner.saveCosts()
         if userPassedArgs is not None and (userPassedArgs.monitor is None and "|" not in userPassedArgs.options) and not userPassedArgs.options.upper().startswith("C"):
             # Don't terminate the multiprocessing clients if we're 
             # going to pipe the results from an earlier run
             # or we're running in monitoring mode
-            PKScanRunner.terminateAllWorkers(userPassedArgs,consumers, tasks_queue, testing)
+            if PKWorkerPool.owns(consumers):
+                # Warm workers stay up for the next scan
+                for worker in consumers:
+                    worker._clear()
+            else:
+                PKScanRunner.terminateAllWorkers(userPassedArgs,consumers, tasks_queue, testing)
         else:
             for worker in consumers:
                 worker.paused = True
@@ -303,20 +402,37 @@ class PKScanRunner:
     @exit_after(180) # Should not remain stuck starting the multiprocessing clients beyond this time
     @Halo(text='', spinner='dots')
     def prepareToRunScan(menuOption,keyboardInterruptEvent, screenCounter, screenResultsCounter, stockDictPrimary,stockDictSecondary, items, executeOption,userPassedArgs):
-        tasks_queue, results_queue, totalConsumers, logging_queue = PKScanRunner.initQueues(len(items),userPassedArgs)
         scr = ScreeningStatistics.ScreeningStatistics(PKScanRunner.configManager, default_logger())
+        if PKScanRunner.downloadPipeline is not None:
+            # The stocks come along with their data in the tasks while the download is still on
+            stockDictPrimary = {}
+        # Every worker gets the parameters of the scan once. The tasks only carry the stocks.
+        PKScanRunner.scanContexts = PKTaskBatch.contextsFor(items)
+        scanContexts = {context.contextId: context for context in PKScanRunner.scanContexts.values()}
+        PKScanRunner.workerContextIds = set(scanContexts.keys())
+        PKScanRunner.contextWorkers = {}
+        if PKWorkerPool.isApplicable(PKScanRunner.configManager, menuOption, userPassedArgs):
+            PKScanRunner.configManager.getConfig(parser)
+            workerPool = PKWorkerPool.warmPoolFor(keyboardInterruptEvent, PKScanRunner.fetcher, PKScanRunner.configManager, PKScanRunner.candlePatterns, PKScanRunner.startWorkers)
+            if workerPool.prepare(stockDictPrimary, stockDictSecondary, PKScanRunner.configManager, lambda: PKScanRunner.getRSScoreOfIndex(scr), scanContexts):
+                # The pool's log reader is already running
+                return workerPool.tasks_queue, workerPool.results_queue, workerPool.consumers, None
+            PKWorkerPool.shutdown()
+        tasks_queue, results_queue, totalConsumers, logging_queue = PKScanRunner.initQueues(len(items),userPassedArgs)
         exists, cache_file = Utility.tools.afterMarketStockDataExists(intraday=PKScanRunner.configManager.isIntradayConfig())
         sec_cache_file = cache_file if "intraday_" in cache_file else f"intraday_{cache_file}"
-        # Get RS rating stock value of the index
-        from pkscreener.classes.Fetcher import screenerStockDataFetcher
-        nsei_df = screenerStockDataFetcher().fetchStockData(PKScanRunner.configManager.baseIndex,PKScanRunner.configManager.period,PKScanRunner.configManager.duration,None,0,0,0,exchangeSuffix="")
-        rs_score_index = -1
-        PKScanRunner.configManager.getConfig(parser)
-        if nsei_df is not None:
-            rs_score_index = scr.calc_relative_strength(nsei_df[::-1])
+        rs_score_index = PKScanRunner.getRSScoreOfIndex(scr)
+        if isinstance(stockDictPrimary, PKColumnarStore):
+            # Workers inherit it and should only send back what they write themselves
+            stockDictPrimary.takeWrites()
+        if menuOption not in ["C"] and PKScanRunner.configManager.enableSharedStockDB and \
+            not (userPassedArgs is not None and userPassedArgs.download):
+            # Workers attach to one shared copy instead of each getting their own
+            stockDictPrimary = PKSharedStockDB.publish(stockDictPrimary)
+            stockDictSecondary = PKSharedStockDB.publish(stockDictSecondary)
         consumers = [
                     PKMultiProcessorClient(
-                        StockScreener().screenStocks,
+                        StockScreener().screenTasks,
                         tasks_queue,
                         results_queue,
                         logging_queue,
@@ -347,11 +463,30 @@ class PKScanRunner:
             intradayFetcher = Intra_Day("SBINEQN") # This will initialise the cookies etc.
         except:
             pass
+        # Every worker gets its own LRU, but they all share the generation counter
+        frameCache = PKFrameCache(PKScanRunner.configManager.frameCacheSize)
+        if PKScanRunner.fetchBroker is not None:
+            PKScanRunner.fetchBroker.stop()
+        # Stocks missing from the cache get fetched in batches by the parent
+        PKScanRunner.fetchBroker = PKFetchBroker.startFor(PKScanRunner.fetcher, PKScanRunner.configManager) if menuOption not in ["C"] else None
         for consumer in consumers:
             consumer.intradayNSEFetcher = intradayFetcher
+            consumer.frameCache = frameCache
+            consumer.scanContexts = scanContexts
+            consumer.fetchBroker = None if PKScanRunner.fetchBroker is None else PKScanRunner.fetchBroker.clientFor(timeout=PKScanRunner.configManager.longTimeout * 4)
         PKScanRunner.startWorkers(consumers)
         return tasks_queue,results_queue,consumers,logging_queue
 
+    def getRSScoreOfIndex(scr):
+        # Get RS rating stock value of the index
+        from pkscreener.classes.Fetcher import screenerStockDataFetcher
+        nsei_df = screenerStockDataFetcher().fetchStockData(PKScanRunner.configManager.baseIndex,PKScanRunner.configManager.period,PKScanRunner.configManager.duration,None,0,0,0,exchangeSuffix="")
+        rs_score_index = -1
+        PKScanRunner.configManager.getConfig(parser)
+        if nsei_df is not None:
+            rs_score_index = scr.calc_relative_strength(nsei_df[::-1])
+        return rs_score_index
+
     @exit_after(120) # Should not remain stuck starting the multiprocessing clients beyond this time
     @Halo(text='', spinner='dots')
     def startWorkers(consumers):
@@ -417,41 +552,24 @@ class PKScanRunner:
         PKScanRunner.results_queue = None
         PKScanRunner.scr = None
         PKScanRunner.consumers = None
+        if PKWorkerPool.owns(consumers):
+            PKWorkerPool.shutdown()
+        PKSharedStockDB.releaseAll()
+        if PKScanRunner.fetchBroker is not None:
+            PKScanRunner.fetchBroker.stop()
+            PKScanRunner.fetchBroker = None
 
     def shutdown(frame, signum):
         OutputControls().printOutput("Shutting down for test coverage")
 
     # @Halo(text='', spinner='dots')
     def runScan(userPassedArgs,testing,numStocks,iterations,items,numStocksPerIteration,tasks_queue,results_queue,originalNumberOfStocks,backtest_df, *otherArgs,resultsReceivedCb=None):
-        queueCounter = 0
         counter = 0
         shouldContinue = True
         lastNonNoneResult = None
-        while numStocks:
-            if counter == 0 and numStocks > 0:
-                if queueCounter < int(iterations):
-                    PKScanRunner.populateQueues(
-                        items[
-                            numStocksPerIteration
-                            * queueCounter : numStocksPerIteration
-                            * (queueCounter + 1)
-                        ],
-                        tasks_queue,
-                        (queueCounter + 1 == int(iterations)) and ((queueCounter + 1)*int(iterations) == originalNumberOfStocks),
-                        userPassedArgs
-                    )
-                else:
-                    PKScanRunner.populateQueues(
-                        items[
-                            numStocksPerIteration
-                            * queueCounter :
-                        ],
-                        tasks_queue,
-                        True,
-                        userPassedArgs
-                    )
+        results = PKScanRunner.resultsFor(userPassedArgs,numStocks,iterations,items,numStocksPerIteration,tasks_queue,results_queue,originalNumberOfStocks)
+        for result in results:
             numStocks -= 1
-            result = results_queue.get()
             if result is not None:
                 lastNonNoneResult = result
             
@@ -461,15 +579,151 @@ class PKScanRunner:
             # If it's being run under unit testing, let's wrap up if we find at least 1
             # stock or if we've already tried screening through 5% of the list.
             if (not shouldContinue) or (testing and counter >= int(numStocksPerIteration * 0.05)):
-                if PKScanRunner.consumers is not None:
-                    consumers = PKScanRunner.consumers
-                    for worker in consumers:
-                        worker.paused = True
-                        worker._clear()
+                # Closing the generator stops the workers
+                results.close()
                 break
-            # Add to the queue when we're through 75% of the previously added items already
-            if counter >= numStocksPerIteration: #int(numStocksPerIteration * 0.75):
-                queueCounter += 1
+            if counter >= numStocksPerIteration:
                 counter = 0
         
         return backtest_df, lastNonNoneResult
+
+    def resultsFor(userPassedArgs,numStocks,iterations,items,numStocksPerIteration,tasks_queue,results_queue,originalNumberOfStocks):
+        # Generator of the worker answers, one per stock (None for the stocks
+        # that didn't qualify), in the order in which the workers finish them.
+        # The items are queued as they're needed. Closing the generator before
+        # it's through pauses the workers and drops the rest of their tasks.
+        if PKScanRunner.downloadPipeline is not None:
+            yield from PKScanRunner.pipelinedResultsFor(userPassedArgs,numStocks,items,tasks_queue,results_queue)
+            return
+        items = PKScanRunner.scheduled(items)
+        queueCounter = 0
+        counter = 0
+        pendingResults = []
+        try:
+            while numStocks:
+                if counter == 0 and numStocks > 0:
+                    if queueCounter < int(iterations):
+                        PKScanRunner.populateQueues(
+                            items[
+                                numStocksPerIteration
+                                * queueCounter : numStocksPerIteration
+                                * (queueCounter + 1)
+                            ],
+                            tasks_queue,
+                            (queueCounter + 1 == int(iterations)) and ((queueCounter + 1)*int(iterations) == originalNumberOfStocks),
+                            userPassedArgs
+                        )
+                    else:
+                        PKScanRunner.populateQueues(
+                            items[
+                                numStocksPerIteration
+                                * queueCounter :
+                            ],
+                            tasks_queue,
+                            True,
+                            userPassedArgs
+                        )
+                numStocks -= 1
+                while len(pendingResults) == 0:
+                    answer = results_queue.get()
+                    pendingResults = PKScanRunner.answered(answer)
+                yield pendingResults.pop(0)
+                counter += 1
+                # Add to the queue when we're through 75% of the previously added items already
+                if counter >= numStocksPerIteration: #int(numStocksPerIteration * 0.75):
+                    queueCounter += 1
+                    counter = 0
+        except GeneratorExit:
+            PKScanRunner.pauseWorkers()
+            raise
+
+    def pipelinedResultsFor(userPassedArgs,numStocks,items,tasks_queue,results_queue):
+        # Stocks are queued (with their data) as their download batches complete,
+        # so that the screening overlaps with the rest of the download.
+        pipeline = PKScanRunner.downloadPipeline
+        itemsByStock = {}
+        for item in items:
+            itemsByStock.setdefault(item[PKScanRunner.STOCK_ITEM_INDEX], []).append(item)
+        queued = 0
+        received = 0
+        downloadDone = False
+        try:
+            while not downloadDone or received < queued:
+                # Don't wait for the download if there are results to be had
+                readyStocks = pipeline.readyStocks(timeout=(0 if received < queued else 1))
+                if readyStocks is None:
+                    downloadDone = True
+                    # Stocks with an open circuit are not scanned at all
+                    readyStocks = [stock for stock in itemsByStock.keys() if stock not in pipeline.heldBackStocks]
+                readyItems = []
+                for stock in readyStocks:
+                    splitDict = pipeline.stockDict.get(stock) if stock in pipeline.downloadedStocks else None
+                    for item in itemsByStock.pop(stock, []):
+                        readyItems.append(item[:-1] + (splitDict,))
+                queued += len(readyItems)
+                PKScanRunner.populateQueues(PKScanRunner.scheduled(readyItems), tasks_queue, downloadDone, userPassedArgs)
+                while received < queued:
+                    try:
+                        answer = results_queue.get(timeout=(None if downloadDone else 0.1))
+                    except Exception:
+                        break
+                    results = PKScanRunner.answered(answer)
+                    for result in results:
+                        received += 1
+                        yield result
+        except GeneratorExit:
+            PKScanRunner.pauseWorkers()
+            raise
+        finally:
+            PKScanRunner.downloadPipeline = None
+
+    def pauseWorkers():
+        if PKScanRunner.consumers is not None:
+            for worker in PKScanRunner.consumers:
+                worker.paused = True
+                worker._clear()
+
+    def streamResults(userPassedArgs,items,tasks_queue=None,results_queue=None,maxResults=None):
+        # Generator of a PKScanResult for each stock that meets the criteria,
+        # as soon as a worker has it, for callers (bot, monitor, embedding
+        # applications) that want to show the first results without waiting
+        # for the whole list of stocks. It stops, and stops the workers, once
+        # maxResults (maxdisplayresults by default) stocks have been found.
+        tasks_queue = PKScanRunner.tasks_queue if tasks_queue is None else tasks_queue
+        results_queue = PKScanRunner.results_queue if results_queue is None else results_queue
+        if maxResults is None:
+            maxResults = PKScanRunner.configManager.maxdisplayresults if (userPassedArgs is None or userPassedArgs.maxdisplayresults is None) else int(userPassedArgs.maxdisplayresults)
+        found = 0
+        results = PKScanRunner.resultsFor(userPassedArgs,len(items),1,items,len(items),tasks_queue,results_queue,len(items))
+        try:
+            for result in results:
+                scanResult = PKScanResult.fromResult(result)
+                if scanResult is None:
+                    continue
+                found += 1
+                yield scanResult
+                if maxResults is not None and found >= int(maxResults):
+                    break
+        finally:
+            results.close()
+            PKScanRunner.saveCosts()
+
+    async def streamResultsAsync(userPassedArgs,items,tasks_queue=None,results_queue=None,maxResults=None):
+        # Same as streamResults, for asyncio callers. The blocking waits for
+        # the workers happen on a thread of their own.
+        results = PKScanRunner.streamResults(userPassedArgs,items,tasks_queue,results_queue,maxResults)
+        loop = asyncio.get_running_loop()
+        # Only this one thread ever runs the generator. If the caller gets
+        # cancelled while next() still waits for the workers, the close queues
+        # up behind it (and pauses the workers) instead of failing with
+        # "generator already executing".
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PKScanRunner")
+        try:
+            while True:
+                scanResult = await loop.run_in_executor(executor, next, results, None)
+                if scanResult is None:
+                    break
+                yield scanResult
+        finally:
+            executor.submit(results.close)
+            executor.shutdown(wait=False)
@@ -65,8 +65,12 @@ if __name__ == '__main__':
 
 progressUpdater=None
 class PKScheduler():
+    def workerCount():
+        # One core is left for the main process
+        return max(1, multiprocessing.cpu_count() - 1)
+
     def scheduleTasks(tasksList=[], label:str=None, showProgressBars=False,submitTaskAsArgs=True, timeout=6, minAcceptableCompletionPercentage=100):
-        n_workers = multiprocessing.cpu_count() - 1  # set this to the number of cores you have on your machine
+        n_workers = PKScheduler.workerCount()  # set this to the number of cores you have on your machine
         global progressUpdater
         console = Console()
         with Progress(
@@ -0,0 +1,243 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+from PKDevTools.classes.log import default_logger
+
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+
+# Stock database that's published once by the parent process into a shared
+# memory segment and attached read-only by all the worker processes. Workers
+# no longer receive (and keep) their own copy of every candle.
+# The segment uses the same columnar layout as PKColumnarStore:
+# [header][index json][timestamps][field_0]...[field_n]
+# A tiny control block (segment name + version) is inherited by the workers
+# so that they re-attach on their own when the parent re-publishes the data.
+class PKSharedStockDB(PKColumnarStore):
+    MAGIC = 0x504B5344
+    HEADER_SIZE = 32
+    MAX_SEGMENT_NAME_LENGTH = 64
+    publishedSegments = {}
+
+    def __init__(self, controlName, controlVersion, isPublisher=False):
+        self.storePath = None
+        self.mmapMode = None
+        self._overlay = {}
+        self._removed = set()
+        self._written = set()
+        self.controlName = controlName
+        self.controlVersion = controlVersion
+        self.isPublisher = isPublisher
+        self.attachedVersion = 0
+        self._segment = None
+        self.attach({"version": PKColumnarStore.STORE_VERSION, "fields": [], "layout": {}}, np.zeros(0, dtype=np.int64), [])
+        self.ensureAttached()
+
+    @property
+    def segmentName(self):
+        return self.controlName.value.decode()
+
+    def publish(stockDict):
+        # A columnar store on disk is already shared through the OS page cache
+        if stockDict is None or isinstance(stockDict, PKColumnarStore) or len(stockDict) == 0:
+            return stockDict
+        sharedDB = PKSharedStockDB(multiprocessing.RawArray("c", PKSharedStockDB.MAX_SEGMENT_NAME_LENGTH),
+                                   multiprocessing.RawValue("i", 0),
+                                   isPublisher=True)
+        try:
+            if sharedDB.update(stockDict):
+                return sharedDB
+        except Exception as e:  # pragma: no cover
+            # Probably not enough shared memory (e.g. small /dev/shm in containers)
+            default_logger().debug(e, exc_info=True)
+        return stockDict
+
+    def republish(sharedDB, stockDict):
+        if isinstance(sharedDB, PKSharedStockDB) and sharedDB.isPublisher and stockDict is not None \
+            and stockDict is not sharedDB and not isinstance(stockDict, PKColumnarStore):
+            try:
+                if sharedDB.update(stockDict):
+                    return sharedDB
+            except Exception as e:  # pragma: no cover
+                default_logger().debug(e, exc_info=True)
+        return stockDict
+
+    def paddedLength(length):
+        return (length + 7) // 8 * 8
+
+    def arrayLayout(meta, rows, dataOffset):
+        # (dtype, offset) of the timestamps and each field array, and the total size
+        dtypes = [np.dtype(np.int64)] + [np.dtype(dtype) for dtype in meta.get("dtypes", [np.dtype(np.float64).str] * len(meta["fields"]))]
+        offsets = []
+        offset = dataOffset
+        for dtype in dtypes:
+            offsets.append(offset)
+            offset += PKSharedStockDB.paddedLength(dtype.itemsize * rows)
+        return list(zip(dtypes, offsets)), offset
+
+    def update(self, stockDict):
+        # Manager().dict() proxies are copied over in one go instead of per symbol
+        meta, timestamps, fieldArrays = PKColumnarStore.pack(stockDict.copy())
+        if meta is None:
+            return False
+        metaBytes = json.dumps(meta).encode("utf-8")
+        dataOffset = PKSharedStockDB.HEADER_SIZE + PKSharedStockDB.paddedLength(len(metaBytes))
+        rows = len(timestamps)
+        arrayLayout, size = PKSharedStockDB.arrayLayout(meta, rows, dataOffset)
+        segment = shared_memory.SharedMemory(name=f"pks_{os.getpid()}_{uuid.uuid4().hex[:8]}",
+                                             create=True,
+                                             size=size)
+        header = np.ndarray(4, dtype=np.int64, buffer=segment.buf)
+        header[:] = [PKSharedStockDB.MAGIC, len(metaBytes), rows, len(fieldArrays)]
+        del header
+        segment.buf[PKSharedStockDB.HEADER_SIZE : PKSharedStockDB.HEADER_SIZE + len(metaBytes)] = metaBytes
+        for (dtype, offset), values in zip(arrayLayout, [timestamps] + fieldArrays):
+            target = np.ndarray(rows, dtype=dtype, buffer=segment.buf, offset=offset)
+            target[:] = values
+            del target
+        previousSegmentName = self.segmentName
+        PKSharedStockDB.publishedSegments[segment.name] = segment
+        if len(PKSharedStockDB.publishedSegments) == 1:
+            atexit.register(PKSharedStockDB.releaseAll)
+        # Name first, version next. Workers look at the version to re-attach.
+        self.controlName.value = segment.name.encode()
+        self.controlVersion.value += 1
+        self.ensureAttached()
+        if len(previousSegmentName) > 0:
+            # Workers still attached to the old one keep their mapping until they re-attach
+            PKSharedStockDB.release(previousSegmentName)
+        default_logger().debug(f"Published {len(meta['layout'])} symbols into shared memory segment {segment.name}")
+        return True
+
+    def ensureAttached(self):
+        version = self.controlVersion.value
+        if version == self.attachedVersion or version == 0:
+            return
+        segmentName = self.segmentName
+        segment = PKSharedStockDB.publishedSegments.get(segmentName)
+        if segment is None:
+            segment = shared_memory.SharedMemory(name=segmentName)
+        header = np.ndarray(4, dtype=np.int64, buffer=segment.buf)
+        magic, metaLength, rows, numFields = [int(value) for value in header]
+        del header
+        if magic != PKSharedStockDB.MAGIC:
+            raise ValueError(f"Not a stock database segment:{segmentName}")
+        meta = json.loads(bytes(segment.buf[PKSharedStockDB.HEADER_SIZE : PKSharedStockDB.HEADER_SIZE + metaLength]).decode("utf-8"))
+        dataOffset = PKSharedStockDB.HEADER_SIZE + PKSharedStockDB.paddedLength(metaLength)
+        arrays = []
+        arrayLayout, _ = PKSharedStockDB.arrayLayout(meta, rows, dataOffset)
+        for dtype, offset in arrayLayout[: 1 + numFields]:
+            values = np.ndarray(rows, dtype=dtype, buffer=segment.buf, offset=offset)
+            values.flags.writeable = False
+            arrays.append(values)
+        previousSegment = self._segment
+        self.attach(meta, arrays[0], arrays[1:])
+        self._segment = segment
+        self.attachedVersion = version
+        if previousSegment is not None and not self.isPublisher:
+            try:
+                previousSegment.close()
+            except BufferError:  # pragma: no cover
+                # Frames handed out earlier still point into it
+                pass
+
+    def release(segmentName):
+        segment = PKSharedStockDB.publishedSegments.pop(segmentName, None)
+        if segment is None:
+            return
+        try:
+            segment.unlink()
+        except FileNotFoundError:  # pragma: no cover
+            pass
+        try:
+            segment.close()
+        except BufferError:
+            # Still referenced by frames/arrays in this process. The memory
+            # goes away once those are gone.
+            pass
+
+    def releaseAll():
+        for segmentName in list(PKSharedStockDB.publishedSegments.keys()):
+            PKSharedStockDB.release(segmentName)
+
+    def frame(self, symbol):
+        self.ensureAttached()
+        return super().frame(symbol)
+
+    def extrasFor(self, symbol):
+        self.ensureAttached()
+        return super().extrasFor(symbol)
+
+    def __getitem__(self, symbol):
+        self.ensureAttached()
+        return super().__getitem__(symbol)
+
+    def __contains__(self, symbol):
+        self.ensureAttached()
+        return super().__contains__(symbol)
+
+    def __iter__(self):
+        self.ensureAttached()
+        return super().__iter__()
+
+    def __len__(self):
+        self.ensureAttached()
+        return super().__len__()
+
+    def __reduce__(self):
+        # Only the control block travels to the (spawned) workers
+        return (PKSharedStockDB._reattach, (self.controlName, self.controlVersion, self._overlay, self._removed))
+
+    def handle(self):
+        # For processes that did not inherit the control block (it can't go through a queue)
+        self.ensureAttached()
+        return PKSharedStockDBHandle(self.segmentName, self.controlVersion.value, self._overlay, self._removed)
+
+    def _reattach(controlName, controlVersion, overlay, removed):
+        sharedDB = PKSharedStockDB(controlName, controlVersion)
+        sharedDB._overlay = overlay
+        sharedDB._removed = removed
+        return sharedDB
+
+# Plain (picklable) reference to a published PKSharedStockDB. It goes to the
+# warm workers through the tasks queue, and they attach to the segment by name.
+class PKSharedStockDBHandle:
+    def __init__(self, segmentName, version, overlay=None, removed=None):
+        self.segmentName = segmentName
+        self.version = version
+        self.overlay = {} if overlay is None else overlay
+        self.removed = set() if removed is None else removed
+
+    def attach(self):
+        controlName = multiprocessing.RawArray("c", PKSharedStockDB.MAX_SEGMENT_NAME_LENGTH)
+        controlName.value = self.segmentName.encode()
+        sharedDB = PKSharedStockDB._reattach(controlName, multiprocessing.RawValue("i", self.version), self.overlay, self.removed)
+        return sharedDB
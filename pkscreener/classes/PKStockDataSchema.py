@@ -0,0 +1,158 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import numpy as np
+import pandas as pd
+
+# Compact representation of the cached candles.
+# Prices are kept as float32 and volumes as uint64 (with a sentinel for
+# missing values) wherever the candles are held as arrays, i.e. in the
+# columnar store files and the shared memory database, with an int64 epoch
+# (nanoseconds) index. Frames built from the arrays keep the float32 prices
+# (no copy) and are cast to float64 only where indicators need it.
+# MF/FII/FairValue are one value per stock that the screeners keep in the
+# last row. They're stored as separate keys of the stock's "split" dict
+# instead of as columns repeated for every candle.
+class PKStockDataSchema:
+    PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close"]
+    VOLUME_COLUMN = "Volume"
+    SIDE_COLUMNS = ["MF", "MF_Date", "FII", "FII_Date", "FairValue"]
+    PRICE_DTYPE = np.float32
+    VOLUME_DTYPE = np.uint64
+    INDEX_DTYPE = np.int64
+    DEFAULT_DTYPE = np.float64
+    MISSING_VOLUME = np.iinfo(np.uint64).max
+    NORMALIZED_KEY = "schema"
+    SCHEMA_VERSION = 1
+
+    def fieldDtype(column):
+        if column in PKStockDataSchema.PRICE_COLUMNS:
+            return PKStockDataSchema.PRICE_DTYPE
+        if column == PKStockDataSchema.VOLUME_COLUMN:
+            return PKStockDataSchema.VOLUME_DTYPE
+        return PKStockDataSchema.DEFAULT_DTYPE
+
+    def emptyField(column, rows):
+        dtype = PKStockDataSchema.fieldDtype(column)
+        return np.full(rows, PKStockDataSchema.MISSING_VOLUME if dtype == PKStockDataSchema.VOLUME_DTYPE else np.nan, dtype=dtype)
+
+    def toStorage(column, values):
+        # float64 values into the compact dtype of the column
+        dtype = PKStockDataSchema.fieldDtype(column)
+        if dtype != PKStockDataSchema.VOLUME_DTYPE:
+            return values.astype(dtype, copy=False)
+        missing = ~np.isfinite(values) | (values < 0)
+        volumes = np.where(missing, 0, np.rint(values)).astype(dtype)
+        volumes[missing] = PKStockDataSchema.MISSING_VOLUME
+        return volumes
+
+    def fromStorage(values):
+        # Prices (and legacy float64 arrays) are handed out as they are, without
+        # a copy. Volumes need the sentinel replaced with NaN, so those become float64.
+        if values.dtype != PKStockDataSchema.VOLUME_DTYPE:
+            return values
+        floats = values.astype(PKStockDataSchema.DEFAULT_DTYPE)
+        floats[values == PKStockDataSchema.MISSING_VOLUME] = np.nan
+        return floats
+
+    def forIndicators(df):
+        # TA-Lib only takes float64 inputs. Casts the float32 price columns of a
+        # frame from the store, right before it's screened.
+        if df is None:
+            return df
+        priceColumns = [column for column in df.columns if df[column].dtype == PKStockDataSchema.PRICE_DTYPE]
+        if len(priceColumns) == 0:
+            return df
+        return df.astype({column: PKStockDataSchema.DEFAULT_DTYPE for column in priceColumns})
+
+    def lastValue(values):
+        for value in reversed(values):
+            if value is not None and not (isinstance(value, float) and np.isnan(value)):
+                return value
+        return None
+
+    def isNormalized(splitDict):
+        return isinstance(splitDict, dict) and splitDict.get(PKStockDataSchema.NORMALIZED_KEY) == PKStockDataSchema.SCHEMA_VERSION
+
+    def normalizeSplitDict(splitDict):
+        # Brings a stock's "split" dict into the canonical shape once, when it's
+        # ingested, so that frames can be built without any repairs later:
+        # - one column name per value (extra values get temp<n> names, missing
+        #   values are padded with None)
+        # - the timestamps in "index", never in a Date/Datetime column
+        # - the side columns moved out of the rows into keys of the dict
+        # Dicts that are already normalized are returned as they are.
+        if not isinstance(splitDict, dict) or "data" not in splitDict.keys() or PKStockDataSchema.isNormalized(splitDict):
+            return splitDict
+        columns = [str(column) for column in (splitDict.get("columns") or [])]
+        rows = splitDict.get("data") or []
+        index = splitDict.get("index")
+        width = max([len(row) for row in rows], default=len(columns))
+        numDiff = width - len(columns)
+        while numDiff > 0:
+            # Same names that the screening code used to give them
+            columns.append(f"temp{numDiff}")
+            numDiff -= 1
+        if any(len(row) != len(columns) for row in rows):
+            rows = [list(row) + [None] * (len(columns) - len(row)) for row in rows]
+        dateColumn = "Datetime" if "Datetime" in columns else ("Date" if "Date" in columns else None)
+        if dateColumn is not None:
+            position = columns.index(dateColumn)
+            index = [row[position] for row in rows]
+        sidePositions = [position for position, column in enumerate(columns) if column in PKStockDataSchema.SIDE_COLUMNS or column in ["Date", "Datetime"]]
+        normalized = {key: value for key, value in splitDict.items() if key not in ["index", "columns", "data"]}
+        if len(sidePositions) > 0:
+            keep = [position for position in range(len(columns)) if position not in sidePositions]
+            for position in sidePositions:
+                if columns[position] not in PKStockDataSchema.SIDE_COLUMNS:
+                    continue
+                sideValue = PKStockDataSchema.lastValue([row[position] for row in rows])
+                if sideValue is not None:
+                    normalized[columns[position]] = sideValue
+            columns = [columns[position] for position in keep]
+            rows = [[row[position] for position in keep] for row in rows]
+        normalized["index"] = index
+        normalized["columns"] = columns
+        normalized["data"] = rows
+        normalized[PKStockDataSchema.NORMALIZED_KEY] = PKStockDataSchema.SCHEMA_VERSION
+        return normalized
+
+    def frameFor(splitDict):
+        # DataFrame of a stock indexed by "Date", straight from the canonical dict
+        splitDict = PKStockDataSchema.normalizeSplitDict(splitDict)
+        df = pd.DataFrame(splitDict["data"], columns=splitDict["columns"], index=splitDict["index"])
+        df.index.name = "Date"
+        return df
+
+    def attachSideColumns(df, sideValues):
+        # Puts the side values back into the last row, where the screeners look for them
+        if df is None or len(df) == 0 or sideValues is None:
+            return df
+        for column in PKStockDataSchema.SIDE_COLUMNS:
+            sideValue = sideValues.get(column) if isinstance(sideValues, dict) else None
+            if sideValue is None or column in df.columns:
+                continue
+            with pd.option_context('mode.chained_assignment', None):
+                df[column] = pd.Series([None] * (len(df) - 1) + [sideValue], index=df.index)
+        return df
@@ -0,0 +1,93 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import os
+import pickle
+import struct
+import zlib
+
+# Chunk-framed, compressed stock data cache that can be decoded while it's
+# still being downloaded.
+# Layout: MAGIC, then one frame per symbol and an empty frame at the end.
+# Each frame is a 4-byte big-endian length followed by the zlib compressed
+# pickle of (symbol, data) where data is the usual "split" dict.
+class PKStreamingCache:
+    MAGIC = b"PKSC1\n"
+    FRAME_HEADER = struct.Struct(">I")
+    CHUNK_SIZE = 64 * 1024
+    COMPRESSION_LEVEL = 6
+    FILE_EXTENSION = ".pkcz"
+    serverBaseUrl = "https://raw.githubusercontent.com/pkjmesra/PKScreener/actions-data-download/actions-data-download/"
+
+    def streamFileNameFor(cache_file):
+        return f"{os.path.splitext(cache_file)[0]}{PKStreamingCache.FILE_EXTENSION}"
+
+    def encodeFrame(symbol, data):
+        payload = zlib.compress(pickle.dumps((symbol, data), protocol=pickle.HIGHEST_PROTOCOL), PKStreamingCache.COMPRESSION_LEVEL)
+        return PKStreamingCache.FRAME_HEADER.pack(len(payload)) + payload
+
+    def write(stockDict, filePath):
+        # Manager().dict() proxies are copied over in one go instead of per symbol
+        stockData = stockDict.copy()
+        tmpFilePath = f"{filePath}.tmp"
+        with open(tmpFilePath, "wb") as f:
+            f.write(PKStreamingCache.MAGIC)
+            for symbol, data in stockData.items():
+                f.write(PKStreamingCache.encodeFrame(symbol, data))
+            f.write(PKStreamingCache.FRAME_HEADER.pack(0))
+        os.replace(tmpFilePath, filePath)
+        return filePath
+
+    def decode(chunks):
+        # Yields (symbol, data) as soon as each frame has fully arrived.
+        # Raises ValueError if the stream is not in this format or got truncated.
+        buffer = bytearray()
+        headerChecked = False
+        frameLength = None
+        for chunk in chunks:
+            if not chunk:
+                continue
+            buffer.extend(chunk)
+            if not headerChecked:
+                if len(buffer) < len(PKStreamingCache.MAGIC):
+                    continue
+                if bytes(buffer[: len(PKStreamingCache.MAGIC)]) != PKStreamingCache.MAGIC:
+                    raise ValueError("Not a streaming stock data cache")
+                del buffer[: len(PKStreamingCache.MAGIC)]
+                headerChecked = True
+            while True:
+                if frameLength is None:
+                    if len(buffer) < PKStreamingCache.FRAME_HEADER.size:
+                        break
+                    frameLength = PKStreamingCache.FRAME_HEADER.unpack_from(buffer)[0]
+                    del buffer[: PKStreamingCache.FRAME_HEADER.size]
+                    if frameLength == 0:
+                        return
+                if len(buffer) < frameLength:
+                    break
+                symbol, data = pickle.loads(zlib.decompress(bytes(buffer[:frameLength])))
+                del buffer[:frameLength]
+                frameLength = None
+                yield symbol, data
+        raise ValueError("Streaming stock data cache was truncated")
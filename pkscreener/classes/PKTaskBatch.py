@@ -0,0 +1,123 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import itertools
+import os
+
+# The parameters that all the tasks of a scan share: everything in the task
+# item except the stock (and its pipelinedData). The workers get these once
+# and each task then only carries the stocks to be screened with them.
+class PKScanContext:
+    STOCK_INDEX = 12
+    SCALAR_TYPES = (str, int, float, bool, type(None))
+    # Unique across scans, so that warm workers never mix up an older context
+    ids = itertools.count()
+
+    def __init__(self, item):
+        self.contextId = next(PKScanContext.ids)
+        self.fields = item[:PKScanContext.STOCK_INDEX] + (None,) + item[PKScanContext.STOCK_INDEX + 1:-1]
+
+    def keyFor(item):
+        # Items built together share the same objects (userArgs, testData), so
+        # those are compared by identity and the rest by value.
+        return tuple(field if isinstance(field, PKScanContext.SCALAR_TYPES) else id(field)
+                     for index, field in enumerate(item[:-1]) if index != PKScanContext.STOCK_INDEX)
+
+    def itemFor(self, stock, pipelinedData=None):
+        return self.fields[:PKScanContext.STOCK_INDEX] + (stock,) + self.fields[PKScanContext.STOCK_INDEX + 1:] + (pipelinedData,)
+
+# A chunk of stocks to be screened with the same PKScanContext. The context
+# itself only comes along if the workers were not given it up front.
+class PKTaskBatch:
+    def __init__(self, contextId, context=None):
+        self.contextId = contextId
+        self.context = context
+        self.stocks = []
+        self.pipelinedData = None
+
+    def __len__(self):
+        return len(self.stocks)
+
+    def add(self, stock, pipelinedData=None):
+        if pipelinedData is not None and self.pipelinedData is None:
+            self.pipelinedData = [None] * len(self.stocks)
+        self.stocks.append(stock)
+        if self.pipelinedData is not None:
+            self.pipelinedData.append(pipelinedData)
+
+    def contextsFor(items, contexts=None):
+        # {key: PKScanContext} for each distinct set of parameters in items
+        contexts = {} if contexts is None else contexts
+        for item in items:
+            key = PKScanContext.keyFor(item)
+            if key not in contexts:
+                contexts[key] = PKScanContext(item)
+        return contexts
+
+    def batchesFor(items, chunkSize, contexts, knownContextIds=(), workers=None):
+        # Consecutive items with the same context go together, up to chunkSize stocks.
+        # With the number of workers, the batches get smaller towards the end of
+        # the queue, down to one stock each, so that the workers that are done
+        # can take over what's left instead of waiting on a worker's last batch.
+        chunkSize = max(1, int(chunkSize))
+        batchSize = chunkSize
+        batches = []
+        PKTaskBatch.contextsFor(items, contexts)
+        for position, item in enumerate(items):
+            context = contexts[PKScanContext.keyFor(item)]
+            if len(batches) == 0 or batches[-1].contextId != context.contextId or len(batches[-1]) >= batchSize:
+                batches.append(PKTaskBatch(context.contextId, None if context.contextId in knownContextIds else context))
+                if workers is not None:
+                    batchSize = max(1, min(chunkSize, (len(items) - position) // (2 * max(1, int(workers)))))
+            batches[-1].add(item[PKScanContext.STOCK_INDEX], item[-1])
+        return batches
+
+    def itemsFor(self, hostRef):
+        # Runs in the worker. The task items to be screened, one for each stock.
+        if self.context is not None:
+            hostRef.scanContexts = getattr(hostRef, "scanContexts", None) or {}
+            hostRef.scanContexts[self.contextId] = self.context
+        context = hostRef.scanContexts[self.contextId]
+        pipelinedData = self.pipelinedData if self.pipelinedData is not None else [None] * len(self.stocks)
+        return [context.itemFor(stock, data) for stock, data in zip(self.stocks, pipelinedData)]
+
+# A worker's answer to a PKTaskBatch: the results of its stocks, in order,
+# along with how long (in seconds) each of them took to be screened. It also
+# says which worker (process id) screened them and with which context, so
+# the parent knows when every worker has got the context.
+class PKBatchResults(list):
+    def __init__(self, results=(), executeOption=None, contextId=None):
+        super().__init__(results)
+        self.executeOption = executeOption
+        self.contextId = contextId
+        self.workerId = os.getpid()
+        self.stocks = []
+        self.costs = []
+        # Data the worker fetched for the stocks missing from its stock database
+        self.fetchedData = {}
+
+    def add(self, stock, result, seconds):
+        self.append(result)
+        self.stocks.append(stock)
+        self.costs.append(seconds)
@@ -0,0 +1,315 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import numpy as np
+from PKDevTools.classes.log import default_logger
+
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+from pkscreener.classes.PKStockDataSchema import PKStockDataSchema
+from pkscreener.classes.PKTaskBatch import PKScanContext
+
+# Screens the whole universe at once instead of one stock at a time.
+# The cached candles of all stocks are laid out as (stocks x bars) arrays,
+# right aligned on the latest candle and padded with NaN on the left, and the
+# preprocessData indicators are computed for all of them in one pass.
+# The checks of screenStocks that decide whether a stock can be a result at
+# all (price range, stage two, minimum volume and those of the supported
+# execute options) are then evaluated as boolean masks. Only the stocks that
+# pass the masks go on to screenStocks, which still produces the results
+# (and all their columns), so the masks only have to be necessary conditions.
+# Where the indicators may differ a little from the TA library (RSI on short
+# histories), the masks err on the side of keeping the stock.
+class PKVectorizedScreener:
+    # 2: Breakout, 4: Lowest volume, 5: RSI, 8: CCI, 9: Volume ratio,
+    # 15: 52 week low breakout, 17: 52 week high breakout
+    SUPPORTED_OPTIONS = [2, 4, 5, 8, 9, 15, 17]
+    FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+    # More than enough for SMA200, 52 week windows and a settled RSI
+    MAX_BARS = 500
+    FULL_YEAR_BARS = 250
+    # RSI/CCI are compared as ints in screenStocks
+    INDICATOR_TOLERANCE = 2
+    RSI_STABLE_BARS = 100
+    ITEM_EXECUTE_OPTION = 2
+    ITEM_DAYS_FOR_LOWEST_VOLUME = 5
+    ITEM_MIN_RSI = 6
+    ITEM_MAX_RSI = 7
+    ITEM_SHOULD_CACHE = 11
+    ITEM_NEWLY_LISTED = 13
+    ITEM_DOWNLOAD_ONLY = 14
+    ITEM_VOLUME_RATIO = 15
+    ITEM_BACKTEST_DURATION = 18
+    ITEM_TEST_DATA = 22
+
+    def __init__(self, configManager):
+        self.configManager = configManager
+
+    def isApplicable(configManager, menuOption, userPassedArgs=None, newlyListedOnly=False, downloadOnly=False):
+        if not configManager.vectorizedScreening:
+            return False
+        if menuOption not in ["X"] or newlyListedOnly or downloadOnly:
+            return False
+        if userPassedArgs is not None and (userPassedArgs.backtestdaysago is not None or userPassedArgs.download):
+            return False
+        # The masks are for daily candles as they are in the cache
+        if configManager.isIntradayConfig() or configManager.candleDurationFrequency != "d":
+            return False
+        # RSIi and the trimming that comes along with it are not covered
+        return not configManager.calculatersiintraday
+
+    def seriesFor(stockDict, stock):
+        # {field: float64 array} of the cached candles of the stock, oldest first
+        try:
+            if isinstance(stockDict, PKColumnarStore):
+                df = stockDict.frame(stock)
+                if df is None or any(field not in df.columns for field in PKVectorizedScreener.FIELDS):
+                    return None
+                return {field: df[field].to_numpy(dtype=np.float64, na_value=np.nan) for field in PKVectorizedScreener.FIELDS}
+            splitDict = PKStockDataSchema.normalizeSplitDict(stockDict.get(stock))
+            if not isinstance(splitDict, dict) or "data" not in splitDict.keys():
+                return None
+            columns = splitDict["columns"]
+            if any(field not in columns for field in PKVectorizedScreener.FIELDS):
+                return None
+            rows = splitDict["data"]
+            positions = {field: columns.index(field) for field in PKVectorizedScreener.FIELDS}
+            return {field: np.array([row[position] for row in rows], dtype=np.float64) for field, position in positions.items()}
+        except Exception as e:  # pragma: no cover
+            default_logger().debug(e, exc_info=True)
+            return None
+
+    def matrixFor(self, stocks, stockDict):
+        # (symbols, {field: (symbols x bars) array}, number of bars of each symbol)
+        # for the stocks that have usable data in stockDict
+        symbols = []
+        allSeries = []
+        for stock in stocks:
+            series = PKVectorizedScreener.seriesFor(stockDict, stock)
+            if series is None or len(series["Close"]) == 0:
+                continue
+            candles = np.vstack([series[field] for field in PKVectorizedScreener.FIELDS])
+            candles[~np.isfinite(candles)] = np.nan
+            empty = np.isnan(candles).all(axis=0)
+            if empty[-1]:
+                # The side columns keep such a row alive in screenStocks
+                continue
+            symbols.append(stock)
+            allSeries.append(candles[:, ~empty][:, -PKVectorizedScreener.MAX_BARS:])
+        lengths = np.array([candles.shape[1] for candles in allSeries], dtype=np.int64)
+        bars = int(lengths.max()) if len(lengths) > 0 else 0
+        matrix = {field: np.full((len(symbols), bars), np.nan) for field in PKVectorizedScreener.FIELDS}
+        for row, candles in enumerate(allSeries):
+            for position, field in enumerate(PKVectorizedScreener.FIELDS):
+                matrix[field][row, bars - candles.shape[1]:] = candles[position]
+        return symbols, matrix, lengths
+
+    def rollingSum(values, period):
+        # Sum of the last period values along the bars, NaN if any of them is NaN
+        result = np.full(values.shape, np.nan)
+        if values.shape[1] < period:
+            return result
+        filled = np.cumsum(np.nan_to_num(values, nan=0.0), axis=1)
+        missing = np.cumsum(np.isnan(values), axis=1)
+        filled = np.hstack([np.zeros((values.shape[0], 1)), filled])
+        missing = np.hstack([np.zeros((values.shape[0], 1), dtype=missing.dtype), missing])
+        sums = filled[:, period:] - filled[:, :-period]
+        gaps = missing[:, period:] - missing[:, :-period]
+        result[:, period - 1:] = np.where(gaps > 0, np.nan, sums)
+        return result
+
+    def sma(values, period):
+        return PKVectorizedScreener.rollingSum(values, period) / period
+
+    def smoothed(values, period, alpha):
+        # Exponential smoothing seeded with the SMA of the first period values
+        seed = PKVectorizedScreener.sma(values, period)
+        result = np.full(values.shape, np.nan)
+        previous = np.full(values.shape[0], np.nan)
+        for bar in range(values.shape[1]):
+            current = alpha * values[:, bar] + (1 - alpha) * previous
+            previous = np.where(np.isnan(previous), seed[:, bar], current)
+            result[:, bar] = previous
+        return result
+
+    def ema(values, period):
+        return PKVectorizedScreener.smoothed(values, period, 2 / (period + 1))
+
+    def rsi(close, period=14):
+        change = np.diff(close, axis=1)
+        gains = np.where(np.isnan(change), np.nan, np.clip(change, 0, None))
+        losses = np.where(np.isnan(change), np.nan, np.clip(-change, 0, None))
+        averageGain = PKVectorizedScreener.smoothed(gains, period, 1 / period)
+        averageLoss = PKVectorizedScreener.smoothed(losses, period, 1 / period)
+        total = averageGain + averageLoss
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.where(total > 0, 100 * averageGain / total, np.nan)
+        return np.hstack([np.full((close.shape[0], 1), np.nan), values])
+
+    def cci(high, low, close, period=14):
+        typical = (high + low + close) / 3
+        average = PKVectorizedScreener.sma(typical, period)
+        result = np.full(typical.shape, np.nan)
+        if typical.shape[1] < period:
+            return result
+        windows = np.lib.stride_tricks.sliding_window_view(typical, period, axis=1)
+        deviation = np.abs(windows - average[:, period - 1:, None]).mean(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[:, period - 1:] = (typical[:, period - 1:] - average[:, period - 1:]) / (0.015 * deviation)
+        return result
+
+    def indicatorsFor(self, matrix):
+        # Same indicators as ScreeningStatistics.preprocessData, for all the symbols
+        close = matrix["Close"]
+        average = PKVectorizedScreener.ema if self.configManager.useEMA else PKVectorizedScreener.sma
+        return {
+            "SMA": average(close, 50),
+            "LMA": average(close, 200),
+            "SSMA": average(close, 9),
+            "SSMA20": average(close, 20),
+            "VolMA": PKVectorizedScreener.sma(matrix["Volume"], 20),
+            "RSI": PKVectorizedScreener.rsi(close, 14),
+            "CCI": PKVectorizedScreener.cci(matrix["High"], matrix["Low"], close, 14),
+        }
+
+    def window(values, lengths, bars, fill):
+        # The last bars values of each symbol with NaN as 0 (like the fillna(0)
+        # in the screeners) and the padding before its first candle as fill
+        bars = min(bars, values.shape[1])
+        recent = np.nan_to_num(values[:, values.shape[1] - bars:], nan=0.0)
+        padding = np.arange(bars)[None, :] < (bars - lengths)[:, None]
+        return np.where(padding, fill, recent)
+
+    def basicMask(self, matrix, lengths, indicators, exchangeName):
+        # performBasicLTPChecks and the minimum volume of performBasicVolumeChecks
+        configManager = self.configManager
+        close = np.nan_to_num(matrix["Close"][:, -1], nan=0.0)
+        previousClose = np.nan_to_num(matrix["Close"][:, -2], nan=0.0) if matrix["Close"].shape[1] > 1 else np.full(close.shape, np.nan)
+        ltp = np.round(close, 2)
+        minLTP = configManager.minLTP if exchangeName == "INDIA" else configManager.minLTP / 80
+        mask = (ltp >= float(minLTP)) & (ltp <= float(configManager.maxLTP))
+        minChange = float(configManager.minimumChangePercentage)
+        if minChange != 0:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                change = (close / previousClose - 1) * 100
+            change = np.where(np.isfinite(change), change, 0)
+            # Compared after formatting with one decimal
+            mask &= change >= minChange - 0.05
+        if configManager.stageTwo:
+            yearlyLow = PKVectorizedScreener.window(matrix["Close"], lengths, PKVectorizedScreener.FULL_YEAR_BARS, np.inf).min(axis=1)
+            yearlyHigh = PKVectorizedScreener.window(matrix["Close"], lengths, PKVectorizedScreener.FULL_YEAR_BARS, -np.inf).max(axis=1)
+            notStageTwo = (lengths > PKVectorizedScreener.FULL_YEAR_BARS) & (ltp < 2 * yearlyLow) & (ltp < 0.75 * yearlyHigh)
+            mask &= ~notStageTwo
+        volume = np.nan_to_num(matrix["Volume"][:, -1], nan=0.0)
+        volumeAverage = np.nan_to_num(indicators["VolMA"][:, -1], nan=0.0)
+        minVolume = float(configManager.minVolume)
+        mask &= (volumeAverage >= minVolume) | (volume >= minVolume)
+        return mask
+
+    def volumeRatioMask(self, matrix, indicators, volumeRatio):
+        volume = np.nan_to_num(matrix["Volume"][:, -1], nan=0.0)
+        volumeAverage = np.nan_to_num(indicators["VolMA"][:, -1], nan=0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.round(volume / volumeAverage, 2)
+        return (volumeAverage != 0) & np.isfinite(ratio) & (ratio >= volumeRatio)
+
+    def optionMask(self, item, matrix, lengths, indicators):
+        # The conditions that the supported execute options can not do without
+        executeOption = item[PKVectorizedScreener.ITEM_EXECUTE_OPTION]
+        volumeRatio = item[PKVectorizedScreener.ITEM_VOLUME_RATIO]
+        if volumeRatio <= 0:
+            volumeRatio = self.configManager.volumeRatio
+        lookback = self.configManager.effectiveDaysToLookback
+        tolerance = PKVectorizedScreener.INDICATOR_TOLERANCE
+        if executeOption == 2:
+            # Every kind of breakout in findBreakoutValue needs a close at or
+            # above the highest close of the lookback period and a green candle
+            closes = PKVectorizedScreener.window(matrix["Close"], lengths, lookback, -np.inf)[:, :-1]
+            close = np.nan_to_num(matrix["Close"][:, -1], nan=0.0)
+            openPrice = np.nan_to_num(matrix["Open"][:, -1], nan=0.0)
+            if closes.shape[1] == 0:
+                return np.full(len(lengths), False)
+            maxClose = np.round(closes.max(axis=1), 2)
+            return np.isfinite(maxClose) & (np.round(close, 2) >= maxClose) & (close >= openPrice) & \
+                self.volumeRatioMask(matrix, indicators, volumeRatio)
+        if executeOption == 4:
+            days = item[PKVectorizedScreener.ITEM_DAYS_FOR_LOWEST_VOLUME] or 30
+            volumes = PKVectorizedScreener.window(matrix["Volume"], lengths, days, np.inf)
+            volume = np.nan_to_num(matrix["Volume"][:, -1], nan=0.0)
+            return (np.minimum(lengths, lookback) >= days) & (volume <= volumes.min(axis=1))
+        if executeOption in [5, 8]:
+            values = indicators["RSI" if executeOption == 5 else "CCI"][:, -1]
+            minValue = item[PKVectorizedScreener.ITEM_MIN_RSI]
+            maxValue = item[PKVectorizedScreener.ITEM_MAX_RSI]
+            mask = np.isfinite(values) & (values >= minValue - tolerance) & (values <= maxValue + tolerance)
+            if executeOption == 5:
+                mask &= values > 0
+                # The smoothing only settles down with some history behind it
+                mask |= lengths < PKVectorizedScreener.RSI_STABLE_BARS
+            return mask
+        if executeOption == 9:
+            return self.volumeRatioMask(matrix, indicators, volumeRatio)
+        if executeOption == 15:
+            lows = PKVectorizedScreener.window(matrix["Low"], lengths, PKVectorizedScreener.FULL_YEAR_BARS, np.inf)
+            return np.nan_to_num(matrix["Low"][:, -1], nan=0.0) <= lows.min(axis=1)
+        if executeOption == 17:
+            highs = PKVectorizedScreener.window(matrix["High"], lengths, PKVectorizedScreener.FULL_YEAR_BARS, -np.inf)
+            return np.nan_to_num(matrix["High"][:, -1], nan=0.0) >= highs.max(axis=1)
+        return np.full(len(lengths), True)
+
+    def isEvaluable(item):
+        return item[PKVectorizedScreener.ITEM_EXECUTE_OPTION] in PKVectorizedScreener.SUPPORTED_OPTIONS \
+            and item[PKVectorizedScreener.ITEM_SHOULD_CACHE] \
+            and not item[PKVectorizedScreener.ITEM_NEWLY_LISTED] \
+            and not item[PKVectorizedScreener.ITEM_DOWNLOAD_ONLY] \
+            and item[PKVectorizedScreener.ITEM_BACKTEST_DURATION] == 0 \
+            and item[PKVectorizedScreener.ITEM_TEST_DATA] is None \
+            and item[-1] is None
+
+    def prefilter(self, items, stockDict):
+        # items without the ones whose stocks can't be a result. Items that
+        # can't be evaluated here (no cached data, unsupported options) stay.
+        if stockDict is None or len(stockDict) == 0:
+            return items
+        evaluable = [item for item in items if PKVectorizedScreener.isEvaluable(item)]
+        if len(evaluable) == 0:
+            return items
+        stocks = list(dict.fromkeys(item[PKScanContext.STOCK_INDEX] for item in evaluable))
+        symbols, matrix, lengths = self.matrixFor(stocks, stockDict)
+        if len(symbols) == 0:
+            return items
+        rowFor = {symbol: row for row, symbol in enumerate(symbols)}
+        indicators = self.indicatorsFor(matrix)
+        masks = {}
+        for item in evaluable:
+            key = PKScanContext.keyFor(item)
+            if key not in masks:
+                masks[key] = self.basicMask(matrix, lengths, indicators, item[1]) & \
+                    self.optionMask(item, matrix, lengths, indicators)
+        rejected = set()
+        for item in evaluable:
+            row = rowFor.get(item[PKScanContext.STOCK_INDEX])
+            if row is not None and not masks[PKScanContext.keyFor(item)][row]:
+                rejected.add(id(item))
+        default_logger().debug(f"Vectorized screening dropped {len(rejected)} of {len(items)} stocks")
+        return [item for item in items if id(item) not in rejected]
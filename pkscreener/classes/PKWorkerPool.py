@@ -0,0 +1,253 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+
+"""
+import multiprocessing
+import threading
+import time
+from queue import Empty
+
+from PKDevTools.classes.log import default_logger
+from PKDevTools.classes.PKMultiProcessorClient import PKMultiProcessorClient
+from PKDevTools.classes.multiprocessing_logging import LogQueueReader
+from PKNSETools.PKIntraDay import Intra_Day
+
+from pkscreener.classes.PKFetchBroker import PKFetchBroker
+from pkscreener.classes.PKFrameCache import PKFrameCache
+from pkscreener.classes.PKSharedStockDB import PKSharedStockDB, PKSharedStockDBHandle
+from pkscreener.classes.StockScreener import StockScreener
+import pkscreener.classes.ScreeningStatistics as ScreeningStatistics
+
+# What a warm worker needs to know about the next scan. It goes to every
+# worker as a control message on the tasks queue. The stock dictionaries
+# are only sent along when the data has changed since the previous scan.
+# A shared stock database goes as a handle and the worker attaches to it.
+class PKWorkerContext:
+    def __init__(self, contextVersion, configManager, rs_score_index, dataVersion, stockDictPrimary=None, stockDictSecondary=None, scanContexts=None):
+        self.contextVersion = contextVersion
+        self.scanContexts = {} if scanContexts is None else scanContexts
+        self.configManager = configManager
+        self.rs_score_index = rs_score_index
+        self.dataVersion = dataVersion
+        self.stockDictPrimary = stockDictPrimary.handle() if isinstance(stockDictPrimary, PKSharedStockDB) else stockDictPrimary
+        self.stockDictSecondary = stockDictSecondary.handle() if isinstance(stockDictSecondary, PKSharedStockDB) else stockDictSecondary
+
+    def apply(self, hostRef):
+        # Runs in the worker process
+        hostRef.configManager = self.configManager
+        hostRef.screener = ScreeningStatistics.ScreeningStatistics(self.configManager, hostRef.default_logger)
+        hostRef.rs_strange_index = self.rs_score_index
+        hostRef.scanContexts = self.scanContexts
+        if getattr(hostRef, "dataVersion", None) != self.dataVersion:
+            hostRef.objectDictionaryPrimary = self.stockDictPrimary.attach() if isinstance(self.stockDictPrimary, PKSharedStockDBHandle) else self.stockDictPrimary
+            hostRef.objectDictionarySecondary = self.stockDictSecondary.attach() if isinstance(self.stockDictSecondary, PKSharedStockDBHandle) else self.stockDictSecondary
+            hostRef.dataVersion = self.dataVersion
+        hostRef.warmScreener = StockScreener()
+        try:
+            # Hold on until every other worker has taken its own copy of the message
+            hostRef.controlBarrier.wait(timeout=PKWorkerPool.CONTROL_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+        return (PKWorkerPool.CONTROL_ACK, self.contextVersion)
+
+# Worker processes that stay up across scans and across main() invocations
+# in the same process (interactive menus, --croninterval loops, the bot).
+# Starting the workers, fetching the base index for the RS rating and
+# logging into NSE for the intraday fetcher then happen once instead of
+# on every scan. Each scan only sends a PKWorkerContext to every worker and
+# waits for all of them to acknowledge it.
+class PKWorkerPool:
+    CONTROL_ACK = "PKWorkerContextApplied"
+    CONTROL_TIMEOUT = 30
+    warmPool = None
+
+    def __init__(self, totalConsumers, keyboardInterruptEvent, fetcher, configManager, candlePatterns):
+        self.tasks_queue = multiprocessing.JoinableQueue()
+        self.results_queue = multiprocessing.Queue()
+        self.logging_queue = multiprocessing.Queue()
+        self.processingCounter = multiprocessing.Value("i", 1)
+        self.processingResultsCounter = multiprocessing.Value("i", 0)
+        self.controlBarrier = multiprocessing.Barrier(totalConsumers)
+        self.keyboardInterruptEvent = keyboardInterruptEvent
+        self.configManager = configManager
+        self.frameCache = PKFrameCache(configManager.frameCacheSize)
+        self.fetchBroker = PKFetchBroker.startFor(fetcher, configManager)
+        self.contextVersion = 0
+        self.dataVersion = 0
+        self.dataKey = None
+        self.sources = (None, None)
+        self.stockDictPrimary = None
+        self.stockDictSecondary = None
+        self.rs_score_index = -1
+        try:
+            intradayFetcher = None
+            intradayFetcher = Intra_Day("SBINEQN") # This will initialise the cookies etc.
+        except:
+            pass
+        self.consumers = [
+            PKMultiProcessorClient(
+                PKWorkerPool.process,
+                self.tasks_queue,
+                self.results_queue,
+                self.logging_queue,
+                self.processingCounter,
+                self.processingResultsCounter,
+                None,
+                None,
+                fetcher.proxyServer,
+                keyboardInterruptEvent,
+                default_logger(),
+                fetcher,
+                configManager,
+                candlePatterns,
+                None,
+            )
+            for _ in range(totalConsumers)
+        ]
+        for consumer in self.consumers:
+            consumer.intradayNSEFetcher = intradayFetcher
+            consumer.frameCache = self.frameCache
+            consumer.fetchBroker = None if self.fetchBroker is None else self.fetchBroker.clientFor(timeout=configManager.longTimeout * 4)
+            consumer.controlBarrier = self.controlBarrier
+
+    def isApplicable(configManager, menuOption, userPassedArgs=None):
+        if not configManager.persistentWorkerPool or menuOption in ["C"]:
+            return False
+        return userPassedArgs is None or not (userPassedArgs.download or userPassedArgs.singlethread)
+
+    def warmPoolFor(keyboardInterruptEvent, fetcher, configManager, candlePatterns, startWorkers):
+        # The running pool if it's still usable, else a new (started) one
+        pool = PKWorkerPool.warmPool
+        if pool is not None and not pool.isUsable(keyboardInterruptEvent):
+            PKWorkerPool.shutdown()
+            pool = None
+        if pool is None:
+            pool = PKWorkerPool(max(2, multiprocessing.cpu_count()), keyboardInterruptEvent, fetcher, configManager, candlePatterns)
+            try:
+                LogQueueReader(pool.logging_queue).start()
+            except:
+                pass
+            startWorkers(pool.consumers)
+            PKWorkerPool.warmPool = pool
+        return pool
+
+    def owns(consumers):
+        return PKWorkerPool.warmPool is not None and consumers is PKWorkerPool.warmPool.consumers
+
+    def shutdown():
+        pool = PKWorkerPool.warmPool
+        PKWorkerPool.warmPool = None
+        if pool is None:
+            return
+        for consumer in pool.consumers:
+            try:
+                consumer.terminate()
+            except OSError as e: # pragma: no cover
+                default_logger().debug(e, exc_info=True)
+        if pool.fetchBroker is not None:
+            pool.fetchBroker.stop()
+        PKSharedStockDB.releaseAll()
+
+    def process(*task):
+        # Runs in the worker process. The last item is the worker itself.
+        hostRef = task[-1]
+        if isinstance(task[0], PKWorkerContext):
+            return task[0].apply(hostRef)
+        return hostRef.warmScreener.screenTasks(*task)
+
+    def isAcknowledgement(result, contextVersion):
+        return isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], str) and \
+            result[0] == PKWorkerPool.CONTROL_ACK and result[1] == contextVersion
+
+    def invalidateData(self):
+        # The next scan sends the stock dictionaries again even if they look the same
+        self.dataKey = None
+
+    def isUsable(self, keyboardInterruptEvent):
+        return keyboardInterruptEvent is self.keyboardInterruptEvent and \
+            not self.keyboardInterruptEvent.is_set() and \
+            all(consumer.is_alive() for consumer in self.consumers)
+
+    def dataKeyFor(stockDictPrimary, stockDictSecondary, configManager):
+        # The pool holds on to the dictionaries it was given, so their ids can't be reused
+        return (id(stockDictPrimary), id(stockDictSecondary),
+                len(stockDictPrimary) if stockDictPrimary is not None else -1,
+                len(stockDictSecondary) if stockDictSecondary is not None else -1,
+                configManager.period, configManager.duration, configManager.baseIndex)
+
+    def share(self, published, stockDict):
+        if not self.configManager.enableSharedStockDB:
+            return stockDict
+        if isinstance(published, PKSharedStockDB):
+            # The workers re-attach to the re-published data on their own
+            return PKSharedStockDB.republish(published, stockDict)
+        return PKSharedStockDB.publish(stockDict)
+
+    def drain(self):
+        # Whatever's left from a scan that ended early
+        try:
+            while True:
+                self.tasks_queue.get_nowait()
+        except Empty:
+            pass
+
+    def prepare(self, stockDictPrimary, stockDictSecondary, configManager, rsScoreFn, scanContexts=None):
+        # Sends the scan parameters to every worker. Returns False if they did not
+        # all acknowledge them in time, in which case the pool should not be used.
+        self.drain()
+        self.configManager = configManager
+        dataKey = PKWorkerPool.dataKeyFor(stockDictPrimary, stockDictSecondary, configManager)
+        dataChanged = dataKey != self.dataKey
+        if dataChanged:
+            self.sources = (stockDictPrimary, stockDictSecondary)
+            self.stockDictPrimary = self.share(self.stockDictPrimary, stockDictPrimary)
+            self.stockDictSecondary = self.share(self.stockDictSecondary, stockDictSecondary)
+            self.rs_score_index = rsScoreFn()
+            self.frameCache.invalidate()
+            self.dataVersion += 1
+            self.dataKey = dataKey
+        for consumer in self.consumers:
+            # PKScanRunner.refreshDatabase re-publishes through these
+            consumer.objectDictionaryPrimary = self.stockDictPrimary
+            consumer.objectDictionarySecondary = self.stockDictSecondary
+        self.processingCounter.value = 1
+        self.processingResultsCounter.value = 0
+        self.contextVersion += 1
+        context = PKWorkerContext(self.contextVersion, configManager, self.rs_score_index, self.dataVersion,
+                                  self.stockDictPrimary if dataChanged else None,
+                                  self.stockDictSecondary if dataChanged else None,
+                                  scanContexts)
+        for _ in self.consumers:
+            self.tasks_queue.put((context,))
+        # Results of an earlier scan that ended early may still be ahead of the acknowledgements
+        acknowledged = 0
+        deadline = time.time() + PKWorkerPool.CONTROL_TIMEOUT
+        while acknowledged < len(self.consumers):
+            try:
+                result = self.results_queue.get(timeout=max(0.1, deadline - time.time()))
+            except Empty:
+                default_logger().debug(f"Only {acknowledged} of {len(self.consumers)} workers took the scan context.")
+                return False
+            if PKWorkerPool.isAcknowledgement(result, self.contextVersion):
+                acknowledged += 1
+        return True
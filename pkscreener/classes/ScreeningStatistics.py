@@ -37,6 +37,7 @@ from sys import float_info as sflt
 import pkscreener.classes.Utility as Utility
 from pkscreener import Imports
 from pkscreener.classes.Pktalib import pktalib
+from pkscreener.classes.PKFundamentalsStore import PKFundamentalsStore
 from PKDevTools.classes.OutputControls import OutputControls
 from PKNSETools.morningstartools import Stock
 
@@ -1910,39 +1911,53 @@ class ScreeningStatistics:
             except (KeyError,IndexError):
                     pass
         else:
-            if PKDateUtilities.currentDateTime().weekday() >= 5 or force:
-                security = None
-                # Refresh each saturday or sunday or when not found in saved data
+            # Saved by the fundamentals refresh job. Only a forced refresh goes to the network.
+            savedFairValue = PKFundamentalsStore.sharedFor(PKFundamentalsStore.FAIR_VALUE, exchangeName).get(stock)
+            if savedFairValue is None and force:
+                savedFairValue = self.getFreshFairValue(stock, exchangeName=exchangeName)
+            if savedFairValue is not None:
+                fairValue = round(float(savedFairValue),1)
                 try:
-                    with SuppressOutput(suppress_stderr=True, suppress_stdout=True):
-                        security = Stock(stock,exchange=exchangeName)
-                except ValueError: # pragma: no cover
-                    # We did not find the stock? It's okay. Move on to the next one.
-                    pass
-                except (TimeoutError, ConnectionError) as e:
-                    self.default_logger.debug(e, exc_info=True)
+                    hostData.loc[hostData.index[-1],"FairValue"] = fairValue
+                except (KeyError,IndexError):
                     pass
-                except Exception as e:
-                    self.default_logger.debug(e, exc_info=True)
+            elif "FairValue" in hostData.columns:
+                try:
+                    fairValue = hostData.loc[hostData.index[-1],"FairValue"]
+                except (KeyError,IndexError):
                     pass
-                if security is not None:
-                    with SuppressOutput(suppress_stderr=True, suppress_stdout=True):
-                        fv = security.fairValue()
-                    if fv is not None:
-                        try:
-                            fvResponseValue = fv["latestFairValue"]
-                            if fvResponseValue is not None:
-                                fairValue = float(fvResponseValue)
-                        except: # pragma: no cover
-                            pass
-                            # self.default_logger.debug(f"{e}\nResponse:fv:\n{fv}", exc_info=True)
-                    fairValue = round(float(fairValue),1)
-                    try:
-                        hostData.loc[hostData.index[-1],"FairValue"] = fairValue
-                    except (KeyError,IndexError):
-                        pass
         return fairValue
 
+    def getFreshFairValue(self, stock, exchangeName="INDIA"):
+        # The latest fair value from the service, 0 if it has none or None if the stock could not be looked up
+        security = None
+        fairValue = 0
+        try:
+            with SuppressOutput(suppress_stderr=True, suppress_stdout=True):
+                security = Stock(stock,exchange=exchangeName)
+        except ValueError: # pragma: no cover
+            # We did not find the stock? It's okay. Move on to the next one.
+            pass
+        except (TimeoutError, ConnectionError) as e:
+            self.default_logger.debug(e, exc_info=True)
+            pass
+        except Exception as e:
+            self.default_logger.debug(e, exc_info=True)
+            pass
+        if security is None:
+            return None
+        try:
+            with SuppressOutput(suppress_stderr=True, suppress_stdout=True):
+                fv = security.fairValue()
+            if fv is not None:
+                fvResponseValue = fv["latestFairValue"]
+                if fvResponseValue is not None:
+                    fairValue = float(fvResponseValue)
+        except Exception as e: # pragma: no cover
+            self.default_logger.debug(e, exc_info=True)
+            pass
+        return round(float(fairValue),1)
+
     def getFreshMFIStatus(self, stock,exchangeName="INDIA"):
         changeStatusDataMF = None
         changeStatusDataInst = None
@@ -2052,8 +2067,14 @@ class ScreeningStatistics:
             else:
                 needsFreshUpdate = True
 
-        if needsFreshUpdate and force:
-            netChangeMF, netChangeInst, latest_mfdate, latest_instdate = self.getFreshMFIStatus(stock,exchangeName=exchangeName)
+        mfiStatus = None
+        if needsFreshUpdate:
+            # Saved by the fundamentals refresh job. Only a forced refresh goes to the network.
+            mfiStatus = PKFundamentalsStore.sharedFor(PKFundamentalsStore.MFI, exchangeName).get(stock)
+            if mfiStatus is None and force:
+                mfiStatus = self.getFreshMFIStatus(stock,exchangeName=exchangeName)
+        if mfiStatus is not None:
+            netChangeMF, netChangeInst, latest_mfdate, latest_instdate = mfiStatus
             if netChangeMF is not None:
                 try:
                     hostData.loc[hostData.index[-1],"MF"] = netChangeMF
@@ -44,6 +44,11 @@ from PKDevTools.classes.PKDateUtilities import PKDateUtilities
 import pkscreener.classes.ScreeningStatistics as ScreeningStatistics
 from pkscreener import Imports
 from pkscreener.classes.CandlePatterns import CandlePatterns
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+from pkscreener.classes.PKFetchBroker import PKFetchBrokerClient
+from pkscreener.classes.PKFrameCache import PKFrameCache
+from pkscreener.classes.PKStockDataSchema import PKStockDataSchema
+from pkscreener.classes.PKTaskBatch import PKBatchResults, PKScanContext, PKTaskBatch
 from PKDevTools.classes.OutputControls import OutputControls
 
 class StockScreener:
@@ -51,6 +56,24 @@ class StockScreener:
         self.isTradingTime = PKDateUtilities.isTradingTime()
         self.configManager = None
 
+    def screenTasks(self, *task):
+        # Workers get a PKTaskBatch (followed by the worker itself) for a chunk
+        # of stocks and answer with the list of their results (PKBatchResults,
+        # which also has how long each stock took).
+        hostRef = task[-1]
+        if not isinstance(task[0], PKTaskBatch):
+            return self.screenStocks(*task)
+        items = task[0].itemsFor(hostRef)
+        results = PKBatchResults(executeOption=(items[0][2] if len(items) > 0 else None), contextId=task[0].contextId)
+        for item in items:
+            start = time.time()
+            result = self.screenStocks(*item, hostRef=hostRef)
+            results.add(item[PKScanContext.STOCK_INDEX], result, time.time() - start)
+        if isinstance(hostRef.objectDictionaryPrimary, PKColumnarStore):
+            # Whatever got fetched lands in this process' overlay only. The parent saves it.
+            results.fetchedData = hostRef.objectDictionaryPrimary.takeWrites()
+        return results
+
     # @tracelog
     def screenStocks(
         self,
@@ -77,6 +100,7 @@ class StockScreener:
         logLevel=logging.NOTSET,
         portfolio=False,
         testData = None,
+        pipelinedData = None,
         hostRef=None,
     ):
         assert (
@@ -103,7 +127,9 @@ class StockScreener:
             #     hostRef.default_logger.info(f"For stock:{stock}, stock exists in objectDictionary:{hostRef.objectDictionaryPrimary.get(stock)}, cacheEnabled:{configManager.cacheEnabled}, isTradingTime:{self.isTradingTime}, downloadOnly:{downloadOnly}")
             data = None
             intraday_data = None
-            data = self.getRelevantDataForStock(totalSymbols, shouldCache, stock, downloadOnly, printCounter, backtestDuration, hostRef,hostRef.objectDictionaryPrimary, configManager, fetcher, period,None, testData,exchangeName)
+            # Pipelined scans hand over the freshly downloaded data along with the stock
+            objectDictionaryPrimary = hostRef.objectDictionaryPrimary if pipelinedData is None else {stock: pipelinedData}
+            data = self.getRelevantDataForStock(totalSymbols, shouldCache, stock, downloadOnly, printCounter, backtestDuration, hostRef,objectDictionaryPrimary, configManager, fetcher, period,None, testData,exchangeName)
             if str(executeOption) in ["32","38"] or (not configManager.isIntradayConfig() and configManager.calculatersiintraday):
                 # Daily data is already available in "data" above.
                 # We need the intraday data for 1-d RSI values when config is not for intraday
@@ -696,7 +722,7 @@ class StockScreener:
             try:
                 data = hostRef.objectDictionaryPrimary.get(stock)
                 if data is not None:
-                    data = pd.DataFrame(data["data"], columns=data["columns"], index=data["index"])
+                    data = PKStockDataSchema.attachSideColumns(pd.DataFrame(data["data"], columns=data["columns"], index=data["index"]), data)
                     screener.getMutualFundStatus(stock, hostData=data, force=True, exchangeName=exchangeName)
                     hostRef.objectDictionaryPrimary[stock] = data.to_dict("split")
             except Exception as ex:
@@ -898,10 +924,20 @@ class StockScreener:
         return fullData,processedData,data
 
     def getRelevantDataForStock(self, totalSymbols, shouldCache, stock, downloadOnly, printCounter, backtestDuration, hostRef,objectDictionary, configManager, fetcher, period, duration, testData=None,exchangeName="INDIA"):
-        hostData = objectDictionary.get(stock) if (objectDictionary is not None and len(objectDictionary) > 0) else None
+        hostFrame = None
+        if isinstance(objectDictionary, PKColumnarStore):
+            # The columnar store hands out the frame as a view over its mapped arrays
+            hostFrame = objectDictionary.frame(stock)
+            hostData = None if hostFrame is None else objectDictionary.extrasFor(stock)
+            hostDataLength = 0 if hostFrame is None else len(hostFrame)
+        else:
+            hostData = objectDictionary.get(stock) if (objectDictionary is not None and len(objectDictionary) > 0) else None
+            hostDataLength = 0 if hostData is None else (0 if "data" not in hostData.keys() else len(hostData["data"]))
         data = None
-        hostDataLength = 0 if hostData is None else (0 if "data" not in hostData.keys() else len(hostData["data"]))
         start = None
+        frameKey = None
+        dateIndexed = False
+        frameCache = getattr(hostRef, "frameCache", None)
         lastTradingDate = PKDateUtilities.tradingDate().strftime("%Y-%m-%d")
         if (configManager.candlePeriodFrequency in ["d","mo"] and configManager.candleDurationFrequency in ["m","h"]):
             if backtestDuration > 0: # We are backtesting
@@ -924,63 +960,78 @@ class StockScreener:
                 data.set_index("Date", inplace=True)
                 data.drop("index",axis=1,inplace=True)
             else:
-                data = fetcher.fetchStockData(
-                        stock,
-                        period,
-                        configManager.duration if duration is None else duration,
-                        hostRef.proxyServer,
-                        hostRef.processingResultsCounter,
-                        hostRef.processingCounter,
-                        totalSymbols,
-                        start=start,
-                        end=start,
-                        exchangeSuffix=".NS" if exchangeName == "INDIA" else "",
-                        printCounter=printCounter
-                    )
+                fetchBroker = getattr(hostRef, "fetchBroker", None)
+                if isinstance(fetchBroker, PKFetchBrokerClient):
+                    try:
+                        self.printProcessingCounter(totalSymbols, stock, printCounter, hostRef)
+                        data = fetchBroker.fetch(stock,
+                                                 period,
+                                                 configManager.duration if duration is None else duration,
+                                                 exchangeSuffix=".NS" if exchangeName == "INDIA" else "",
+                                                 start=start,
+                                                 end=start)
+                        if data is None:
+                            raise StockDataEmptyException(f"Fetch broker has no data for {stock}")
+                    except TimeoutError as e:
+                        # Let's fetch it on our own instead
+                        hostRef.default_logger.debug(e, exc_info=True)
+                        fetchBroker = None
+                if not isinstance(fetchBroker, PKFetchBrokerClient):
+                    data = fetcher.fetchStockData(
+                            stock,
+                            period,
+                            configManager.duration if duration is None else duration,
+                            hostRef.proxyServer,
+                            hostRef.processingResultsCounter,
+                            hostRef.processingCounter,
+                            totalSymbols,
+                            start=start,
+                            end=start,
+                            exchangeSuffix=".NS" if exchangeName == "INDIA" else "",
+                            printCounter=printCounter
+                        )
                 if hostData is not None and data is not None:
                     # During the market trading hours, we don't want to go for MFI/FV value fetching
                     # So let's copy the old saved ones.
-                    try:
-                        data["MF"] = hostData["MF"]
-                        data["MF_Date"] = hostData["MF_Date"]
-                    except KeyError:
-                        pass
-                    try:
-                        data["FII"] = hostData["FII"]
-                        data["FII_Date"] = hostData["FII_Date"]
-                    except KeyError:
-                        pass
-                    try:
-                        data["FairValue"] = hostData["FairValue"]
-                    except KeyError:
-                        pass
+                    PKStockDataSchema.attachSideColumns(data, hostData)
         else:
             self.printProcessingCounter(totalSymbols, stock, printCounter, hostRef)
+            # Frames from the cached data are always indexed by "Date"
+            dateIndexed = True
             # data = hostData
-            try:
-                columns = hostData["columns"]
-                data = pd.DataFrame(
-                        hostData["data"], columns=columns, index=hostData["index"]
-                    )
-            except (ValueError, AssertionError) as e:
-                # 9 columns passed, passed data had 11 columns
-                # 10 columns passed, passed data had 11 columns
-                excLookingFor = " columns passed, passed data had "
-                if excLookingFor in str(e):
-                    e_diff = str(e).replace(excLookingFor,",").replace(" columns","").split(",")
-                    num_diff = int(e_diff[1]) - int(e_diff[0])
-                    while (num_diff > 0):
-                        columns.append(f"temp{num_diff}")
-                        num_diff -= 1
-                    data = pd.DataFrame(
-                            hostData["data"], columns=columns, index=hostData["index"]
-                        )
+            if hostFrame is not None:
+                data = PKStockDataSchema.attachSideColumns(PKStockDataSchema.forIndicators(hostFrame), hostData)
+                self.normalizeDateIndex(data, reindex=False)
+            else:
+                if isinstance(frameCache, PKFrameCache):
+                    frameKey = PKFrameCache.keyFor(stock, hostData, configManager.duration if duration is None else duration)
+                    data = frameCache.get(frameKey)
+            if data is None:
+                # Cached data is normalized when it's loaded. So this is just a constructor call.
+                data = PKStockDataSchema.frameFor(hostData)
+                PKStockDataSchema.attachSideColumns(data, hostData)
+                if frameKey is not None:
+                    data = frameCache.put(frameKey, data)
+        if not dateIndexed:
+            self.normalizeDateIndex(data)
+        if ((shouldCache and not self.isTradingTime and (hostData is None  or hostDataLength == 0)) or downloadOnly) \
+            or (shouldCache and hostData is None):  # and backtestDuration == 0 # save only if we're NOT backtesting
+                if start is None or start is lastTradingDate and data is not None:
+                    objectDictionary[stock] = data.to_dict("split")
+                if downloadOnly:
+                    with hostRef.processingResultsCounter.get_lock():
+                        hostRef.processingResultsCounter.value += 1
+                    raise ScreeningStatistics.DownloadDataOnly
                 else:
-                    hostRef.default_logger.debug(e, exc_info=True)
-                pass
+                    hostData = objectDictionary.get(stock)
+        return data
+
+    def normalizeDateIndex(self, data, reindex=True):
         if "Datetime" in data.columns: # for intraday data, the column name is Datetime
             with pd.option_context('mode.chained_assignment', None):
                 data["Date"] = data["Datetime"]
+        if not reindex:
+            return
         try:
             data.reset_index(inplace=True)
             if "Datetime" in data.columns and "Date" not in data.columns:
@@ -990,17 +1041,6 @@ class StockScreener:
             data.set_index("Date", inplace=True)
         except:
             pass
-        if ((shouldCache and not self.isTradingTime and (hostData is None  or hostDataLength == 0)) or downloadOnly) \
-            or (shouldCache and hostData is None):  # and backtestDuration == 0 # save only if we're NOT backtesting
-                if start is None or start is lastTradingDate and data is not None:
-                    objectDictionary[stock] = data.to_dict("split")
-                if downloadOnly:
-                    with hostRef.processingResultsCounter.get_lock():
-                        hostRef.processingResultsCounter.value += 1
-                    raise ScreeningStatistics.DownloadDataOnly
-                else:
-                    hostData = objectDictionary.get(stock)
-        return data
 
     def determineBasicConfigs(self, stock, newlyListedOnly, volumeRatio, logLevel, hostRef, configManager, screener, userArgsLog):
         if userArgsLog:
@@ -27,7 +27,6 @@ import datetime
 import glob
 import math
 import os
-import shutil
 import sys
 import textwrap
 import random
@@ -73,6 +72,16 @@ from PKNSETools.PKNSEStockDataFetcher import nseStockDataFetcher
 from pkscreener.classes.PKTask import PKTask
 from pkscreener.classes.MarketStatus import MarketStatus
 from pkscreener.classes.PKScheduler import PKScheduler
+from pkscreener.classes.PKAsyncDownloader import PKAsyncDownloader
+from pkscreener.classes.PKDownloadPipeline import PKDownloadPipeline
+from pkscreener.classes.PKCacheManifest import PKCacheManifest
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+from pkscreener.classes.PKRecordReplayTransport import PKRecordReplayTransport
+from pkscreener.classes.PKRetryQueue import PKRetryQueue
+from pkscreener.classes.PKStreamingCache import PKStreamingCache
+from pkscreener.classes.PKDeltaSync import PKDeltaSync
+from pkscreener.classes.PKDownloadController import PKDownloadController
+from pkscreener.classes.PKStockDataSchema import PKStockDataSchema
 from PKDevTools.classes.OutputControls import OutputControls
 from PKDevTools.classes.Utils import random_user_agent
 
@@ -821,25 +830,53 @@ class tools:
             configManager.isIntradayConfig() or intraday
         )
         outputFolder = Archiver.get_user_outputs_dir()
+        previousStockData = None
+        previousCacheFile = None
         if downloadOnly:
             outputFolder = outputFolder.replace("results","actions-data-download")
             if not os.path.isdir(outputFolder):
                 os.makedirs(os.path.dirname(f"{outputFolder}{os.sep}"), exist_ok=True)
+            if not (configManager.isIntradayConfig() or intraday):
+                # Keep the previously published data around to publish the delta against
+                previousCacheFile = PKDeltaSync.latestLocalCacheFile(fileName, outputFolder)
+                if previousCacheFile is not None:
+                    previousStockData = tools.readCacheFile(os.path.join(outputFolder, previousCacheFile))
             configManager.deleteFileWithPattern(rootDir=outputFolder)
+            configManager.deleteFileWithPattern(rootDir=outputFolder, pattern=f"{'intraday_' if (configManager.isIntradayConfig() or intraday) else ''}stock_data_*{PKStreamingCache.FILE_EXTENSION}")
         cache_file = os.path.join(outputFolder, fileName)
         if not os.path.exists(cache_file) or forceSave or (loadCount >= 0 and len(stockDict) > (loadCount + 1)):
             try:
+                if not downloadOnly and configManager.enableColumnarStockStore and configManager.enableIncrementalStockDataSave:
+                    # Only journal the new/corrected candles instead of rewriting everything
+                    if PKColumnarStore.appendJournal(stockDict,
+                                                     PKColumnarStore.storePathForCacheFile(fileName),
+                                                     cacheFile=fileName,
+                                                     period=str(configManager.period),
+                                                     duration=str(configManager.duration)) is not None:
+                        OutputControls().printOutput(colorText.GREEN + "=> Done." + colorText.END)
+                        return cache_file
+                stockData = stockDict.copy()
                 with open(cache_file, "wb") as f:
-                    pickle.dump(stockDict.copy(), f, protocol=pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(stockData, f, protocol=pickle.HIGHEST_PROTOCOL)
                     OutputControls().printOutput(colorText.GREEN + "=> Done." + colorText.END)
+                PKCacheManifest.record(cache_file, stockData=stockData)
+                if not downloadOnly and configManager.enableColumnarStockStore:
+                    PKColumnarStore.write(stockDict,
+                                          PKColumnarStore.storePathForCacheFile(fileName),
+                                          cacheFile=fileName,
+                                          period=str(configManager.period),
+                                          duration=str(configManager.duration))
                 if downloadOnly:
                     OutputControls().printOutput(colorText.GREEN + f"=> {cache_file}" + colorText.END)
                     Committer.execOSCommand(f"git add {cache_file} -f >/dev/null 2>&1")
+                    # Also publish the streaming format that clients can decode while downloading
+                    streamFilePath = PKStreamingCache.write(stockDict, os.path.join(outputFolder, PKStreamingCache.streamFileNameFor(fileName)))
+                    Committer.execOSCommand(f"git add {streamFilePath} -f >/dev/null 2>&1")
+                    if previousStockData is not None:
+                        for deltaFilePath in PKDeltaSync.publish(stockDict, previousStockData, previousCacheFile, fileName, outputFolder, str(configManager.period), str(configManager.duration)):
+                            Committer.execOSCommand(f"git add {deltaFilePath} -f >/dev/null 2>&1")
                     if "RUNNER" not in os.environ.keys():
-                        copyFilePath = os.path.join(Archiver.get_user_outputs_dir(), f"copy_{fileName}")
-                        cacheFileSize = os.stat(cache_file).st_size if os.path.exists(cache_file) else 0
-                        if os.path.exists(cache_file) and cacheFileSize >= 1024*1024*40:
-                            shutil.copy(cache_file,copyFilePath) # copy is the saved source of truth
+                        PKCacheManifest.backup(cache_file, overwrite=True) # copy is the saved source of truth
             except pickle.PicklingError as e:  # pragma: no cover
                 default_logger().debug(e, exc_info=True)
                 OutputControls().printOutput(
@@ -859,16 +896,25 @@ class tools:
 
     @Halo(text='', spinner='dots')
     def downloadLatestData(stockDict,configManager,stockCodes=[],exchangeSuffix=".NS",downloadOnly=False):
-        numStocksPerIteration = (int(len(stockCodes)/int(len(stockCodes)/10)) if len(stockCodes) >= 10 else len(stockCodes)) + 1
+        # Both the download engines go by the batch size and the timeout learnt by the controller
+        asyncDownload = configManager.asyncDownloadConcurrency > 0
+        controller = PKDownloadController.sharedFor(configManager.asyncDownloadConcurrency if asyncDownload else PKDownloadController.SCHEDULER_CONCURRENCY,
+                                                    timeout=configManager.longTimeout*(4 if downloadOnly else 1))
+        if asyncDownload:
+            downloadedData, leftOutStocks = PKAsyncDownloader.download(stockCodes, configManager.period, configManager.duration,
+                                                                       exchangeSuffix=exchangeSuffix,
+                                                                       controller=controller,
+                                                                       adapter=PKRecordReplayTransport.adapterFor(configManager, pool_maxsize=controller.maxConcurrency))
+            for stock, splitDict in downloadedData.items():
+                stockDict[stock] = splitDict
+            default_logger().debug(f"Attempted fresh download of {len(stockCodes)} stocks and downloaded {len(downloadedData)} stocks. {len(leftOutStocks)} stocks remaining.")
+            return stockDict, leftOutStocks
+        numStocksPerIteration = max(1, controller.batchSize())
         queueCounter = 0
-        iterations = int(len(stockCodes)/numStocksPerIteration) + 1
+        iterations = math.ceil(len(stockCodes)/numStocksPerIteration)
         tasksList = []
         while queueCounter < iterations:
-            stocks = []
-            if queueCounter < iterations:
-                stocks = stockCodes[numStocksPerIteration* queueCounter : numStocksPerIteration* (queueCounter + 1)]
-            else:
-                stocks = ["DUMMYStock"]#stockCodes[numStocksPerIteration* queueCounter :]
+            stocks = stockCodes[numStocksPerIteration* queueCounter : numStocksPerIteration* (queueCounter + 1)]
             fn_args = (stocks, configManager.period, configManager.duration,exchangeSuffix)
             task = PKTask(f"DataDownload-{queueCounter}",long_running_fn=fetcher.fetchStockDataWithArgs,long_running_fn_args=fn_args)
             task.userData = stocks
@@ -878,24 +924,55 @@ class tools:
         
         processedStocks = []
         if len(tasksList) > 0:
+            # Each round of batches (one per worker process) gets the controller's timeout
+            rounds = math.ceil(len(tasksList)/PKScheduler.workerCount())
+            start = time.time()
             # Suppress any multiprocessing errors/warnings
             with SuppressOutput(suppress_stderr=True, suppress_stdout=True):
                 PKScheduler.scheduleTasks(tasksList=tasksList, 
                                         label=f"Downloading latest data [{configManager.period},{configManager.duration}] (Total={len(stockCodes)} records in {len(tasksList)} batches){'Be Patient!' if len(stockCodes)> 2000 else ''}",
-                                        timeout=(5+2.5*configManager.longTimeout*(4 if downloadOnly else 1)), # 5 sec additional time for multiprocessing setup
+                                        timeout=(5+controller.timeout*rounds), # 5 sec additional time for multiprocessing setup
                                         minAcceptableCompletionPercentage=(100 if downloadOnly else 100),
                                         showProgressBars=configManager.logsEnabled)
+            elapsed = time.time() - start
             for task in tasksList:
                 if task.result is not None:
                     for stock in task.userData:
                         taskResult = task.result.get(f"{stock}{exchangeSuffix}")
                         if taskResult is not None:
-                            stockDict[stock] = taskResult.to_dict("split")
+                            stockDict[stock] = PKStockDataSchema.normalizeSplitDict(taskResult.to_dict("split"))
                             processedStocks.append(stock)
+            # The batches are timed as a whole. Let the controller learn from that for the next time.
+            controller.record([elapsed/rounds] * len(processedStocks), 0, len(stockCodes) - len(processedStocks), elapsed)
         leftOutStocks = list(set(stockCodes)-set(processedStocks))
         default_logger().debug(f"Attempted fresh download of {len(stockCodes)} stocks and downloaded {len(processedStocks)} stocks. {len(leftOutStocks)} stocks remaining.")
         return stockDict, leftOutStocks
 
+    def retryLeftOutStocks(stockDict,configManager,retryQueue,stockCodes,leftOutStocks,exchangeSuffix=".NS",downloadOnly=False):
+        sessionDate = str(PKDateUtilities.tradingDate())
+        retryQueue.record(list(set(stockCodes)-set(leftOutStocks)), leftOutStocks, sessionDate)
+        attempts = 0
+        while PKRetryQueue.needsRetry(stockCodes, leftOutStocks) and attempts < configManager.downloadRetryAttempts:
+            dueStocks, wait = retryQueue.due(leftOutStocks)
+            if len(dueStocks) == 0:
+                break
+            sleep(wait)
+            stockDict, stillLeftOutStocks = tools.downloadLatestData(stockDict,configManager,dueStocks,exchangeSuffix=exchangeSuffix,downloadOnly=downloadOnly)
+            retryQueue.record(list(set(dueStocks)-set(stillLeftOutStocks)), stillLeftOutStocks, sessionDate)
+            leftOutStocks = [stock for stock in leftOutStocks if stock not in dueStocks] + stillLeftOutStocks
+            attempts += 1
+        retryQueue.save()
+        return stockDict, leftOutStocks
+
+    def pipelineStockData(stockDict, configManager, stockCodes=[], exchangeSuffix=".NS"):
+        # Starts downloading the latest data in the background. The scan picks up the stocks as they come in.
+        _, cache_file = tools.afterMarketStockDataExists(configManager.isIntradayConfig())
+        if configManager.baseIndex not in stockCodes:
+            stockCodes.insert(0,configManager.baseIndex)
+        retryQueue = PKRetryQueue(PKRetryQueue.filePathFor(os.path.join(Archiver.get_user_outputs_dir(), cache_file)), exchangeSuffix=exchangeSuffix, circuitBreakerSessions=configManager.circuitBreakerSessions)
+        stockDict = stockDict if isinstance(stockDict, dict) else {}
+        return PKDownloadPipeline(stockCodes, configManager, stockDict=stockDict, exchangeSuffix=exchangeSuffix, retryQueue=retryQueue).start()
+
     @Halo(text='', spinner='dots')
     def loadStockData(
         stockDict,
@@ -926,25 +1003,39 @@ class tools:
         # stockCodes is not None mandates that we start our work based on the downloaded data from yesterday
         if (stockCodes is not None and len(stockCodes) > 0) and (isTrading or downloadOnly):
             recentDownloadFromOriginAttempted = True
-            stockDict, leftOutStocks = tools.downloadLatestData(stockDict,configManager,stockCodes,exchangeSuffix=exchangeSuffix,downloadOnly=downloadOnly)
-            if len(leftOutStocks) > int(len(stockCodes)*0.05):
-                # More than 5 % of stocks are still remaining
-                stockDict, _ = tools.downloadLatestData(stockDict,configManager,leftOutStocks,exchangeSuffix=exchangeSuffix,downloadOnly=downloadOnly)
+            retryQueue = PKRetryQueue(PKRetryQueue.filePathFor(os.path.join(Archiver.get_user_outputs_dir(), cache_file)), exchangeSuffix=exchangeSuffix, circuitBreakerSessions=configManager.circuitBreakerSessions)
+            downloadCodes = retryQueue.admit(stockCodes, protectedStocks=[configManager.baseIndex])
+            stockDict, leftOutStocks = tools.downloadLatestData(stockDict,configManager,downloadCodes,exchangeSuffix=exchangeSuffix,downloadOnly=downloadOnly)
+            stockDict, leftOutStocks = tools.retryLeftOutStocks(stockDict,configManager,retryQueue,downloadCodes,leftOutStocks,exchangeSuffix=exchangeSuffix,downloadOnly=downloadOnly)
             # return stockDict
         if downloadOnly or isTrading:
             # We don't want to download from local stale pkl file or stale file at server
             return stockDict
+        if configManager.enableColumnarStockStore and not forceRedownload:
+            if isinstance(stockDict, PKColumnarStore) and stockDict.cacheFile == cache_file:
+                return stockDict
+            if len(stockDict) == 0:
+                columnarStore = PKColumnarStore.openForCacheFile(cache_file, configManager)
+                if columnarStore is not None:
+                    OutputControls().printOutput(
+                        colorText.GREEN
+                        + f"[+] Automatically Using Cached Stock Data (columnar store) {'due to After-Market hours' if not PKDateUtilities.isTradingTime() else ''}!"
+                        + colorText.END
+                    )
+                    return columnarStore
         
         default_logger().debug(
             f"Stock data cache file:{cache_file} exists ->{str(exists)}"
         )
         stockDataLoaded = False
-        copyFilePath = os.path.join(Archiver.get_user_outputs_dir(), f"copy_{cache_file}")
         srcFilePath = os.path.join(Archiver.get_user_outputs_dir(), cache_file)
-        if os.path.exists(copyFilePath):
-            shutil.copy(copyFilePath,srcFilePath) # copy is the saved source of truth
+        # Falls back to the saved copy (source of truth) only if the file is corrupt or was altered
+        PKCacheManifest.restore(srcFilePath)
         if os.path.exists(srcFilePath) and not forceRedownload:
             stockDict, stockDataLoaded = tools.loadDataFromLocalPickle(stockDict,configManager, downloadOnly, defaultAnswer, exchangeSuffix, cache_file, isTrading)
+        if not stockDataLoaded and not forceRedownload and not isIntraday:
+            # Catch up from an older local cache with the deltas published since then
+            stockDict, stockDataLoaded = tools.syncDeltasFromServer(stockDict, configManager, exchangeSuffix, cache_file, isTrading)
         if (
             not stockDataLoaded
             and ("1d" if isIntraday else ConfigManager.default_period)
@@ -967,6 +1058,108 @@ class tools:
             tools.saveStockData(stockDict,configManager,initialLoadCount,isIntraday,downloadOnly, forceSave=stockDataLoaded)
         return stockDict
 
+    def readCacheFile(cacheFilePath):
+        try:
+            with open(cacheFilePath, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            default_logger().debug(e, exc_info=True)
+        return None
+
+    def syncDeltasFromServer(stockDict, configManager, exchangeSuffix, cache_file, isTrading):
+        previousCacheFile = PKDeltaSync.latestLocalCacheFile(cache_file, Archiver.get_user_outputs_dir())
+        if previousCacheFile is None:
+            return stockDict, False
+        previousStockData = tools.readCacheFile(os.path.join(Archiver.get_user_outputs_dir(), previousCacheFile))
+        if previousStockData is None or len(previousStockData) == 0:
+            return stockDict, False
+        OutputControls().printOutput(
+            colorText.GREEN
+            + f"[+] Fetching the changes since {previousCacheFile} from server, Please Wait.."
+            + colorText.END
+        )
+        if not PKDeltaSync.sync(previousStockData, previousCacheFile, cache_file, fetcher, str(configManager.period), str(configManager.duration)):
+            return stockDict, False
+        tools.mergeStockDataFromCache(stockDict, previousStockData, exchangeSuffix, isTrading)
+        return stockDict, True
+
+    def mergeStockData(stockDict, stock, df_or_dict, isTrading):
+        df_or_dict = df_or_dict.to_dict("split") if isinstance(df_or_dict,pd.DataFrame) else df_or_dict
+        df_or_dict = PKStockDataSchema.normalizeSplitDict(df_or_dict)
+            # This will keep all the latest security data we downloaded
+            # just now and also copy the additional data like, MF/FII,FairValue
+            # etc. data, from yesterday's saved data.
+        try:
+            existingPreLoadedData = PKStockDataSchema.normalizeSplitDict(stockDict.get(stock))
+            if existingPreLoadedData is not None:
+                if isTrading:
+                        # Only copy the MF/FII/FairValue data and leave the stock prices as is.
+                    cols = ["MF", "FII","MF_Date","FII_Date","FairValue"]
+                    for col in cols:
+                        existingPreLoadedData[col] = df_or_dict.get(col)
+                    stockDict[stock] = existingPreLoadedData
+                else:
+                    stockDict[stock] = df_or_dict | existingPreLoadedData
+            else:
+                if not isTrading:
+                    stockDict[stock] = df_or_dict
+        except:
+                # Probably, the "stock" got removed from the latest download
+                # and so, was not found in stockDict
+            pass
+
+    def mergeStockDataFromCache(stockDict, stockData, exchangeSuffix, isTrading):
+        multiIndex = stockData.keys()
+        if isinstance(multiIndex, pd.MultiIndex):
+                # If we requested for multiple stocks from yfinance
+                # we'd have received a multiindex dataframe
+            listStockCodes = multiIndex.get_level_values(0)
+            listStockCodes = sorted(list(filter(None,list(set(listStockCodes)))))
+            if len(listStockCodes) > 0 and len(exchangeSuffix) > 0 and exchangeSuffix in listStockCodes[0]:
+                listStockCodes = [x.replace(exchangeSuffix,"") for x in listStockCodes]
+        else:
+            listStockCodes = list(stockData.keys())
+            if len(listStockCodes) > 0 and len(exchangeSuffix) > 0 and exchangeSuffix in listStockCodes[0]:
+                listStockCodes = [x.replace(exchangeSuffix,"") for x in listStockCodes]
+        for stock in listStockCodes:
+            tools.mergeStockData(stockDict, stock, stockData.get(stock), isTrading)
+
+    def streamSavedDataFromServer(stockDict, cache_file, exchangeSuffix, isTrading, headers=None):
+        # Symbols get decoded and merged while the rest of the file is still arriving
+        streamFile = PKStreamingCache.streamFileNameFor(cache_file)
+        resp = fetcher.fetchURL(f"{PKStreamingCache.serverBaseUrl}{streamFile}", headers=headers, stream=True)
+        if resp is None or resp.status_code != 200:
+            default_logger().debug(f"Streaming cache file:{streamFile} request status ->{resp.status_code if resp is not None else None}")
+            return False
+        contentLength = resp.headers.get("content-length")
+        serverBytes = int(contentLength) if contentLength is not None else 0
+        symbolsLoaded = 0
+        bar, spinner = tools.getProgressbarStyle()
+        try:
+            with alive_bar(manual=True, bar=bar, spinner=spinner) as progressbar:
+                def chunks():
+                    receivedBytes = 0
+                    for chunk in resp.iter_content(chunk_size=PKStreamingCache.CHUNK_SIZE):
+                        receivedBytes += len(chunk)
+                        if serverBytes > 0:
+                            progressbar(min(receivedBytes / serverBytes, 1.0))
+                        yield chunk
+                for stock, df_or_dict in PKStreamingCache.decode(chunks()):
+                    if len(exchangeSuffix) > 0 and stock.endswith(exchangeSuffix):
+                        stock = stock.replace(exchangeSuffix,"")
+                    tools.mergeStockData(stockDict, stock, df_or_dict, isTrading)
+                    symbolsLoaded += 1
+                progressbar(1.0)
+            # Remove the progress bar now!
+            sys.stdout.write("\x1b[1A")  # cursor up one line
+            sys.stdout.write("\x1b[2K")  # delete the last line
+        except Exception as e:
+            # Let the regular (full) download take over
+            default_logger().debug(e, exc_info=True)
+            return False
+        default_logger().debug(f"Streamed {symbolsLoaded} symbols from {streamFile}")
+        return symbolsLoaded > 0
+
     def loadDataFromLocalPickle(stockDict, configManager, downloadOnly, defaultAnswer, exchangeSuffix, cache_file, isTrading):
         stockDataLoaded = False
         srcFilePath = os.path.join(Archiver.get_user_outputs_dir(), cache_file)
@@ -980,42 +1173,9 @@ class tools:
                             + colorText.END
                         )
                 if stockData is not None and len(stockData) > 0:
-                    multiIndex = stockData.keys()
-                    if isinstance(multiIndex, pd.MultiIndex):
-                            # If we requested for multiple stocks from yfinance
-                            # we'd have received a multiindex dataframe
-                        listStockCodes = multiIndex.get_level_values(0)
-                        listStockCodes = sorted(list(filter(None,list(set(listStockCodes)))))
-                        if len(listStockCodes) > 0 and len(exchangeSuffix) > 0 and exchangeSuffix in listStockCodes[0]:
-                            listStockCodes = [x.replace(exchangeSuffix,"") for x in listStockCodes]
-                    else:
-                        listStockCodes = list(stockData.keys())
-                        if len(listStockCodes) > 0 and len(exchangeSuffix) > 0 and exchangeSuffix in listStockCodes[0]:
-                            listStockCodes = [x.replace(exchangeSuffix,"") for x in listStockCodes]
-                    for stock in listStockCodes:
-                        df_or_dict = stockData.get(stock)
-                        df_or_dict = df_or_dict.to_dict("split") if isinstance(df_or_dict,pd.DataFrame) else df_or_dict
-                            # This will keep all the latest security data we downloaded
-                            # just now and also copy the additional data like, MF/FII,FairValue
-                            # etc. data, from yesterday's saved data.
-                        try:
-                            existingPreLoadedData = stockDict.get(stock)
-                            if existingPreLoadedData is not None:
-                                if isTrading:
-                                        # Only copy the MF/FII/FairValue data and leave the stock prices as is.
-                                    cols = ["MF", "FII","MF_Date","FII_Date","FairValue"]
-                                    for col in cols:
-                                        existingPreLoadedData[col] = df_or_dict.get(col)
-                                    stockDict[stock] = existingPreLoadedData
-                                else:
-                                    stockDict[stock] = df_or_dict | existingPreLoadedData
-                            else:
-                                if not isTrading:
-                                    stockDict[stock] = df_or_dict
-                        except:
-                                # Probably, the "stock" got removed from the latest download
-                                # and so, was not found in stockDict
-                            continue
+                    tools.mergeStockDataFromCache(stockDict, stockData, exchangeSuffix, isTrading)
+                    if PKCacheManifest.entryFor(srcFilePath) is None:
+                        PKCacheManifest.record(srcFilePath, stockData=stockData)
                     # if len(stockDict) > 0:
                     #     stockDict = stockDict | stockData
                     # else:
@@ -1024,6 +1184,7 @@ class tools:
             except pickle.UnpicklingError as e:
                 default_logger().debug(e, exc_info=True)
                 f.close()
+                PKCacheManifest.forget(srcFilePath)
                 OutputControls().printOutput(
                         colorText.FAIL
                         + "[+] Error while Reading Stock Cache."
@@ -1034,6 +1195,7 @@ class tools:
             except EOFError as e:  # pragma: no cover
                 default_logger().debug(e, exc_info=True)
                 f.close()
+                PKCacheManifest.forget(srcFilePath)
                 OutputControls().printOutput(
                         colorText.FAIL
                         + "[+] Stock Cache Corrupted."
@@ -1074,6 +1236,8 @@ class tools:
                     'user-agent': f'{random_user_agent()}' 
                     #'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36
             }
+        if tools.streamSavedDataFromServer(stockDict, cache_file, exchangeSuffix, isTrading, headers=headers):
+            return stockDict, True
         resp = fetcher.fetchURL(cache_url, headers=headers, stream=True)
         if resp is not None:
             default_logger().debug(
@@ -1110,49 +1274,12 @@ class tools:
                         ) as f:
                         stockData = pickle.load(f)
                     if len(stockData) > 0:
-                        multiIndex = stockData.keys()
-                        if isinstance(multiIndex, pd.MultiIndex):
-                                # If we requested for multiple stocks from yfinance
-                                # we'd have received a multiindex dataframe
-                            listStockCodes = multiIndex.get_level_values(0)
-                            listStockCodes = sorted(list(filter(None,list(set(listStockCodes)))))
-                            if len(listStockCodes) > 0 and len(exchangeSuffix) > 0 and exchangeSuffix in listStockCodes[0]:
-                                listStockCodes = [x.replace(exchangeSuffix,"") for x in listStockCodes]
-                        else:
-                            listStockCodes = list(stockData.keys())
-                            if len(listStockCodes) > 0 and len(exchangeSuffix) > 0 and exchangeSuffix in listStockCodes[0]:
-                                listStockCodes = [x.replace(exchangeSuffix,"") for x in listStockCodes]
-                        for stock in listStockCodes:
-                            df_or_dict = stockData.get(stock)
-                            df_or_dict = df_or_dict.to_dict("split") if isinstance(df_or_dict,pd.DataFrame) else df_or_dict
-                                # This will keep all the latest security data we downloaded
-                                # just now and also copy the additional data like, MF/FII,FairValue
-                                # etc. data, from yesterday's saved data.
-                            try:
-                                existingPreLoadedData = stockDict.get(stock)
-                                if existingPreLoadedData is not None:
-                                    if isTrading:
-                                            # Only copy the MF/FII/FairValue data and leave the stock prices as is.
-                                        cols = ["MF", "FII","MF_Date","FII_Date","FairValue"]
-                                        for col in cols:
-                                            existingPreLoadedData[col] = df_or_dict.get(col)
-                                        stockDict[stock] = existingPreLoadedData
-                                    else:
-                                        stockDict[stock] = df_or_dict | existingPreLoadedData
-                                else:
-                                    if not isTrading:
-                                        stockDict[stock] = df_or_dict
-                            except:
-                                    # Probably, the "stock" got removed from the latest download
-                                    # and so, was not found in stockDict
-                                continue
+                        tools.mergeStockDataFromCache(stockDict, stockData, exchangeSuffix, isTrading)
                         stockDataLoaded = True
-                        copyFilePath = os.path.join(Archiver.get_user_outputs_dir(), f"copy_{cache_file}")
                         srcFilePath = os.path.join(Archiver.get_user_outputs_dir(), cache_file)
-                        if os.path.exists(copyFilePath) and os.path.exists(srcFilePath):
-                            shutil.copy(copyFilePath,srcFilePath) # copy is the saved source of truth
-                        if not os.path.exists(copyFilePath) and os.path.exists(srcFilePath): # Let's make a copy of the original one
-                            shutil.copy(srcFilePath,copyFilePath)
+                        # The freshly downloaded file becomes the saved source of truth
+                        PKCacheManifest.record(srcFilePath, stockData=stockData)
+                        PKCacheManifest.backup(srcFilePath, overwrite=True)
                         # Remove the progress bar now!
                         sys.stdout.write("\x1b[1A")  # cursor up one line
                         sys.stdout.write("\x1b[2K")  # delete the last line
@@ -101,6 +101,11 @@ from pkscreener.classes.PKTask import PKTask
 from pkscreener.classes.PKScheduler import PKScheduler
 from pkscreener.classes.PKScanRunner import PKScanRunner
 from pkscreener.classes.PKMarketOpenCloseAnalyser import PKMarketOpenCloseAnalyser
+from pkscreener.classes.PKIntradayTopUp import PKIntradayTopUp
+from pkscreener.classes.PKDownloadPipeline import PKDownloadPipeline
+from pkscreener.classes.PKFundamentalsStore import PKFundamentalsStore
+from pkscreener.classes.PKConstituentsCache import PKConstituentsCache
+from pkscreener.classes.PKVectorizedScreener import PKVectorizedScreener
 
 if __name__ == '__main__':
     multiprocessing.freeze_support()
@@ -819,7 +824,7 @@ def refreshStockData(startupoptions=None):
     if indexOption == 0:
         listStockCodes = handleRequestForSpecificStocks(options,indexOption=indexOption)
     listStockCodes = prepareStocksForScreening(testing=False, downloadOnly=False, listStockCodes=listStockCodes,indexOption=indexOption)
-    stockDictPrimary,stockDictSecondary = loadDatabaseOrFetch(downloadOnly=False, listStockCodes=listStockCodes, menuOption=menuOption,indexOption=indexOption)
+    stockDictPrimary,stockDictSecondary = loadDatabaseOrFetch(downloadOnly=False, listStockCodes=listStockCodes, menuOption=menuOption,indexOption=indexOption,topUpSecondary=True)
     PKScanRunner.refreshDatabase(consumers,stockDictPrimary,stockDictSecondary)
 
 def closeWorkersAndExit():
@@ -1686,6 +1691,12 @@ def main(userArgs=None,optionalFinalOutcome_df=None):
             )
             if not configManager.isIntradayConfig():
                 fetcher.saveAllNSEIndices()
+            if menuOption in ["X"] and not testing:
+                # Fundamentals for the whole universe in one go, before the workers look them up
+                PKFundamentalsStore.refresh(listStockCodes, screener, exchangeName="NASDAQ" if (indexOption == 15 or (configManager.defaultIndex == 15 and indexOption == 0)) else "INDIA")
+        elif menuOption in ["X"] and not testing:
+            # The stale ones get refreshed while we scan, for the next runs
+            PKFundamentalsStore.refreshInBackground(listStockCodes, screener, exchangeName="NASDAQ" if (indexOption == 15 or (configManager.defaultIndex == 15 and indexOption == 0)) else "INDIA")
         if menuOption.upper() in ["B", "G"]:
             OutputControls().printOutput(
                     colorText.WARN
@@ -1734,6 +1745,9 @@ def main(userArgs=None,optionalFinalOutcome_df=None):
                 if actualHistoricalDuration >= 0:
                     progressbar()
         OutputControls().moveCursorUpLines(1 if userPassedArgs.monitor else 2)    #sys.stdout.write(f"\x1b[1A") # Replace the download progress bar and start writing on the same line
+        if not keyboardInterruptEventFired and PKVectorizedScreener.isApplicable(configManager, menuOption, userPassedArgs, newlyListedOnly, downloadOnly):
+            # Stocks that can't meet the criteria are left out in one pass over all of them
+            items = PKVectorizedScreener(configManager).prefilter(items, stockDictPrimary)
         if not keyboardInterruptEventFired:
             global tasks_queue, results_queue, consumers, logging_queue
             screenResults, saveResults, backtest_df, tasks_queue, results_queue, consumers,logging_queue = PKScanRunner.runScanWithParams(userPassedArgs,keyboardInterruptEvent,screenCounter,screenResultsCounter,stockDictPrimary,stockDictSecondary,testing, backtestPeriod, menuOption,executeOption, samplingDuration, items,screenResults, saveResults, backtest_df,scanningCb=runScanners,tasks_queue=tasks_queue, results_queue=results_queue, consumers=consumers,logging_queue=logging_queue)
@@ -2097,9 +2111,18 @@ def analysisFinalResults(screenResults,saveResults,optionalFinalOutcome_df,runOp
         analysis_dict[firstScanKey] = {"S1": screenResults, "S2": saveResults}
     return optionalFinalOutcome_df, saveResults
 
-def loadDatabaseOrFetch(downloadOnly, listStockCodes, menuOption, indexOption): 
+def loadDatabaseOrFetch(downloadOnly, listStockCodes, menuOption, indexOption, topUpSecondary=False): 
     global stockDictPrimary,stockDictSecondary, configManager, defaultAnswer, userPassedArgs, loadedStockData
-    if menuOption not in ["C"]:
+    if menuOption not in ["C"] and PKDownloadPipeline.isApplicable(configManager, menuOption, downloadOnly=downloadOnly, userPassedArgs=userPassedArgs):
+        # Screening starts with the first downloaded batch instead of after the whole download
+        PKScanRunner.downloadPipeline = Utility.tools.pipelineStockData(
+                    stockDictPrimary,
+                    configManager,
+                    stockCodes = listStockCodes,
+                    exchangeSuffix = "" if (indexOption == 15 or (configManager.defaultIndex == 15 and indexOption == 0)) else ".NS"
+            )
+        stockDictPrimary = PKScanRunner.downloadPipeline.stockDict
+    elif menuOption not in ["C"]:
         stockDictPrimary = Utility.tools.loadStockData(
                     stockDictPrimary,
                     configManager,
@@ -2114,18 +2137,23 @@ def loadDatabaseOrFetch(downloadOnly, listStockCodes, menuOption, indexOption):
         prevDuration = configManager.duration
         candleDuration = (userPassedArgs.intraday if (userPassedArgs is not None and userPassedArgs.intraday is not None) else ("1m" if configManager.duration.endswith("d") else configManager.duration))
         configManager.toggleConfig(candleDuration=candleDuration,clearCache=False)
-        # We also need to load the intraday data to be able to calculate intraday RSI
-        stockDictSecondary = Utility.tools.loadStockData(
-                        stockDictSecondary,
-                        configManager,
-                        downloadOnly=downloadOnly,
-                        defaultAnswer=defaultAnswer,
-                        forceLoad=(menuOption in ["X", "B", "G", "S"]),
-                        stockCodes = listStockCodes,
-                        isIntraday=True,
-                        exchangeSuffix = "" if (indexOption == 15 or (configManager.defaultIndex == 15 and indexOption == 0)) else ".NS",
-                        userDownloadOption = menuOption
-                )
+        if topUpSecondary and PKIntradayTopUp.isApplicable(configManager) and stockDictSecondary is not None and len(stockDictSecondary) > 0:
+            # Only fetch the candles since the last refresh
+            PKIntradayTopUp.topUp(stockDictSecondary, listStockCodes, configManager,
+                                  exchangeSuffix = "" if (indexOption == 15 or (configManager.defaultIndex == 15 and indexOption == 0)) else ".NS")
+        else:
+            # We also need to load the intraday data to be able to calculate intraday RSI
+            stockDictSecondary = Utility.tools.loadStockData(
+                            stockDictSecondary,
+                            configManager,
+                            downloadOnly=downloadOnly,
+                            defaultAnswer=defaultAnswer,
+                            forceLoad=(menuOption in ["X", "B", "G", "S"]),
+                            stockCodes = listStockCodes,
+                            isIntraday=True,
+                            exchangeSuffix = "" if (indexOption == 15 or (configManager.defaultIndex == 15 and indexOption == 0)) else ".NS",
+                            userDownloadOption = menuOption
+                    )
         configManager.toggleConfig(candleDuration=prevDuration, clearCache=False)
     loadedStockData = True
     return stockDictPrimary, stockDictSecondary
@@ -2358,13 +2386,22 @@ def prepareStocksForScreening(testing, downloadOnly, listStockCodes, indexOption
         if indexOption >= 0 and indexOption <= 14:
             shouldSuppress = not OutputControls().enableMultipleLineOutput
             with SuppressOutput(suppress_stderr=shouldSuppress, suppress_stdout=shouldSuppress):
-                listStockCodes = fetcher.fetchStockCodes(
-                                indexOption, stockCode=None
-                            )
+                if indexOption > 0 and not testing:
+                    # Constituents barely change. Let's not ask NSE on every run.
+                    listStockCodes = PKConstituentsCache().fetch(f"NSE:{indexOption}", lambda: fetcher.fetchStockCodes(indexOption, stockCode=None))
+                    if configManager.shuffleEnabled and listStockCodes is not None:
+                        random.shuffle(listStockCodes)
+                else:
+                    listStockCodes = fetcher.fetchStockCodes(
+                                    indexOption, stockCode=None
+                                )
         elif indexOption == 15:
             OutputControls().printOutput("[+] Getting Stock Codes From NASDAQ... ", end="")
             nasdaq = PKNasdaqIndexFetcher(configManager)
-            listStockCodes,_ = nasdaq.fetchNasdaqIndexConstituents()
+            if testing:
+                listStockCodes,_ = nasdaq.fetchNasdaqIndexConstituents()
+            else:
+                listStockCodes = PKConstituentsCache().fetch("NASDAQ", lambda: nasdaq.fetchNasdaqIndexConstituents()[0]) or []
             if len(listStockCodes) > 10:
                 OutputControls().printOutput(
                     colorText.GREEN
@@ -266,7 +266,8 @@ def test_fetchStockData_positive(configManager, tools_instance):
             rounding=True,
             group_by='ticker', 
             start=None, 
-            end=None
+            end=None,
+            session=None
         )
 
 
@@ -287,7 +288,8 @@ def test_fetchStockData_negative(configManager, tools_instance):
             rounding=True,
             group_by='ticker', 
             start=None, 
-            end=None
+            end=None,
+            session=None
         )
         yfd_df = pd.DataFrame({"A":[1,2,3]})
         mock_download.return_value = yfd_df
@@ -599,3 +601,28 @@ def test_postURL_retry_enable_cache_uninstall(tools_instance, configManager):
 #                         mock_restart_cache.assert_not_called()
 #                         mock_uninstall_cache.assert_not_called()
 #                         mock_clear_cache.assert_not_called()
+
+
+def test_yfinanceSession(configManager, tools_instance):
+    session = object()
+    with patch("pkscreener.classes.Fetcher.screenerStockDataFetcher.transportSession", return_value=session):
+        with patch("yfinance.data.requests", new=MagicMock(__name__="requests")):
+            assert tools_instance.yfinanceSession() is session
+        # curl_cffi based yfinance can't use the requests session with the transport adapter
+        with patch("yfinance.data.requests", new=MagicMock(__name__="curl_cffi.requests")):
+            assert tools_instance.yfinanceSession() is None
+    with patch("pkscreener.classes.Fetcher.screenerStockDataFetcher.transportSession", return_value=None):
+        assert tools_instance.yfinanceSession() is None
+
+def test_fetchStockData_stays_off_the_network_when_replaying(configManager, tools_instance, tmp_path):
+    from pkscreener.classes.PKRecordReplayTransport import PKRecordReplayTransport
+    session = MagicMock()
+    session.get_adapter.return_value = PKRecordReplayTransport(PKRecordReplayTransport.REPLAY, directory=str(tmp_path))
+    with patch("pkscreener.classes.Fetcher.screenerStockDataFetcher.transportSession", return_value=session), \
+         patch("yfinance.data.requests", new=MagicMock(__name__="curl_cffi.requests")), \
+         patch("yfinance.download") as mock_download:
+        assert tools_instance.replaysWithoutYfinance()
+        assert tools_instance.fetchStockData("SBIN", "1y", "1d").empty
+        mock_download.assert_not_called()
+        session.get_adapter.return_value = PKRecordReplayTransport(PKRecordReplayTransport.RECORD, directory=str(tmp_path))
+        assert not tools_instance.replaysWithoutYfinance()
@@ -0,0 +1,152 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKAsyncDownloader import PKAsyncDownloader
+from pkscreener.classes.PKDownloadController import PKDownloadController
+
+def chartPayload(symbol, timestamps, closes):
+    return {"chart": {"result": [{"meta": {"symbol": symbol, "exchangeTimezoneName": "Asia/Kolkata"},
+                                  "timestamp": timestamps,
+                                  "indicators": {"quote": [{"open": closes, "high": closes, "low": closes, "close": closes, "volume": [100] * len(closes)}],
+                                                 "adjclose": [{"adjclose": closes}]}}],
+                      "error": None}}
+
+# 2024-01-01 and 2024-01-02 09:15 IST
+TIMESTAMPS = [1704080700, 1704167100]
+
+@pytest.fixture
+def chartServer():
+    class ChartHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        requests = []
+        def do_GET(self):
+            ChartHandler.requests.append(self.path)
+            symbol = self.path.split("?")[0].split("/")[-1]
+            if symbol == "SBIN.NS":
+                body, status = json.dumps(chartPayload(symbol, TIMESTAMPS, [600.123, 601.0])).encode(), 200
+            elif symbol.startswith("BUSY"):
+                body, status = b"Too Many Requests", 429
+            else:
+                body, status = json.dumps({"chart": {"result": None, "error": {"code": "Not Found"}}}).encode(), 404
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args):
+            pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChartHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v8/finance/chart/", ChartHandler.requests
+    server.shutdown()
+
+def test_decodeChart():
+    splitDict = PKAsyncDownloader.decodeChart(json.dumps(chartPayload("SBIN.NS", TIMESTAMPS, [600.123, None])), "1d")
+    # Candles without prices are dropped and daily candles are stamped with their date
+    assert splitDict["columns"] == PKAsyncDownloader.COLUMNS
+    assert splitDict["index"] == [pd.Timestamp("2024-01-01")]
+    assert splitDict["data"] == [[600.12, 600.12, 600.12, 600.12, 600.12, 100.0]]
+    assert splitDict["schema"] == 1
+    intraday = PKAsyncDownloader.decodeChart(chartPayload("SBIN.NS", TIMESTAMPS, [1.0, 2.0]), "5m")
+    assert intraday["index"][0] == pd.Timestamp("2024-01-01 09:15")
+    assert PKAsyncDownloader.decodeChart({"chart": {"result": None}}) is None
+
+def test_tickerFor():
+    assert PKAsyncDownloader.tickerFor("SBIN") == "SBIN.NS"
+    assert PKAsyncDownloader.tickerFor("SBIN.NS") == "SBIN.NS"
+    assert PKAsyncDownloader.tickerFor("^NSEI") == "^NSEI"
+    assert PKAsyncDownloader.tickerFor("SBIN", "") == "SBIN"
+
+def test_download(chartServer):
+    baseUrl, requests = chartServer
+    with patch.object(PKAsyncDownloader, "serverBaseUrl", baseUrl):
+        downloaded, leftOutStocks = PKAsyncDownloader.download(["SBIN", "TCS", "SBIN"], "1y", "1d", concurrency=4)
+    assert list(downloaded.keys()) == ["SBIN"] and leftOutStocks == ["TCS"]
+    assert downloaded["SBIN"]["index"] == [pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-02")]
+    assert len(requests) == 2 and "range=1y" in requests[0] and "interval=1d" in requests[0]
+
+def test_downloadLatestData(chartServer):
+    from pkscreener.classes.ConfigManager import tools as ConfigTools
+    from pkscreener.classes.Utility import tools
+    configManager = ConfigTools()
+    # The async downloader is opt-in
+    concurrency = configManager.asyncDownloadConcurrency
+    configManager.asyncDownloadConcurrency = 4
+    stockDict = {}
+    try:
+        with patch.object(PKAsyncDownloader, "serverBaseUrl", chartServer[0]):
+            stockDict, leftOutStocks = tools.downloadLatestData(stockDict, configManager, ["SBIN", "TCS"])
+    finally:
+        configManager.asyncDownloadConcurrency = concurrency
+    assert list(stockDict.keys()) == ["SBIN"] and leftOutStocks == ["TCS"]
+
+def test_downloadLatestData_sizes_scheduler_batches_by_the_controller():
+    from pkscreener.classes.ConfigManager import tools as ConfigTools
+    from pkscreener.classes.PKScheduler import PKScheduler
+    from pkscreener.classes.Utility import tools
+    configManager = ConfigTools()
+    concurrency = configManager.asyncDownloadConcurrency
+    configManager.asyncDownloadConcurrency = 0
+    controller = PKDownloadController(maxConcurrency=2, timeout=3)
+    def scheduleTasks(tasksList=[], timeout=6, **kwargs):
+        scheduled.append((len(tasksList), timeout))
+        for task in tasksList:
+            task.result = {f"{stock}.NS": pd.DataFrame({"Close": [1.0]}) for stock in task.userData if stock != "TCS"}
+    scheduled = []
+    stocks = [f"STOCK{n}" for n in range(20)] + ["TCS"]
+    try:
+        with patch.object(PKDownloadController, "sharedFor", return_value=controller), \
+             patch.object(PKScheduler, "workerCount", return_value=2), \
+             patch.object(PKScheduler, "scheduleTasks", side_effect=scheduleTasks):
+            stockDict, leftOutStocks = tools.downloadLatestData({}, configManager, stocks)
+    finally:
+        configManager.asyncDownloadConcurrency = concurrency
+    # Batches of controller.batchSize() (8) stocks, two rounds of them on two workers
+    assert scheduled == [(3, 5 + 3 * 2)]
+    assert len(stockDict) == 20 and leftOutStocks == ["TCS"]
+    assert controller.batches == 1
+
+def test_download_backs_off_when_throttled(chartServer):
+    baseUrl, requests = chartServer
+    controller = PKDownloadController(maxConcurrency=8, timeout=2)
+    with patch.object(PKAsyncDownloader, "serverBaseUrl", baseUrl):
+        downloaded, leftOutStocks = PKAsyncDownloader.download(["SBIN"] + [f"BUSY{n}" for n in range(7)], "1y", "1d", controller=controller)
+    assert list(downloaded.keys()) == ["SBIN"] and len(leftOutStocks) == 7
+    assert controller.batches == 1 and controller.concurrency == controller.minConcurrency
+
+def test_download_replays_recordings(chartServer, tmp_path):
+    from pkscreener.classes.PKRecordReplayTransport import PKRecordReplayTransport
+    baseUrl, requests = chartServer
+    with patch.object(PKAsyncDownloader, "serverBaseUrl", baseUrl):
+        recorded, _ = PKAsyncDownloader.download(["SBIN", "TCS"], "1y", "1d", adapter=PKRecordReplayTransport(PKRecordReplayTransport.RECORD, directory=tmp_path))
+        replayed, leftOutStocks = PKAsyncDownloader.download(["SBIN", "TCS"], "1y", "1d", adapter=PKRecordReplayTransport(PKRecordReplayTransport.REPLAY, directory=tmp_path))
+    assert replayed == recorded and leftOutStocks == ["TCS"]
+    assert len(requests) == 2
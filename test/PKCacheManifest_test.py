@@ -0,0 +1,102 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import os
+import pickle
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKCacheManifest import PKCacheManifest
+
+@pytest.fixture
+def cacheFile(tmp_path):
+    stockData = {"SBIN": pd.DataFrame({"Close": [1.0, 2.0]}, index=pd.date_range("2024-01-01", periods=2)).to_dict("split")}
+    filePath = os.path.join(tmp_path, "stock_data_020124.pkl")
+    with open(filePath, "wb") as f:
+        pickle.dump(stockData, f)
+    PKCacheManifest.record(filePath, stockData=stockData)
+    return filePath
+
+def corrupt(filePath, truncate=False):
+    with open(filePath, "r+b") as f:
+        if truncate:
+            f.truncate(10)
+        else:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"\x00")
+
+def test_record(cacheFile):
+    entry = PKCacheManifest.entryFor(cacheFile)
+    assert entry["rows"] == 1
+    assert entry["dataDate"] == "2024-01-02"
+    assert entry["size"] == os.stat(cacheFile).st_size
+    assert entry["sha256"] == PKCacheManifest.checksum(cacheFile)
+
+def test_isValid(cacheFile, tmp_path):
+    with patch.object(PKCacheManifest, "checksum") as mock_checksum:
+        assert PKCacheManifest.isValid(cacheFile)
+        mock_checksum.assert_not_called()
+    os.utime(cacheFile, ns=(0, 0))
+    assert PKCacheManifest.isValid(cacheFile)
+    assert PKCacheManifest.entryFor(cacheFile)["mtime"] == 0
+    corrupt(cacheFile)
+    assert not PKCacheManifest.isValid(cacheFile)
+    unknownFile = os.path.join(tmp_path, "stock_data_030124.pkl")
+    open(unknownFile, "wb").close()
+    assert PKCacheManifest.isValid(unknownFile)
+    assert not PKCacheManifest.isValid(unknownFile, allowUnknown=False)
+    assert not PKCacheManifest.isValid(os.path.join(tmp_path, "missing.pkl"))
+
+def test_backup_and_restore(cacheFile):
+    copyFilePath = PKCacheManifest.backup(cacheFile)
+    assert copyFilePath == PKCacheManifest.copyPathFor(cacheFile)
+    # Nothing gets copied around while both are intact and identical
+    with patch("shutil.copy") as mock_copy:
+        assert PKCacheManifest.backup(cacheFile) == copyFilePath
+        assert PKCacheManifest.restore(cacheFile)
+        mock_copy.assert_not_called()
+    corrupt(cacheFile, truncate=True)
+    assert PKCacheManifest.restore(cacheFile)
+    assert PKCacheManifest.checksum(cacheFile) == PKCacheManifest.checksum(copyFilePath)
+    assert PKCacheManifest.isValid(cacheFile, allowUnknown=False)
+
+def test_restore_keeps_newer_saved_file(cacheFile):
+    copyFilePath = PKCacheManifest.backup(cacheFile)
+    # A later save writes (and records) newer data without refreshing the copy_
+    stockData = {"SBIN": pd.DataFrame({"Close": [1.0, 2.0, 3.0]}, index=pd.date_range("2024-01-01", periods=3)).to_dict("split")}
+    with open(cacheFile, "wb") as f:
+        pickle.dump(stockData, f)
+    PKCacheManifest.record(cacheFile, stockData=stockData)
+    with patch("shutil.copy") as mock_copy:
+        assert PKCacheManifest.restore(cacheFile)
+        mock_copy.assert_not_called()
+    assert PKCacheManifest.entryFor(cacheFile)["dataDate"] == "2024-01-03"
+    assert PKCacheManifest.checksum(cacheFile) != PKCacheManifest.checksum(copyFilePath)
+
+def test_restore_removes_corrupt_file_without_copy(cacheFile):
+    corrupt(cacheFile, truncate=True)
+    assert not PKCacheManifest.restore(cacheFile)
+    assert not os.path.exists(cacheFile)
+    assert PKCacheManifest.entryFor(cacheFile) is None
@@ -0,0 +1,144 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import copy
+import os
+import pickle
+from unittest.mock import Mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+from pkscreener.classes.PKStockDataSchema import PKStockDataSchema
+
+@pytest.fixture
+def stockDict():
+    index = pd.date_range("2024-01-01", periods=5, tz="Asia/Kolkata")
+    df = pd.DataFrame({"Open": np.arange(5.0), "Close": np.arange(5.0) + 1, "Volume": np.arange(5) * 100}, index=index)
+    return {
+        "SBIN": df.to_dict("split") | {"MF": 1.5, "MF_Date": "2024-01-01"},
+        "TCS": df[["Close", "Volume"]].to_dict("split"),
+        "BAD": 100,
+    }
+
+@pytest.fixture
+def store(stockDict, tmp_path):
+    storePath = os.path.join(tmp_path, "stock_data.pkcs")
+    PKColumnarStore.write(stockDict, storePath, cacheFile="stock_data_1.pkl", period="1y", duration="1d")
+    return PKColumnarStore.openForCacheFile("stock_data_1.pkl", storePath=storePath)
+
+def test_write_and_open(store):
+    assert store is not None
+    assert sorted(list(store)) == ["SBIN", "TCS"]
+    assert len(store) == 2
+    assert "BAD" not in store
+
+def test_frame(store):
+    df = store.frame("SBIN")
+    assert df.index.name == "Date"
+    assert list(df.columns) == ["Open", "Close", "Volume"]
+    assert df["Close"].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+    # Prices as they're stored, volumes with NaN for the missing ones
+    assert [str(dtype) for dtype in df.dtypes] == ["float32", "float32", "float64"]
+    assert [str(dtype) for dtype in PKStockDataSchema.forIndicators(df).dtypes] == ["float64"] * 3
+    # Stored in the compact dtypes
+    assert [fieldArray.dtype for fieldArray in store._fieldArrays] == [np.float32, np.float32, np.uint64]
+    assert str(df.index.tz) == "Asia/Kolkata"
+    assert store.frame("UNKNOWN") is None
+
+def test_frame_is_copy_on_write(store):
+    df = store.frame("SBIN")
+    df.loc[df.index[0], "Open"] = 99
+    reopened = PKColumnarStore(store.storePath)
+    assert reopened.frame("SBIN")["Open"].iloc[0] == 0
+
+def test_split_dict_compatibility(store, stockDict):
+    splitDict = store["SBIN"]
+    assert splitDict["columns"] == stockDict["SBIN"]["columns"]
+    assert splitDict["data"] == [[float(x) for x in row] for row in stockDict["SBIN"]["data"]]
+    assert splitDict["MF"] == 1.5
+    assert store.extrasFor("TCS") == {}
+
+def test_overlay(store):
+    store["NEW"] = {"index": [1], "columns": ["Close"], "data": [[1.0]]}
+    assert "NEW" in store and len(store) == 3
+    assert store.frame("NEW")["Close"].iloc[0] == 1.0
+    del store["SBIN"]
+    assert "SBIN" not in store and len(store) == 2
+    with pytest.raises(KeyError):
+        store["SBIN"]
+
+def test_copy_pickle(store):
+    assert isinstance(store.copy(), dict)
+    assert isinstance(copy.deepcopy(store), dict)
+    unpickled = pickle.loads(pickle.dumps(store))
+    assert isinstance(unpickled, PKColumnarStore)
+    assert unpickled.frame("TCS").equals(store.frame("TCS"))
+
+def test_openForCacheFile_validates(store):
+    configManager = Mock()
+    configManager.period = "1y"
+    configManager.duration = "1d"
+    assert PKColumnarStore.openForCacheFile("stock_data_1.pkl", configManager, storePath=store.storePath) is not None
+    assert PKColumnarStore.openForCacheFile("stock_data_2.pkl", configManager, storePath=store.storePath) is None
+    configManager.duration = "5m"
+    assert PKColumnarStore.openForCacheFile("stock_data_1.pkl", configManager, storePath=store.storePath) is None
+    assert PKColumnarStore.openForCacheFile("stock_data_1.pkl", storePath=f"{store.storePath}.missing") is None
+
+def test_write_empty(tmp_path):
+    assert PKColumnarStore.write({"A": 1}, os.path.join(tmp_path, "s.pkcs")) is None
+
+def test_appendJournal_new_and_corrected_candles(store, stockDict):
+    index = pd.date_range("2024-01-01", periods=6, tz="Asia/Kolkata")
+    df = pd.DataFrame({"Open": np.arange(6.0), "Close": np.arange(6.0) + 1, "Volume": np.arange(6) * 100}, index=index)
+    df.loc[index[4], "Close"] = 50.0
+    updated = {"SBIN": df.to_dict("split") | {"MF": 2.5}, "TCS": stockDict["TCS"], "INFY": df.to_dict("split")}
+    assert PKColumnarStore.appendJournal(updated, store.storePath, cacheFile="stock_data_2.pkl", period="1y", duration="1d") == store.storePath
+    segments = PKColumnarStore.journalSegmentsFor(store.storePath)
+    assert len(segments) == 1
+    reopened = PKColumnarStore(store.storePath)
+    assert reopened.cacheFile == "stock_data_2.pkl"
+    assert sorted(list(reopened)) == ["INFY", "SBIN", "TCS"]
+    assert reopened.frame("SBIN")["Close"].tolist() == [1.0, 2.0, 3.0, 4.0, 50.0, 6.0]
+    assert reopened["SBIN"]["MF"] == 2.5
+    assert reopened.frame("TCS").equals(store.frame("TCS"))
+    # Compaction folds the journal back into the arrays
+    PKColumnarStore.compact(store.storePath)
+    assert len(PKColumnarStore.journalSegmentsFor(store.storePath)) == 0
+    # The older arrays were swapped out and removed
+    assert not os.path.exists(f"{store.storePath}.old")
+    compacted = PKColumnarStore.openForCacheFile("stock_data_2.pkl", storePath=store.storePath)
+    assert compacted.frame("SBIN")["Close"].tolist() == [1.0, 2.0, 3.0, 4.0, 50.0, 6.0]
+    assert len(compacted._journalFrames) == 0
+
+def test_appendJournal_replaces_revised_history(store):
+    index = pd.date_range("2024-01-01", periods=5, tz="Asia/Kolkata")
+    df = pd.DataFrame({"Open": np.arange(5.0) / 2, "Close": np.arange(5.0), "Volume": np.arange(5) * 100}, index=index)
+    PKColumnarStore.appendJournal({"SBIN": df.to_dict("split")}, store.storePath, cacheFile="stock_data_1.pkl", period="1y", duration="1d")
+    reopened = PKColumnarStore(store.storePath)
+    assert reopened.frame("SBIN")["Open"].tolist() == (np.arange(5.0) / 2).tolist()
+
+def test_appendJournal_without_store(tmp_path, stockDict):
+    assert PKColumnarStore.appendJournal(stockDict, os.path.join(tmp_path, "missing.pkcs"), period="1y", duration="1d") is None
@@ -0,0 +1,58 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import os
+import time
+from unittest.mock import MagicMock
+
+from pkscreener.classes.PKConstituentsCache import PKConstituentsCache
+
+SYMBOLS = [f"STOCK{i}" for i in range(20)]
+
+def test_fetch_uses_fresh_snapshot(tmp_path):
+    filePath = os.path.join(tmp_path, PKConstituentsCache.FILE_NAME)
+    fetchFn = MagicMock(return_value=SYMBOLS)
+    assert PKConstituentsCache(filePath).fetch("NSE:12", fetchFn) == SYMBOLS
+    # A new instance reads the saved snapshot instead of fetching again
+    assert PKConstituentsCache(filePath).fetch("NSE:12", fetchFn) == SYMBOLS
+    assert fetchFn.call_count == 1
+
+def test_fetch_refreshes_stale_snapshot(tmp_path):
+    cache = PKConstituentsCache(os.path.join(tmp_path, PKConstituentsCache.FILE_NAME), ttlHours=1)
+    cache.put("NASDAQ", SYMBOLS, now=time.time() - 7200)
+    assert cache.fetch("NASDAQ", lambda: SYMBOLS[:15]) == SYMBOLS[:15]
+    assert cache.get("NASDAQ") == SYMBOLS[:15]
+
+def test_fetch_falls_back_to_stale_snapshot_on_failure(tmp_path):
+    cache = PKConstituentsCache(os.path.join(tmp_path, PKConstituentsCache.FILE_NAME), ttlHours=1)
+    cache.put("NSE:12", SYMBOLS, now=time.time() - 7200)
+    assert cache.fetch("NSE:12", MagicMock(side_effect=Exception("down"))) == SYMBOLS
+    # Failed fetches usually return a handful of symbols. Those are not saved.
+    assert cache.fetch("NSE:12", lambda: ["SBIN"]) == SYMBOLS
+    assert cache.get("NSE:12") is None
+
+def test_load_ignores_other_versions(tmp_path):
+    filePath = os.path.join(tmp_path, PKConstituentsCache.FILE_NAME)
+    with open(filePath, "w") as f:
+        f.write('{"version": 0, "indices": {"NSE:12": {"symbols": ["SBIN"], "fetchedOn": 0}}}')
+    assert PKConstituentsCache(filePath).indices == {}
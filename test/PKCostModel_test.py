@@ -0,0 +1,61 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import os
+
+from pkscreener.classes.PKCostModel import PKCostModel
+from pkscreener.classes.PKTaskBatch import PKBatchResults
+
+def itemsFor(stocks, executeOption=9, daysInPast=0):
+    return [tuple(["X", "INDIA", executeOption] + [None] * 9 + [stock] + [False, False, 2.5, False, None, daysInPast, 30, 0, True, None, None]) for stock in stocks]
+
+def test_costs_are_averaged_and_saved(tmp_path):
+    filePath = os.path.join(tmp_path, PKCostModel.FILE_NAME)
+    costModel = PKCostModel(filePath)
+    costModel.record("SBIN", 9, 1.0)
+    costModel.record("SBIN", 9, 2.0)
+    assert costModel.costFor("SBIN", 9) == 1.3
+    assert costModel.costFor("SBIN", 2) is None
+    costModel.save()
+    assert PKCostModel(filePath).costFor("SBIN", 9) == 1.3
+
+def test_worker_timings_are_recorded(tmp_path):
+    costModel = PKCostModel(os.path.join(tmp_path, PKCostModel.FILE_NAME))
+    results = PKBatchResults(executeOption=9)
+    results.add("SBIN", None, 0.25)
+    costModel.recordResults(results)
+    # Plain answers have no timings
+    costModel.recordResults(None)
+    assert costModel.costFor("SBIN", 9) == 0.25
+
+def test_order_puts_the_most_expensive_stocks_first(tmp_path):
+    costModel = PKCostModel(os.path.join(tmp_path, PKCostModel.FILE_NAME))
+    items = itemsFor(["CHEAP", "NEW", "COSTLY"])
+    # Nothing to go by yet
+    assert costModel.order(items) == items
+    costModel.record("CHEAP", 9, 0.1)
+    costModel.record("COSTLY", 9, 2.0)
+    assert [item[12] for item in costModel.order(items)] == ["COSTLY", "NEW", "CHEAP"]
+    # Each backtest day keeps its stocks together
+    items = itemsFor(["CHEAP", "COSTLY"], daysInPast=1) + itemsFor(["CHEAP", "COSTLY"], daysInPast=2)
+    assert [(item[18], item[12]) for item in costModel.order(items)] == [(1, "COSTLY"), (1, "CHEAP"), (2, "COSTLY"), (2, "CHEAP")]
@@ -0,0 +1,69 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+from pkscreener.classes.PKDataService import PKDataService
+
+def fakeDownload(symbol):
+    if symbol == "DEAD":
+        raise ConnectionError("Not found")
+    return json.dumps({"info": {"symbol": symbol, "sector": "Financial Services"}})
+
+def test_getSymbolsAndSectorInfo_fetches_and_caches(tmp_path):
+    dataSvc = PKDataService(cacheFilePath=str(tmp_path / "info.json"))
+    with patch("PKNSETools.PKCompanyGeneral.initialize"), \
+         patch("PKNSETools.PKCompanyGeneral.download", side_effect=fakeDownload) as download:
+        stockDictList, leftOutStocks = dataSvc.getSymbolsAndSectorInfo(MagicMock(longTimeout=2), stockCodes=["SBIN", "TCS", "DEAD"])
+        assert [info["symbol"] for info in stockDictList] == ["SBIN", "TCS"] and leftOutStocks == ["DEAD"]
+        assert download.call_count == 3
+        # The next run only goes after the one that is missing
+        stockDictList, _ = PKDataService(cacheFilePath=str(tmp_path / "info.json")).getSymbolsAndSectorInfo(MagicMock(longTimeout=2), stockCodes=["SBIN", "TCS", "DEAD"])
+        assert len(stockDictList) == 2 and download.call_count == 4
+
+def test_stale_entries_are_revalidated(tmp_path):
+    dataSvc = PKDataService(cacheFilePath=str(tmp_path / "info.json"))
+    staleOn = time.time() - (PKDataService.CACHE_TTL_DAYS + 1) * 86400
+    dataSvc.saveCache({"SBIN": {"info": {"symbol": "SBIN", "sector": "Old"}, "fetchedOn": staleOn},
+                       "DEAD": {"info": {"symbol": "DEAD", "sector": "Old"}, "fetchedOn": staleOn}})
+    with patch("PKNSETools.PKCompanyGeneral.initialize"), \
+         patch("PKNSETools.PKCompanyGeneral.download", side_effect=fakeDownload):
+        stockDictList, leftOutStocks = dataSvc.getSymbolsAndSectorInfo(MagicMock(longTimeout=2), stockCodes=["SBIN", "DEAD"])
+    # DEAD could not be revalidated, so the older info is used
+    assert [info["sector"] for info in stockDictList] == ["Financial Services", "Old"] and leftOutStocks == []
+    assert dataSvc.loadCache()["SBIN"]["fetchedOn"] > staleOn
+
+def test_fetches_stop_at_the_deadline(tmp_path):
+    dataSvc = PKDataService(cacheFilePath=str(tmp_path / "info.json"))
+    def slowDownload(symbol):
+        if symbol == "SLOW":
+            time.sleep(1)
+        return fakeDownload(symbol)
+    with patch("PKNSETools.PKCompanyGeneral.initialize"), \
+         patch("PKNSETools.PKCompanyGeneral.download", side_effect=slowDownload):
+        startedAt = time.time()
+        stockDictList, leftOutStocks = dataSvc.getSymbolsAndSectorInfo(MagicMock(), stockCodes=["SBIN", "SLOW"], timeout=0.2)
+    assert time.time() - startedAt < 1
+    assert [info["symbol"] for info in stockDictList] == ["SBIN"] and leftOutStocks == ["SLOW"]
@@ -0,0 +1,95 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import functools
+import json
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKDeltaSync import PKDeltaSync
+
+def stockDictFor(days, adjust=1.0):
+    index = pd.date_range("2024-01-01", periods=days)
+    df = pd.DataFrame({"Close": np.arange(float(days)) * adjust, "Volume": np.ones(days)}, index=index)
+    return {"SBIN": df.to_dict("split") | {"MF": days}, "TCS": df.to_dict("split")}
+
+@pytest.fixture
+def published(tmp_path):
+    outputFolder = str(tmp_path)
+    day1, day2, day3 = stockDictFor(5), stockDictFor(6), stockDictFor(7)
+    day3["TCS"] = stockDictFor(7, adjust=0.5)["TCS"]  # e.g. split adjusted history
+    PKDeltaSync.publish(day2, day1, "stock_data_010124.pkl", "stock_data_020124.pkl", outputFolder, "1y", "1d")
+    PKDeltaSync.publish(day3, day2, "stock_data_020124.pkl", "stock_data_030124.pkl", outputFolder, "1y", "1d")
+    return outputFolder, day1, day3
+
+def test_cacheDate_and_names(tmp_path):
+    assert str(PKDeltaSync.cacheDate("stock_data_020124.pkl")) == "2024-01-02"
+    assert PKDeltaSync.cacheDate("intraday_stock_data_020124.pkl") is None
+    assert PKDeltaSync.cacheDate("copy_stock_data_020124.pkl") is None
+    assert PKDeltaSync.deltaFileNameFor("stock_data_020124.pkl") == "stock_data_delta_020124.json.gz"
+    for fileName in ["stock_data_301223.pkl", "stock_data_010124.pkl", "stock_data_030124.pkl", "copy_stock_data_020124.pkl"]:
+        open(os.path.join(tmp_path, fileName), "w").close()
+    assert PKDeltaSync.latestLocalCacheFile("stock_data_020124.pkl", str(tmp_path)) == "stock_data_010124.pkl"
+    assert PKDeltaSync.latestLocalCacheFile("stock_data_301223.pkl", str(tmp_path)) is None
+
+def test_publish_manifest(published):
+    outputFolder, _, _ = published
+    with open(os.path.join(outputFolder, PKDeltaSync.MANIFEST_FILE_NAME)) as f:
+        manifest = json.load(f)
+    assert [record["to"] for record in manifest["deltas"]] == ["stock_data_020124.pkl", "stock_data_030124.pkl"]
+    assert PKDeltaSync.deltaChain(manifest, "stock_data_010124.pkl", "stock_data_030124.pkl", "1y", "1d") == manifest["deltas"]
+    assert PKDeltaSync.deltaChain(manifest, "stock_data_010124.pkl", "stock_data_030124.pkl", "1y", "5m") is None
+    assert PKDeltaSync.deltaChain(manifest, "stock_data_311223.pkl", "stock_data_030124.pkl", "1y", "1d") is None
+
+def test_publish_trims_manifest(tmp_path):
+    with patch.object(PKDeltaSync, "MAX_DELTAS_IN_MANIFEST", 1):
+        PKDeltaSync.publish(stockDictFor(6), stockDictFor(5), "stock_data_010124.pkl", "stock_data_020124.pkl", str(tmp_path), "1y", "1d")
+        PKDeltaSync.publish(stockDictFor(7), stockDictFor(6), "stock_data_020124.pkl", "stock_data_030124.pkl", str(tmp_path), "1y", "1d")
+    assert not os.path.exists(os.path.join(tmp_path, "stock_data_delta_020124.json.gz"))
+    assert os.path.exists(os.path.join(tmp_path, "stock_data_delta_030124.json.gz"))
+
+@pytest.fixture
+def fileServer(published):
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=published[0])
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+def test_sync(fileServer, published):
+    from pkscreener.classes.Utility import fetcher
+    _, day1, day3 = published
+    with patch.object(PKDeltaSync, "serverBaseUrl", fileServer):
+        assert PKDeltaSync.sync(day1, "stock_data_010124.pkl", "stock_data_030124.pkl", fetcher, "1y", "1d")
+        for symbol in ["SBIN", "TCS"]:
+            assert day1[symbol]["data"] == day3[symbol]["data"]
+            assert list(day1[symbol]["index"]) == list(day3[symbol]["index"])
+        assert day1["SBIN"]["MF"] == 7
+        assert not PKDeltaSync.sync({}, "stock_data_311223.pkl", "stock_data_030124.pkl", fetcher, "1y", "1d")
@@ -0,0 +1,68 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from pkscreener.classes.PKDownloadController import PKDownloadController
+
+def test_slow_start_and_additive_increase():
+    controller = PKDownloadController(maxConcurrency=8, timeout=4)
+    assert controller.concurrency == 2 and controller.batchSize() == 8
+    for _ in range(10):
+        controller.record([0.1] * controller.concurrency, 1000 * controller.concurrency, 0, 0.1)
+    assert controller.concurrency == 8 and controller.batchSize() == 32
+
+def test_multiplicative_decrease_on_failures():
+    controller = PKDownloadController(maxConcurrency=32, timeout=4)
+    controller.concurrency = 20
+    controller.record([0.1] * 15, 15000, 5, 0.5)
+    assert controller.concurrency == 10
+    controller.record([0.1] * 10, 10000, 10, 0.5)
+    controller.record([0.1] * 10, 10000, 10, 0.5)
+    controller.record([0.1] * 10, 10000, 10, 0.5)
+    assert controller.concurrency == controller.minConcurrency
+
+def test_slow_requests_and_throughput_drop_back_off():
+    controller = PKDownloadController(maxConcurrency=32, timeout=4)
+    controller.concurrency = 16
+    controller.record([3.5] * 16, 16000, 0, 4)
+    assert controller.concurrency == 8
+    controller.record([0.1] * 8, 80000, 0, 0.1)
+    assert controller.concurrency == 9
+    # Same number of requests for a tenth of the bytes per second
+    controller.record([0.1] * 9, 9000, 0, 0.1)
+    assert controller.concurrency == 5
+
+def test_timeout_follows_latency():
+    controller = PKDownloadController(maxConcurrency=8, timeout=16, maxTimeout=30)
+    for _ in range(20):
+        controller.record([0.2, 0.2], 2000, 0, 0.2)
+    assert PKDownloadController.MIN_TIMEOUT <= controller.timeout < 2
+    for _ in range(20):
+        controller.record([40, 40], 2000, 0, 40)
+    assert controller.timeout == 30
+
+def test_sharedFor():
+    PKDownloadController.shared = None
+    controller = PKDownloadController.sharedFor(16)
+    assert PKDownloadController.sharedFor(16) is controller
+    assert PKDownloadController.sharedFor(8) is not controller
+    PKDownloadController.shared = None
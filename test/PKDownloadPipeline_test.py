@@ -0,0 +1,140 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import queue
+import threading
+from unittest.mock import MagicMock, patch
+
+from pkscreener.classes.PKAsyncDownloader import PKAsyncDownloader
+from pkscreener.classes.PKDownloadPipeline import PKDownloadPipeline
+from pkscreener.classes.PKScanRunner import PKScanRunner
+from pkscreener.classes.PKTaskBatch import PKBatchResults
+
+def configManagerFor(pipelinedScan=True):
+    configManager = MagicMock(pipelinedScan=pipelinedScan, asyncDownloadConcurrency=4, longTimeout=2, period="1y", duration="1d", baseIndex="^NSEI", httpTransportMode="")
+    configManager.isIntradayConfig.return_value = False
+    return configManager
+
+def fakeDownload(stocks, period, duration, onBatch=None, **kwargs):
+    # Two batches. DEAD never comes through.
+    onBatch({"SBIN": {"index": [1]}})
+    onBatch({"TCS": {"index": [2]}})
+    return {"SBIN": {"index": [1]}, "TCS": {"index": [2]}}, ["DEAD"]
+
+def test_pipeline_hands_over_every_batch():
+    retryQueue = MagicMock()
+    retryQueue.admit.side_effect = lambda stocks, protectedStocks=[]: stocks
+    with patch.object(PKAsyncDownloader, "download", side_effect=fakeDownload):
+        pipeline = PKDownloadPipeline(["SBIN", "TCS", "DEAD"], configManagerFor(), retryQueue=retryQueue).start()
+        pipeline.join()
+    assert [pipeline.readyStocks(timeout=1) for _ in range(4)] == [["SBIN"], ["TCS"], ["DEAD"], None]
+    assert pipeline.stockDict == {"SBIN": {"index": [1]}, "TCS": {"index": [2]}}
+    retryQueue.record.assert_called_once()
+    retryQueue.save.assert_called_once()
+
+def test_held_back_stocks_are_not_handed_over():
+    retryQueue = MagicMock()
+    retryQueue.admit.side_effect = lambda stocks, protectedStocks=[]: [stock for stock in stocks if stock != "BROKEN"]
+    with patch.object(PKAsyncDownloader, "download", side_effect=fakeDownload):
+        pipeline = PKDownloadPipeline(["SBIN", "TCS", "DEAD", "BROKEN"], configManagerFor(), retryQueue=retryQueue).start()
+        pipeline.join()
+    assert [pipeline.readyStocks(timeout=1) for _ in range(4)] == [["SBIN"], ["TCS"], ["DEAD"], None]
+    assert pipeline.leftOutStocks == ["DEAD"] and pipeline.heldBackStocks == ["BROKEN"]
+
+def test_isApplicable():
+    userArgs = MagicMock(monitor=None, backtestdaysago=None, options="X:12:9", testbuild=False)
+    with patch("PKDevTools.classes.PKDateUtilities.PKDateUtilities.isTradingTime", return_value=True), \
+         patch("PKDevTools.classes.PKDateUtilities.PKDateUtilities.wasTradedOn", return_value=True):
+        assert PKDownloadPipeline.isApplicable(configManagerFor(), "X", userPassedArgs=userArgs)
+        assert not PKDownloadPipeline.isApplicable(configManagerFor(False), "X", userPassedArgs=userArgs)
+        assert not PKDownloadPipeline.isApplicable(configManagerFor(), "B", userPassedArgs=userArgs)
+        assert not PKDownloadPipeline.isApplicable(configManagerFor(), "X", downloadOnly=True, userPassedArgs=userArgs)
+        userArgs.monitor = "X:12:9"
+        assert not PKDownloadPipeline.isApplicable(configManagerFor(), "X", userPassedArgs=userArgs)
+    with patch("PKDevTools.classes.PKDateUtilities.PKDateUtilities.isTradingTime", return_value=False):
+        assert not PKDownloadPipeline.isApplicable(configManagerFor(), "X")
+
+def runPipelinedScan(retryQueue=None):
+    # A fresh worker for every scan. It stops at the sentinel that the scan sends in the end.
+    tasks_queue = queue.Queue()
+    results_queue = queue.Queue()
+    def worker():
+        hostRef = MagicMock(scanContexts={})
+        while True:
+            task = tasks_queue.get()
+            if task is None:
+                break
+            # The stocks and the data that came along with them
+            results_queue.put([(item[PKScanRunner.STOCK_ITEM_INDEX], item[-1]) for item in task[0].itemsFor(hostRef)])
+    threading.Thread(target=worker, daemon=True).start()
+    items = [tuple([None] * PKScanRunner.STOCK_ITEM_INDEX + [stock] + [None] * 11) for stock in ["SBIN", "TCS", "DEAD"]]
+    userArgs = MagicMock(monitor=None, options="X:12:9")
+    results = []
+    def resultsReceivedCb(result, remaining, backtest_df, *otherArgs):
+        results.append(result)
+        return True, backtest_df
+    with patch.object(PKAsyncDownloader, "download", side_effect=fakeDownload):
+        PKScanRunner.downloadPipeline = PKDownloadPipeline(["SBIN", "TCS", "DEAD"], configManagerFor(), retryQueue=retryQueue).start()
+        with patch("multiprocessing.cpu_count", return_value=1):
+            PKScanRunner.runScan(userArgs, False, len(items), 1, items, len(items), tasks_queue, results_queue, len(items), None, resultsReceivedCb=resultsReceivedCb)
+    return results
+
+def test_runPipelinedScan_queues_stocks_as_they_are_downloaded():
+    results = runPipelinedScan()
+    assert sorted(results) == [("DEAD", None), ("SBIN", {"index": [1]}), ("TCS", {"index": [2]})]
+    assert PKScanRunner.downloadPipeline is None
+
+def test_runPipelinedScan_leaves_out_held_back_stocks():
+    retryQueue = MagicMock()
+    retryQueue.admit.side_effect = lambda stocks, protectedStocks=[]: [stock for stock in stocks if stock != "DEAD"]
+    assert sorted(runPipelinedScan(retryQueue=retryQueue)) == [("SBIN", {"index": [1]}), ("TCS", {"index": [2]})]
+
+def test_mergeFetchedData():
+    results = PKBatchResults()
+    results.fetchedData = {"TCS": {"index": [2]}}
+    stockDictPrimary = PKScanRunner.stockDictPrimary
+    PKScanRunner.stockDictPrimary = {"SBIN": {"index": [1]}}
+    try:
+        PKScanRunner.mergeFetchedData(results)
+        PKScanRunner.mergeFetchedData([None])
+        assert PKScanRunner.stockDictPrimary == {"SBIN": {"index": [1]}, "TCS": {"index": [2]}}
+    finally:
+        PKScanRunner.stockDictPrimary = stockDictPrimary
+
+def test_recordWorkerContext_stops_sending_contexts_once_every_worker_has_them():
+    consumers, workerContextIds, contextWorkers = PKScanRunner.consumers, PKScanRunner.workerContextIds, PKScanRunner.contextWorkers
+    PKScanRunner.consumers = [MagicMock(), MagicMock()]
+    PKScanRunner.workerContextIds = set()
+    PKScanRunner.contextWorkers = {}
+    def answerFrom(workerId):
+        results = PKBatchResults(contextId=7)
+        results.workerId = workerId
+        return results
+    try:
+        PKScanRunner.answered(answerFrom(1))
+        PKScanRunner.answered(answerFrom(1))
+        assert 7 not in PKScanRunner.workerContextIds
+        PKScanRunner.answered(answerFrom(2))
+        assert 7 in PKScanRunner.workerContextIds and PKScanRunner.contextWorkers == {}
+    finally:
+        PKScanRunner.consumers, PKScanRunner.workerContextIds, PKScanRunner.contextWorkers = consumers, workerContextIds, contextWorkers
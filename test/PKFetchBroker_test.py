@@ -0,0 +1,120 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import multiprocessing
+import threading
+from unittest.mock import MagicMock
+
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKFetchBroker import PKFetchBroker, PKFetchBrokerClient
+from pkscreener.classes.StockScreener import StockScreener
+
+def multiTickerFrame(tickers, days=3):
+    frames = {ticker: pd.DataFrame({"Close": [float(day) for day in range(days)], "Volume": [10.0] * days},
+                                   index=pd.date_range("2024-01-01", periods=days)) for ticker in tickers}
+    return pd.concat(frames, axis=1)
+
+class FakeFetcher:
+    proxyServer = "http://proxy:8080"
+    def __init__(self, missingFromBatch=[]):
+        self.calls = []
+        self.proxies = []
+        self.missingFromBatch = missingFromBatch
+    def fetchStockData(self, stockCode, period, duration, proxyServer, *args, start=None, end=None, exchangeSuffix=".NS", **kwargs):
+        self.proxies.append(proxyServer)
+        if isinstance(stockCode, str):
+            self.calls.append(stockCode)
+            if stockCode == "DEAD":
+                raise Exception("No data found")
+            return multiTickerFrame([f"{stockCode}{exchangeSuffix}"])
+        self.calls.append(list(stockCode))
+        return multiTickerFrame([f"{stock}{exchangeSuffix}" for stock in stockCode if stock != "DEAD" and stock not in self.missingFromBatch])
+
+def test_splitByTicker():
+    frames = PKFetchBroker.splitByTicker(multiTickerFrame(["SBIN.NS", "TCS.NS"]), ["SBIN", "TCS", "DEAD"])
+    assert sorted(frames.keys()) == ["SBIN", "TCS"]
+    assert list(frames["SBIN"].columns) == ["Close", "Volume"]
+    single = pd.DataFrame({"Close": [1.0]}, index=pd.date_range("2024-01-01", periods=1))
+    assert list(PKFetchBroker.splitByTicker(single, ["SBIN"]).keys()) == ["SBIN"]
+    assert PKFetchBroker.splitByTicker(None, ["SBIN"]) == {}
+
+def test_requests_are_coalesced():
+    fetcher = FakeFetcher()
+    broker = PKFetchBroker(fetcher, window=0.5)
+    clients = [broker.clientFor(timeout=10) for _ in range(3)]
+    broker.start()
+    results = {}
+    def fetch(client, stock):
+        results[stock] = client.fetch(stock, "1y", "1d")
+    threads = [threading.Thread(target=fetch, args=(client, stock)) for client, stock in zip(clients, ["SBIN", "TCS", "DEAD"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    broker.stop()
+    # DEAD is missing from the batch, so it gets one more (failing) try of its own
+    assert len(fetcher.calls) == 2 and sorted(fetcher.calls[0]) == ["DEAD", "SBIN", "TCS"] and fetcher.calls[1] == "DEAD"
+    assert results["DEAD"] is None and len(results["SBIN"]) == 3 and len(results["TCS"]) == 3
+    assert broker.requests == 3 and broker.downloads == 1
+    assert fetcher.proxies == [FakeFetcher.proxyServer] * 2
+
+def test_missing_tickers_are_fetched_one_by_one():
+    fetcher = FakeFetcher(missingFromBatch=["TCS"])
+    frames = PKFetchBroker(fetcher).download(["SBIN", "TCS"], "1y", "1d", ".NS", None, None)
+    assert sorted(frames.keys()) == ["SBIN", "TCS"] and fetcher.calls[1:] == ["TCS"]
+
+def test_client_times_out_and_ignores_late_replies():
+    replyQueue = multiprocessing.Queue()
+    client = PKFetchBrokerClient(multiprocessing.Queue(), replyQueue, 0, timeout=0.1)
+    with pytest.raises(TimeoutError):
+        client.fetch("SBIN", "1y", "1d")
+    replyQueue.put((1, "late"))
+    replyQueue.put((2, "current"))
+    assert client.fetch("SBIN", "1y", "1d") == "current"
+
+def test_startFor():
+    assert PKFetchBroker.startFor(FakeFetcher(), MagicMock(fetchBrokerWindow=0)) is None
+    broker = PKFetchBroker.startFor(FakeFetcher(), MagicMock(fetchBrokerWindow=0.01))
+    assert broker.thread.is_alive()
+    broker.stop()
+    assert broker.thread is None
+
+def test_getRelevantDataForStock_uses_fetch_broker():
+    fetcher = FakeFetcher()
+    broker = PKFetchBroker(fetcher, window=0.01)
+    hostRef = MagicMock()
+    hostRef.fetchBroker = broker.clientFor(timeout=10)
+    configManager = MagicMock()
+    configManager.candlePeriodFrequency = "y"
+    configManager.candleDurationFrequency = "d"
+    screener = StockScreener()
+    screener.isTradingTime = True
+    broker.start()
+    try:
+        data = screener.getRelevantDataForStock(1, False, "SBIN", False, False, 0, hostRef, {}, configManager, MagicMock(), "1y", "1d")
+    finally:
+        broker.stop()
+    assert fetcher.calls == [["SBIN"]]
+    assert len(data) == 3 and data.index.name == "Date"
@@ -0,0 +1,85 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from unittest.mock import MagicMock
+
+import pandas as pd
+
+from pkscreener.classes.PKFrameCache import PKFrameCache
+from pkscreener.classes.StockScreener import StockScreener
+
+def splitDictFor(days):
+    return pd.DataFrame({"Close": [float(day) for day in range(days)]}, index=pd.date_range("2024-01-01", periods=days)).to_dict("split")
+
+def test_get_put_returns_copies():
+    frameCache = PKFrameCache(2)
+    key = PKFrameCache.keyFor("SBIN", splitDictFor(3), "1d")
+    assert frameCache.get(key) is None
+    frame = pd.DataFrame({"Close": [1.0, 2.0]})
+    handedOut = frameCache.put(key, frame)
+    handedOut["Close"] = 0.0
+    cached = frameCache.get(key)
+    assert list(cached["Close"]) == [1.0, 2.0]
+    cached["Close"] = 0.0
+    assert list(frameCache.get(key)["Close"]) == [1.0, 2.0]
+    assert frameCache.hits == 2 and frameCache.misses == 1
+
+def test_keyFor():
+    assert PKFrameCache.keyFor("SBIN", splitDictFor(3), "1d") == PKFrameCache.keyFor("SBIN", splitDictFor(3), "1d")
+    assert PKFrameCache.keyFor("SBIN", splitDictFor(3), "1d") != PKFrameCache.keyFor("SBIN", splitDictFor(4), "1d")
+    assert PKFrameCache.keyFor("SBIN", splitDictFor(3), "1d") != PKFrameCache.keyFor("SBIN", splitDictFor(3), "5m")
+    assert PKFrameCache.keyFor("SBIN", {}, "1d") is None
+
+def test_lru_eviction():
+    frameCache = PKFrameCache(2)
+    for symbol in ["A", "B"]:
+        frameCache.put((symbol,), pd.DataFrame())
+    frameCache.get(("A",))
+    frameCache.put(("C",), pd.DataFrame())
+    assert list(frameCache.frames.keys()) == [("A",), ("C",)]
+    disabled = PKFrameCache(0)
+    disabled.put(("A",), pd.DataFrame())
+    assert disabled.get(("A",)) is None
+
+def test_invalidate():
+    frameCache = PKFrameCache(2)
+    workerCache = PKFrameCache(2, frameCache.generation)
+    workerCache.put(("A",), pd.DataFrame())
+    frameCache.invalidate()
+    assert workerCache.get(("A",)) is None
+    assert len(workerCache.frames) == 0
+
+def test_getRelevantDataForStock_uses_frame_cache():
+    hostRef = MagicMock()
+    hostRef.frameCache = PKFrameCache(10)
+    configManager = MagicMock()
+    configManager.candlePeriodFrequency = "y"
+    configManager.candleDurationFrequency = "d"
+    stockDict = {"SBIN": splitDictFor(5)}
+    screener = StockScreener()
+    screener.isTradingTime = False
+    frames = [screener.getRelevantDataForStock(1, True, "SBIN", False, False, 0, hostRef, stockDict, configManager, None, "1y", "1d") for _ in range(2)]
+    assert hostRef.frameCache.misses == 1 and hostRef.frameCache.hits == 1
+    assert frames[0].index.name == "Date"
+    pd.testing.assert_frame_equal(frames[0], frames[1])
+    assert frames[0] is not frames[1]
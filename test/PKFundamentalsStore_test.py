@@ -0,0 +1,106 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKFundamentalsStore import PKFundamentalsStore
+from pkscreener.classes.ScreeningStatistics import ScreeningStatistics
+
+@pytest.fixture
+def stores(tmp_path):
+    with patch("PKDevTools.classes.Archiver.get_user_outputs_dir", return_value=str(tmp_path)):
+        PKFundamentalsStore.shared = {}
+        yield tmp_path
+    PKFundamentalsStore.shared = {}
+
+def test_filePathFor(tmp_path):
+    assert PKFundamentalsStore.filePathFor(PKFundamentalsStore.FAIR_VALUE, directory=str(tmp_path)).endswith("NSEStockFairValueStore.pkl")
+    assert PKFundamentalsStore.filePathFor(PKFundamentalsStore.MFI, "NASDAQ", directory=str(tmp_path)).endswith("NASDAQStockMFIStore.pkl")
+
+def test_put_get_save_load(tmp_path):
+    store = PKFundamentalsStore(str(tmp_path / "store.pkl"))
+    assert store.get("SBIN") is None and store.isStale("SBIN")
+    store.put("SBIN", 600.5, fetchedOn=0)
+    assert store.get("SBIN") == 600.5
+    assert store.isStale("SBIN", maxAgeDays=7, now=8 * 86400) and not store.isStale("SBIN", maxAgeDays=7, now=86400)
+    store.save()
+    assert PKFundamentalsStore(str(tmp_path / "store.pkl")).get("SBIN") == 600.5
+
+def test_refreshStocks_only_fetches_stale_entries(tmp_path):
+    store = PKFundamentalsStore(str(tmp_path / "store.pkl"))
+    store.put("SBIN", 1.0)
+    fetchFn = MagicMock(side_effect=lambda stock: None if stock == "DEAD" else 2.0)
+    assert store.refreshStocks(["SBIN", "TCS", "DEAD", "TCS"], fetchFn, concurrency=2) == 1
+    assert sorted([call.args[0] for call in fetchFn.call_args_list]) == ["DEAD", "TCS"]
+    assert store.get("SBIN") == 1.0 and store.get("TCS") == 2.0 and store.get("DEAD") is None
+    assert PKFundamentalsStore(str(tmp_path / "store.pkl")).get("TCS") == 2.0
+
+def test_refreshStocks_saves_as_it_goes(tmp_path):
+    store = PKFundamentalsStore(str(tmp_path / "store.pkl"))
+    def fetchFn(stock):
+        if stock == "TCS":
+            raise RuntimeError("Interrupted")
+        return 1.0
+    with pytest.raises(RuntimeError):
+        store.refreshStocks(["SBIN", "INFY", "TCS", "ITC"], fetchFn, concurrency=1, saveEvery=2)
+    savedStore = PKFundamentalsStore(str(tmp_path / "store.pkl"))
+    assert savedStore.get("SBIN") == 1.0 and savedStore.get("INFY") == 1.0 and savedStore.get("ITC") is None
+
+def test_refresh(stores):
+    screener = MagicMock()
+    screener.getFreshFairValue.return_value = 600.0
+    screener.getFreshMFIStatus.return_value = (10, 20, "2024-01-31T00:00:00.000", "2024-01-31T00:00:00.000")
+    assert PKFundamentalsStore.refresh(["^NSEI", "SBIN"], screener) == (1, 1)
+    assert PKFundamentalsStore.sharedFor(PKFundamentalsStore.FAIR_VALUE).get("SBIN") == 600.0
+    assert PKFundamentalsStore.sharedFor(PKFundamentalsStore.MFI).get("SBIN")[0] == 10
+    assert (stores / "NSEStockFairValueStore.pkl").exists() and (stores / "NSEStockMFIStore.pkl").exists()
+
+def test_refreshInBackground(stores):
+    screener = MagicMock()
+    screener.getFreshFairValue.return_value = 600.0
+    screener.getFreshMFIStatus.return_value = None
+    PKFundamentalsStore.backgroundRefresh = None
+    try:
+        thread = PKFundamentalsStore.refreshInBackground(["SBIN"], screener)
+        thread.join(timeout=5)
+        assert not thread.is_alive() and PKFundamentalsStore.sharedFor(PKFundamentalsStore.FAIR_VALUE).get("SBIN") == 600.0
+        # Once per process
+        assert PKFundamentalsStore.refreshInBackground(["TCS"], screener) is thread
+        assert [call.args[0] for call in screener.getFreshFairValue.call_args_list] == ["SBIN"]
+    finally:
+        PKFundamentalsStore.backgroundRefresh = None
+
+def test_screening_looks_up_the_store_without_network(stores):
+    PKFundamentalsStore.sharedFor(PKFundamentalsStore.FAIR_VALUE).put("SBIN", 612.34)
+    PKFundamentalsStore.sharedFor(PKFundamentalsStore.MFI).put("SBIN", (1000000, 0, "2024-01-31T00:00:00.000", None))
+    screener = ScreeningStatistics(MagicMock(), MagicMock())
+    hostData = pd.DataFrame({"Close": [600.0]}, index=pd.date_range("2024-01-01", periods=1))
+    with patch("pkscreener.classes.ScreeningStatistics.Stock", side_effect=AssertionError("No network calls expected")):
+        assert screener.getFairValue("SBIN", hostData) == 612.3
+        assert screener.getMutualFundStatus("SBIN", hostData=hostData, onlyMF=True) == 1000000
+        assert screener.getFairValue("TCS", pd.DataFrame({"Close": [600.0]})) == 0
+    assert hostData.loc[hostData.index[-1], "FairValue"] == 612.3
+    assert hostData.loc[hostData.index[-1], "MF"] == 1000000
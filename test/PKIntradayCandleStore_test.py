@@ -0,0 +1,92 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+from pkscreener.classes.PKIntradayCandleStore import PKIntradayCandleStore
+
+def sessionFrame(day, minutes=30, start=100.0):
+    index = pd.date_range(f"{day} 09:15", periods=minutes, freq="1min", tz="Asia/Kolkata")
+    closes = start + np.arange(minutes, dtype=float)
+    return pd.DataFrame({"Open": closes - 0.5, "High": closes + 1, "Low": closes - 1, "Close": closes,
+                         "Adj Close": closes, "Volume": np.full(minutes, 10.0)}, index=index)
+
+@pytest.fixture
+def stockDict():
+    df = pd.concat([sessionFrame("2024-01-01"), sessionFrame("2024-01-02", start=200.0)])
+    df.iloc[2] = np.nan
+    df.iloc[3, 0] = np.nan
+    return {"SBIN": df.to_dict("split"), "TCS": sessionFrame("2024-01-02", start=50.0).to_dict("split")}
+
+def test_window(stockDict):
+    candleStore = PKIntradayCandleStore(stockDict)
+    assert len(candleStore) == 2
+    assert candleStore.window("SBIN", end="2024-01-02 09:20:00+05:30") == (30, 36)
+    assert candleStore.window("SBIN", end="2024-01-01 09:20:00+05:30") == (0, 6)
+    assert candleStore.window("SBIN", end="2024-01-01 20:00:00+05:30") == (0, 30)
+    assert candleStore.window("SBIN", end="2024-01-01 20:00:00+05:30", maxCandles=5) == (0, 5)
+    assert candleStore.window("SBIN", end="2023-12-31 09:20:00+05:30") == (0, 0)
+    assert candleStore.window("INFY", end="2024-01-02 09:20:00+05:30") == (0, 0)
+    assert len(candleStore.candles("TCS", end="2024-01-02 09:20:00+05:30")) == 6
+
+def test_combinedCandle(stockDict):
+    candleStore = PKIntradayCandleStore(stockDict)
+    candle = candleStore.combinedCandle("SBIN", end="2024-01-01 09:20:00+05:30")
+    assert candle["index"] == [pd.Timestamp("2024-01-01 09:20:00")]
+    assert candle["columns"] == ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+    # Row 2 is empty and the open of row 3 is missing
+    assert candle["data"] == [[99.5, 106.0, 99.0, 105.0, 105.0, 50.0]]
+    candle = candleStore.combinedCandle("TCS", end="2024-01-02 10:00:00+05:30", maxCandles=3)
+    assert candle["data"] == [[49.5, 53.0, 49.0, 52.0, 52.0, 30.0]]
+    assert candleStore.combinedCandle("TCS", end="2024-01-01 10:00:00+05:30") is None
+
+def test_columnar_store_input(stockDict, tmp_path):
+    storePath = str(tmp_path / "intraday_stock_data.pkcs")
+    PKColumnarStore.write(stockDict, storePath, cacheFile="intraday_stock_data_020124.pkl")
+    fromStore = PKIntradayCandleStore(PKColumnarStore(storePath))
+    fromDict = PKIntradayCandleStore(stockDict)
+    for symbol in ["SBIN", "TCS"]:
+        assert fromStore.combinedCandle(symbol, end="2024-01-02 09:25:00+05:30") == fromDict.combinedCandle(symbol, end="2024-01-02 09:25:00+05:30")
+
+def test_bucketed_window_matches_a_plain_search(stockDict):
+    candleStore = PKIntradayCandleStore(stockDict)
+    timestamps = candleStore.partitions["SBIN"][0]
+    for end in pd.date_range("2024-01-01 09:00", "2024-01-02 10:00", freq="7min", tz="Asia/Kolkata"):
+        stop = int(np.searchsorted(timestamps, end.value, side="right"))
+        assert candleStore.window("SBIN", end=end)[1] == stop
+
+def test_saved_store_is_mapped_back_for_the_same_cache_file(stockDict, tmp_path):
+    storePath = str(tmp_path / PKIntradayCandleStore.STORE_NAME)
+    built = PKIntradayCandleStore.forCacheFile("intraday_stock_data_020124.pkl", stockDict, storePath=storePath)
+    PKIntradayCandleStore.loaded = {}
+    loaded = PKIntradayCandleStore.forCacheFile("intraday_stock_data_020124.pkl", stockDict, storePath=storePath)
+    assert loaded is not built and loaded.cacheFile == "intraday_stock_data_020124.pkl"
+    for symbol in ["SBIN", "TCS"]:
+        assert loaded.combinedCandle(symbol, end="2024-01-02 09:25:00+05:30") == built.combinedCandle(symbol, end="2024-01-02 09:25:00+05:30")
+    # Another cache file (or more symbols) gets a new store
+    PKIntradayCandleStore.loaded = {}
+    assert PKIntradayCandleStore.forCacheFile("intraday_stock_data_030124.pkl", stockDict, storePath=storePath).cacheFile == "intraday_stock_data_030124.pkl"
+    assert PKIntradayCandleStore.load(str(tmp_path / "missing")) is None
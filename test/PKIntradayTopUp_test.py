@@ -0,0 +1,112 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKAsyncDownloader import PKAsyncDownloader
+from pkscreener.classes.PKIntradayTopUp import PKIntradayTopUp
+
+# 2024-01-01 09:15 IST and the next 3 minutes
+TIMESTAMPS = [1704080700 + 60 * n for n in range(4)]
+
+def cachedData(candles=2):
+    index = [pd.Timestamp("2024-01-01 09:15") + pd.Timedelta(minutes=n) for n in range(candles)]
+    return {"index": index, "columns": ["Open", "High", "Low", "Close", "Adj Close", "Volume"],
+            "data": [[1.0, 1.0, 1.0, 1.0, 1.0, 10.0] for _ in range(candles)], "MF": 1.5}
+
+@pytest.fixture
+def chartServer():
+    class ChartHandler(BaseHTTPRequestHandler):
+        queries = []
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            ChartHandler.queries.append(query)
+            # Candles from period1 onwards, the revised 09:16 candle included
+            timestamps = [ts for ts in TIMESTAMPS if "period1" not in query or ts >= int(query["period1"][0])]
+            closes = [2.0] * len(timestamps)
+            body = json.dumps({"chart": {"result": [{"meta": {"exchangeTimezoneName": "Asia/Kolkata"}, "timestamp": timestamps,
+                                                     "indicators": {"quote": [{"open": closes, "high": closes, "low": closes, "close": closes, "volume": [20] * len(closes)}]}}]}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args):
+            pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChartHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/", ChartHandler.queries
+    server.shutdown()
+
+def test_sinceFor():
+    assert PKIntradayTopUp.sinceFor(cachedData()) == (TIMESTAMPS[1], None)
+    awareData = cachedData()
+    awareData["index"] = [ts.tz_localize("Asia/Kolkata") for ts in awareData["index"]]
+    assert PKIntradayTopUp.sinceFor(awareData) == (TIMESTAMPS[1], "Asia/Kolkata")
+    assert PKIntradayTopUp.sinceFor({"index": [], "columns": [], "data": []}) is None
+
+def test_merge_replaces_the_partial_candle():
+    newer = {"index": [pd.Timestamp("2024-01-01 09:16"), pd.Timestamp("2024-01-01 09:17")], "columns": ["Close", "Volume"], "data": [[2.0, 20.0], [3.0, 30.0]]}
+    merged = PKIntradayTopUp.merge(cachedData(), newer)
+    assert merged["index"] == [pd.Timestamp("2024-01-01 09:15"), pd.Timestamp("2024-01-01 09:16"), pd.Timestamp("2024-01-01 09:17")]
+    assert merged["data"] == [[1.0, 1.0, 1.0, 1.0, 1.0, 10.0], [None, None, None, 2.0, None, 20.0], [None, None, None, 3.0, None, 30.0]]
+    assert merged["MF"] == 1.5 and merged["columns"] == cachedData()["columns"]
+    assert PKIntradayTopUp.merge(cachedData(), None)["data"] == cachedData()["data"]
+
+def test_trim_to_the_period():
+    splitDict = {"index": [pd.Timestamp("2024-01-01 15:29"), pd.Timestamp("2024-01-02 09:15"), pd.Timestamp("2024-01-03 09:15"), pd.Timestamp("2024-01-03 09:16")],
+                 "columns": ["Close"], "data": [[1.0], [2.0], [3.0], [4.0]], "MF": 1.5}
+    trimmed = PKIntradayTopUp.trim(splitDict, "1d")
+    assert trimmed["index"] == splitDict["index"][2:] and trimmed["data"] == [[3.0], [4.0]] and trimmed["MF"] == 1.5
+    assert PKIntradayTopUp.trim(splitDict, "2d")["data"] == [[2.0], [3.0], [4.0]]
+    assert PKIntradayTopUp.trim(splitDict, "5d") is splitDict
+    assert PKIntradayTopUp.trim(splitDict, "1mo") is splitDict and PKIntradayTopUp.trim(splitDict, "max") is splitDict
+
+def test_isApplicable():
+    assert PKIntradayTopUp.isApplicable(MagicMock(incrementalIntradayRefresh=True, asyncDownloadConcurrency=4))
+    # The top-up brings the async downloader along even if it's turned off otherwise
+    assert PKIntradayTopUp.isApplicable(MagicMock(incrementalIntradayRefresh=True, asyncDownloadConcurrency=0))
+    assert not PKIntradayTopUp.isApplicable(MagicMock(incrementalIntradayRefresh=False, asyncDownloadConcurrency=4))
+    assert PKIntradayTopUp.concurrencyFor(MagicMock(asyncDownloadConcurrency=0)) == PKIntradayTopUp.CONCURRENCY
+    assert PKIntradayTopUp.concurrencyFor(MagicMock(asyncDownloadConcurrency=4)) == 4
+
+def test_topUp(chartServer):
+    baseUrl, queries = chartServer
+    # With the defaults (asyncDownloadConcurrency = 0)
+    configManager = MagicMock(asyncDownloadConcurrency=0, longTimeout=2, period="1d", duration="1m", httpTransportMode="")
+    stockDict = {"SBIN": cachedData()}
+    with patch.object(PKAsyncDownloader, "serverBaseUrl", baseUrl):
+        leftOutStocks = PKIntradayTopUp.topUp(stockDict, ["SBIN", "TCS"], configManager)
+    assert leftOutStocks == []
+    sbinQuery = [query for query in queries if "period1" in query][0]
+    assert sbinQuery["period1"] == [str(TIMESTAMPS[1])] and "range" not in sbinQuery
+    # The new stock gets the whole period
+    assert [query for query in queries if "period1" not in query][0]["range"] == ["1d"]
+    assert len(stockDict["SBIN"]["index"]) == 4 and stockDict["SBIN"]["data"][0][3] == 1.0 and stockDict["SBIN"]["data"][1][3] == 2.0
+    assert len(stockDict["TCS"]["index"]) == 4
@@ -0,0 +1,87 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import json
+import pickle
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from pkscreener.classes.PKRecordReplayTransport import PKRecordReplayTransport
+
+@pytest.fixture
+def server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps({"path": self.path}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args):
+            pass
+    httpServer = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpServer.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpServer.server_address[1]}"
+    httpServer.shutdown()
+    httpServer.server_close()
+
+def sessionFor(adapter):
+    session = requests.Session()
+    session.mount("http://", adapter)
+    return session
+
+def test_record_then_replay(server, tmp_path):
+    recorder = sessionFor(PKRecordReplayTransport(PKRecordReplayTransport.RECORD, directory=tmp_path))
+    recorded = recorder.get(f"{server}/v8/finance/chart/SBIN.NS", params={"range": "1y", "crumb": "abc"})
+    assert recorded.json() == {"path": "/v8/finance/chart/SBIN.NS?range=1y&crumb=abc"}
+    replayAdapter = PKRecordReplayTransport(PKRecordReplayTransport.REPLAY, directory=tmp_path, latency=0.05)
+    replayer = sessionFor(replayAdapter)
+    started = time.time()
+    # The crumb changes between sessions and is not part of the key
+    replayed = replayer.get(f"{server}/v8/finance/chart/SBIN.NS", params={"crumb": "xyz", "range": "1y"})
+    assert time.time() - started >= 0.05
+    assert replayed.status_code == 200 and replayed.json() == recorded.json()
+    assert replayed.headers["Content-Type"] == "application/json"
+    assert replayer.get(f"{server}/v8/finance/chart/TCS.NS").status_code == 404
+    assert replayAdapter.hits == 1 and replayAdapter.misses == 1
+
+def test_replay_is_offline(tmp_path):
+    replayer = sessionFor(PKRecordReplayTransport(PKRecordReplayTransport.REPLAY, directory=tmp_path))
+    # Nothing listens on port 9
+    assert replayer.get("http://127.0.0.1:9/anything").status_code == 404
+
+def test_adapterFor(tmp_path):
+    assert PKRecordReplayTransport.adapterFor(MagicMock(httpTransportMode="", httpTransportLatency=0)) is None
+    assert PKRecordReplayTransport.adapterFor(object()) is None
+    with pytest.raises(ValueError):
+        PKRecordReplayTransport("live", directory=tmp_path)
+    adapter = PKRecordReplayTransport(PKRecordReplayTransport.REPLAY, directory=tmp_path, latency=0.5)
+    # Survives being sent to the scan workers
+    adapter = pickle.loads(pickle.dumps(adapter))
+    assert adapter.mode == PKRecordReplayTransport.REPLAY and adapter.latency == 0.5 and adapter.directory == tmp_path
@@ -0,0 +1,93 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import os
+from unittest.mock import MagicMock, patch
+
+from pkscreener.classes.PKRetryQueue import PKRetryQueue
+
+def test_backoff_grows_with_jitter():
+    for failures in range(1, 10):
+        delay = min(PKRetryQueue.MAX_DELAY, PKRetryQueue.BASE_DELAY * (2 ** (failures - 1)))
+        assert delay / 2 <= PKRetryQueue.backoff(failures) <= delay
+
+def test_circuit_opens_after_consecutive_sessions(tmp_path):
+    queue = PKRetryQueue(PKRetryQueue.filePathFor(os.path.join(tmp_path, "stock_data_1.pkl")), circuitBreakerSessions=2)
+    queue.record([], ["DELISTED", "FLAKY"], "2024-01-01", now=0)
+    queue.record([], ["DELISTED"], "2024-01-01", now=10)
+    assert queue.symbols["DELISTED.NS"]["failures"] == 2 and not queue.isOpen("DELISTED", now=20)
+    queue.record(["FLAKY"], ["DELISTED"], "2024-01-02", now=86400)
+    assert queue.isOpen("DELISTED", now=86401) and "FLAKY.NS" not in queue.symbols.keys()
+    assert queue.admit(["SBIN", "DELISTED", "^NSEI"], now=86401) == ["SBIN", "^NSEI"]
+    assert queue.admit(["DELISTED"], protectedStocks=["DELISTED"], now=86401) == ["DELISTED"]
+    # Survives the next run
+    queue.save()
+    queue = PKRetryQueue(queue.filePath, circuitBreakerSessions=2)
+    assert queue.isOpen("DELISTED", now=86401)
+    # Probe after the cool down. Failing again keeps it out for twice as long.
+    probeTime = 86400 + PKRetryQueue.COOL_DOWN_DAYS * 86400 + 1
+    assert queue.admit(["DELISTED"], now=probeTime) == ["DELISTED"]
+    queue.record([], ["DELISTED"], "2024-01-10", now=probeTime)
+    assert queue.symbols["DELISTED.NS"]["openUntil"] == probeTime + 2 * PKRetryQueue.COOL_DOWN_DAYS * 86400
+
+def test_due(tmp_path):
+    queue = PKRetryQueue(os.path.join(tmp_path, PKRetryQueue.FILE_NAME))
+    queue.record([], ["SBIN"], "2024-01-01", now=0)
+    dueStocks, wait = queue.due(["SBIN", "TCS"], now=0)
+    assert dueStocks == ["SBIN", "TCS"] and 0 < wait <= PKRetryQueue.BASE_DELAY
+    assert queue.due(["SBIN"], maxWait=0, now=0) == ([], 0)
+
+def test_retryLeftOutStocks(tmp_path):
+    from pkscreener.classes.Utility import tools
+    configManager = MagicMock(downloadRetryAttempts=3)
+    queue = PKRetryQueue(os.path.join(tmp_path, PKRetryQueue.FILE_NAME))
+    downloads = [({"SBIN": {}}, ["DELISTED"]), ({}, ["DELISTED"]), ({}, ["DELISTED"])]
+    def downloadLatestData(stockDict, configManager, stocks, exchangeSuffix=".NS", downloadOnly=False):
+        downloaded, leftOutStocks = downloads.pop(0)
+        stockDict.update(downloaded)
+        return stockDict, leftOutStocks
+    with patch("pkscreener.classes.Utility.tools.downloadLatestData", side_effect=downloadLatestData), patch("pkscreener.classes.Utility.sleep") as mock_sleep:
+        stockDict, leftOutStocks = tools.retryLeftOutStocks({}, configManager, queue, ["SBIN", "DELISTED", "TCS"], ["SBIN", "DELISTED"])
+    assert stockDict == {"SBIN": {}} and leftOutStocks == ["DELISTED"]
+    assert mock_sleep.call_count == 3 and len(downloads) == 0
+    assert list(queue.symbols.keys()) == ["DELISTED.NS"] and queue.symbols["DELISTED.NS"]["failures"] == 4
+    assert os.path.exists(queue.filePath)
+
+def test_outage_is_not_held_against_the_symbols(tmp_path):
+    queue = PKRetryQueue(os.path.join(tmp_path, PKRetryQueue.FILE_NAME), circuitBreakerSessions=1)
+    stocks = [f"STOCK{index}" for index in range(PKRetryQueue.MIN_OUTAGE_BATCH)]
+    assert not queue.record(stocks[:1], stocks[1:], "2024-01-01", now=0)
+    assert queue.symbols == {} and queue.admit(stocks, now=1) == stocks
+    assert queue.record(stocks[:10], stocks[10:], "2024-01-01", now=0)
+    assert not queue.isOpen("STOCK0", now=1) and queue.isOpen("STOCK10", now=1)
+
+def test_retries_only_beyond_the_threshold(tmp_path):
+    from pkscreener.classes.Utility import tools
+    configManager = MagicMock(downloadRetryAttempts=3)
+    queue = PKRetryQueue(os.path.join(tmp_path, PKRetryQueue.FILE_NAME))
+    stocks = [f"STOCK{index}" for index in range(40)]
+    with patch("pkscreener.classes.Utility.tools.downloadLatestData") as mock_download:
+        stockDict, leftOutStocks = tools.retryLeftOutStocks({}, configManager, queue, stocks, stocks[:2])
+    assert not PKRetryQueue.needsRetry(stocks, stocks[:2]) and PKRetryQueue.needsRetry(stocks, stocks[:3])
+    mock_download.assert_not_called()
+    assert leftOutStocks == stocks[:2] and list(queue.symbols.keys()) == ["STOCK0.NS", "STOCK1.NS"]
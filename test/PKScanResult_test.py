@@ -0,0 +1,114 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import asyncio
+import queue
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from pkscreener.classes.PKScanResult import PKScanResult
+from pkscreener.classes.PKScanRunner import PKScanRunner
+
+def startWorker(tasks_queue, results_queue, qualifying):
+    # Answers every batch with results for the qualifying stocks and None for the rest
+    def worker():
+        hostRef = MagicMock(scanContexts={})
+        while True:
+            task = tasks_queue.get()
+            if task is None:
+                break
+            stocks = [item[PKScanRunner.STOCK_ITEM_INDEX] for item in task[0].itemsFor(hostRef)]
+            results_queue.put([({"Stock": stock}, {"Stock": stock}, None, stock, 0) if stock in qualifying else None for stock in stocks])
+    threading.Thread(target=worker, daemon=True).start()
+
+def itemsFor(stocks):
+    return [tuple(["X"] * PKScanRunner.STOCK_ITEM_INDEX + [stock] + [None] * 11) for stock in stocks]
+
+def test_fromResult():
+    assert PKScanResult.fromResult(None) is None
+    scanResult = PKScanResult.fromResult(({"Stock": "SBIN"}, {"Stock": "SBIN"}, None, "SBIN", 0))
+    assert scanResult.stock == "SBIN" and scanResult.asTuple() == ({"Stock": "SBIN"}, {"Stock": "SBIN"}, None, "SBIN", 0)
+
+def test_streamResults_yields_only_the_qualifying_stocks():
+    tasks_queue = queue.Queue()
+    results_queue = queue.Queue()
+    startWorker(tasks_queue, results_queue, ["TCS", "ITC"])
+    userArgs = MagicMock(monitor=None, options="X:12:9", maxdisplayresults=None)
+    with patch("multiprocessing.cpu_count", return_value=1):
+        stocks = [scanResult.stock for scanResult in PKScanRunner.streamResults(userArgs, itemsFor(["SBIN", "TCS", "INFY", "ITC"]), tasks_queue, results_queue)]
+    assert stocks == ["TCS", "ITC"]
+
+def test_streamResults_stops_at_maxResults():
+    tasks_queue = queue.Queue()
+    results_queue = queue.Queue()
+    startWorker(tasks_queue, results_queue, ["SBIN", "TCS", "ITC"])
+    userArgs = MagicMock(monitor=None, options="X:12:9", maxdisplayresults=2)
+    consumers = PKScanRunner.consumers
+    PKScanRunner.consumers = [MagicMock()]
+    try:
+        with patch("multiprocessing.cpu_count", return_value=1):
+            stocks = [scanResult.stock for scanResult in PKScanRunner.streamResults(userArgs, itemsFor(["SBIN", "TCS", "INFY", "ITC"]), tasks_queue, results_queue)]
+        assert stocks == ["SBIN", "TCS"]
+        # The workers don't go on with the rest of the stocks
+        PKScanRunner.consumers[0]._clear.assert_called_once()
+    finally:
+        PKScanRunner.consumers = consumers
+
+def test_streamResultsAsync():
+    tasks_queue = queue.Queue()
+    results_queue = queue.Queue()
+    startWorker(tasks_queue, results_queue, ["INFY"])
+    userArgs = MagicMock(monitor=None, options="X:12:9", maxdisplayresults=None)
+    async def collect():
+        return [scanResult.stock async for scanResult in PKScanRunner.streamResultsAsync(userArgs, itemsFor(["SBIN", "INFY"]), tasks_queue, results_queue)]
+    with patch("multiprocessing.cpu_count", return_value=1):
+        assert asyncio.run(collect()) == ["INFY"]
+
+def test_streamResultsAsync_pauses_the_workers_when_cancelled():
+    tasks_queue = queue.Queue()
+    results_queue = queue.Queue()
+    userArgs = MagicMock(monitor=None, options="X:12:9", maxdisplayresults=None)
+    consumers = PKScanRunner.consumers
+    PKScanRunner.consumers = [MagicMock()]
+    async def cancelWhileWaiting():
+        results = PKScanRunner.streamResultsAsync(userArgs, itemsFor(["SBIN"]), tasks_queue, results_queue)
+        pending = asyncio.ensure_future(results.__anext__())
+        await asyncio.sleep(0.2)
+        pending.cancel()
+        try:
+            await pending
+        except asyncio.CancelledError:
+            pass
+    try:
+        with patch("multiprocessing.cpu_count", return_value=1):
+            asyncio.run(cancelWhileWaiting())
+            # The worker answers only after the caller is gone
+            startWorker(tasks_queue, results_queue, ["SBIN"])
+            for _ in range(50):
+                if PKScanRunner.consumers[0]._clear.called:
+                    break
+                time.sleep(0.1)
+        PKScanRunner.consumers[0]._clear.assert_called_once()
+    finally:
+        PKScanRunner.consumers = consumers
@@ -0,0 +1,128 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import multiprocessing
+import sys
+from multiprocessing.reduction import ForkingPickler
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKColumnarStore import PKColumnarStore
+from pkscreener.classes.PKSharedStockDB import PKSharedStockDB, PKSharedStockDBHandle
+
+def stockDictWithClose(close):
+    index = pd.date_range("2024-01-01", periods=len(close))
+    return {"SBIN": pd.DataFrame({"Close": close, "Volume": np.ones(len(close))}, index=index).to_dict("split") | {"MF": 1.5}}
+
+@pytest.fixture
+def sharedDB():
+    db = PKSharedStockDB.publish(stockDictWithClose(np.arange(5.0)))
+    yield db
+    PKSharedStockDB.releaseAll()
+
+def test_publish(sharedDB):
+    assert isinstance(sharedDB, PKSharedStockDB)
+    assert sharedDB.segmentName in PKSharedStockDB.publishedSegments
+    assert list(sharedDB) == ["SBIN"]
+    assert sharedDB.frame("SBIN")["Close"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert sharedDB["SBIN"]["MF"] == 1.5
+
+def test_publish_passthrough(tmp_path):
+    assert PKSharedStockDB.publish({}) == {}
+    assert PKSharedStockDB.publish(None) is None
+    storePath = PKColumnarStore.write(stockDictWithClose(np.arange(5.0)), str(tmp_path / "s.pkcs"))
+    store = PKColumnarStore(storePath)
+    assert PKSharedStockDB.publish(store) is store
+
+def test_frames_are_read_only(sharedDB):
+    df = sharedDB.frame("SBIN")
+    try:
+        df["Close"].values[0] = 10
+    except ValueError:
+        # The float32 prices are views over the segment
+        pass
+    assert sharedDB.frame("SBIN")["Close"].iloc[0] == 0
+    for fieldArray in sharedDB._fieldArrays:
+        with pytest.raises(ValueError):
+            fieldArray[0] = 10
+
+def test_republish(sharedDB):
+    previousSegmentName = sharedDB.segmentName
+    assert PKSharedStockDB.republish(sharedDB, stockDictWithClose(np.arange(3.0))) is sharedDB
+    assert sharedDB.segmentName != previousSegmentName
+    assert previousSegmentName not in PKSharedStockDB.publishedSegments
+    assert sharedDB.frame("SBIN")["Close"].tolist() == [0.0, 1.0, 2.0]
+    plainDict = {"A": 1}
+    assert PKSharedStockDB.republish(plainDict, stockDictWithClose(np.arange(3.0))) != plainDict
+
+def readLastClose(sharedDB, resultsQueue):
+    resultsQueue.put(sharedDB.frame("SBIN")["Close"].iloc[-1])
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="fork is not available")
+def test_worker_attach(sharedDB):
+    context = multiprocessing.get_context("fork")
+    resultsQueue = context.Queue()
+    worker = context.Process(target=readLastClose, args=(sharedDB, resultsQueue))
+    worker.start()
+    assert resultsQueue.get(timeout=30) == 4.0
+    worker.join()
+
+def readLastCloseFromQueue(tasksQueue, resultsQueue):
+    resultsQueue.put(tasksQueue.get().attach().frame("SBIN")["Close"].iloc[-1])
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="fork is not available")
+def test_handle_goes_through_a_queue(sharedDB):
+    # The control block itself only travels by inheritance
+    with pytest.raises(RuntimeError):
+        ForkingPickler.dumps(sharedDB)
+    handle = sharedDB.handle()
+    assert isinstance(handle, PKSharedStockDBHandle) and handle.segmentName == sharedDB.segmentName
+    context = multiprocessing.get_context("fork")
+    tasksQueue = context.Queue()
+    resultsQueue = context.Queue()
+    # Already running before the handle is sent, like a warm worker
+    worker = context.Process(target=readLastCloseFromQueue, args=(tasksQueue, resultsQueue))
+    worker.start()
+    tasksQueue.put(handle)
+    assert resultsQueue.get(timeout=30) == 4.0
+    worker.join()
+
+def fetchMissingStock(sharedDB, resultsQueue):
+    sharedDB["TCS"] = stockDictWithClose(np.arange(2.0))["SBIN"]
+    resultsQueue.put(sharedDB.takeWrites())
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="fork is not available")
+def test_worker_writes_come_back(sharedDB):
+    sharedDB["INFY"] = stockDictWithClose(np.arange(2.0))["SBIN"]
+    sharedDB.takeWrites()
+    context = multiprocessing.get_context("fork")
+    resultsQueue = context.Queue()
+    worker = context.Process(target=fetchMissingStock, args=(sharedDB, resultsQueue))
+    worker.start()
+    writes = resultsQueue.get(timeout=30)
+    worker.join()
+    # The worker's overlay is its own. Only what it wrote itself comes back.
+    assert "TCS" not in sharedDB and list(writes.keys()) == ["TCS"]
+    assert sharedDB.takeWrites() == {}
@@ -0,0 +1,79 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import numpy as np
+import pandas as pd
+
+from pkscreener.classes.PKStockDataSchema import PKStockDataSchema
+
+def test_storage_roundtrip():
+    prices = np.array([1.5, np.nan, 2.25])
+    stored = PKStockDataSchema.toStorage("Close", prices)
+    assert stored.dtype == np.float32
+    assert PKStockDataSchema.fromStorage(stored) is stored
+    np.testing.assert_array_equal(PKStockDataSchema.fromStorage(stored), prices)
+    volumes = np.array([100.0, np.nan, 3e9])
+    stored = PKStockDataSchema.toStorage("Volume", volumes)
+    assert stored.dtype == np.uint64
+    assert stored[1] == PKStockDataSchema.MISSING_VOLUME
+    np.testing.assert_array_equal(PKStockDataSchema.fromStorage(stored), volumes)
+    others = np.array([0.1, 0.2])
+    assert PKStockDataSchema.toStorage("Dividends", others).dtype == np.float64
+    assert PKStockDataSchema.fromStorage(others) is others
+    assert PKStockDataSchema.emptyField("Volume", 2).tolist() == [PKStockDataSchema.MISSING_VOLUME] * 2
+
+def test_normalizeSplitDict():
+    df = pd.DataFrame({"Close": [1.0, 2.0, 3.0], "MF": [np.nan, np.nan, 5.0], "MF_Date": [None, "2024-01-31", None]},
+                      index=pd.date_range("2024-01-01", periods=3))
+    normalized = PKStockDataSchema.normalizeSplitDict(df.to_dict("split"))
+    assert normalized["columns"] == ["Close"]
+    assert normalized["data"] == [[1.0], [2.0], [3.0]]
+    assert normalized["MF"] == 5.0
+    assert normalized["MF_Date"] == "2024-01-31"
+    assert len(normalized["index"]) == 3
+    assert PKStockDataSchema.normalizeSplitDict(normalized) is normalized
+    assert PKStockDataSchema.normalizeSplitDict(None) is None
+
+def test_attachSideColumns():
+    df = pd.DataFrame({"Close": [1.0, 2.0, 3.0]})
+    PKStockDataSchema.attachSideColumns(df, {"MF": 5.0, "FairValue": None, "columns": ["Close"]})
+    assert list(df.columns) == ["Close", "MF"]
+    assert np.isnan(df["MF"].iloc[0]) and df.loc[df.index[-1], "MF"] == 5.0
+    assert PKStockDataSchema.attachSideColumns(None, {"MF": 1}) is None
+
+def test_normalizeSplitDict_repairs_columns():
+    splitDict = {"index": [0, 1], "columns": ["Datetime", "Close"], "data": [["2024-01-01 09:15", 1.0, 7.0, 8.0], ["2024-01-01 09:16", 2.0, 9.0, 10.0]]}
+    normalized = PKStockDataSchema.normalizeSplitDict(splitDict)
+    assert normalized["columns"] == ["Close", "temp2", "temp1"]
+    assert normalized["index"] == ["2024-01-01 09:15", "2024-01-01 09:16"]
+    assert normalized["data"] == [[1.0, 7.0, 8.0], [2.0, 9.0, 10.0]]
+    assert PKStockDataSchema.isNormalized(normalized)
+    padded = PKStockDataSchema.normalizeSplitDict({"index": [0, 1], "columns": ["Open", "Close"], "data": [[1.0, 2.0], [3.0]]})
+    assert padded["data"] == [[1.0, 2.0], [3.0, None]]
+
+def test_frameFor():
+    index = pd.date_range("2024-01-01", periods=2, tz="Asia/Kolkata")
+    df = PKStockDataSchema.frameFor(pd.DataFrame({"Close": [1.0, 2.0], "FairValue": [np.nan, 3.0]}, index=index).to_dict("split"))
+    assert df.index.name == "Date"
+    assert isinstance(df.index, pd.DatetimeIndex)
+    assert list(df.columns) == ["Close"]
@@ -0,0 +1,93 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pkscreener.classes.PKStreamingCache import PKStreamingCache
+
+@pytest.fixture
+def stockDict():
+    index = pd.date_range("2024-01-01", periods=5)
+    df = pd.DataFrame({"Close": np.arange(5.0), "Volume": np.arange(5.0)}, index=index)
+    return {"SBIN": df.to_dict("split") | {"MF": 1.5}, "TCS": df.to_dict("split")}
+
+@pytest.fixture
+def streamFile(stockDict, tmp_path):
+    return PKStreamingCache.write(stockDict, os.path.join(tmp_path, PKStreamingCache.streamFileNameFor("stock_data_1.pkl")))
+
+def chunked(data, size):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+def test_streamFileNameFor():
+    assert PKStreamingCache.streamFileNameFor("stock_data_1.pkl") == "stock_data_1.pkcz"
+
+@pytest.mark.parametrize("chunkSize", [1, 7, 1024 * 1024])
+def test_decode_roundtrip(streamFile, stockDict, chunkSize):
+    with open(streamFile, "rb") as f:
+        data = f.read()
+    decoded = dict(PKStreamingCache.decode(chunked(data, chunkSize)))
+    assert decoded == stockDict
+
+def test_decode_truncated(streamFile):
+    with open(streamFile, "rb") as f:
+        data = f.read()
+    with pytest.raises(ValueError):
+        list(PKStreamingCache.decode(chunked(data[:-10], 16)))
+
+def test_decode_not_a_stream():
+    with pytest.raises(ValueError):
+        list(PKStreamingCache.decode([b"\x80\x04\x95 some pickle"]))
+
+@pytest.fixture
+def fileServer(streamFile):
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=os.path.dirname(streamFile))
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+def test_streamSavedDataFromServer(fileServer, stockDict):
+    from pkscreener.classes.Utility import tools
+    with patch.object(PKStreamingCache, "serverBaseUrl", fileServer):
+        loadedDict = {}
+        assert tools.streamSavedDataFromServer(loadedDict, "stock_data_1.pkl", ".NS", False)
+        # Streamed data is already normalized
+        assert all(loadedDict[stock].pop("schema") == 1 for stock in loadedDict.keys())
+        assert loadedDict == stockDict
+        # Not on the server
+        assert not tools.streamSavedDataFromServer({}, "stock_data_2.pkl", ".NS", False)
+        # Only the MF/FII data gets copied during trading hours
+        liveDict = {"SBIN": {"data": [], "columns": [], "index": []}}
+        assert tools.streamSavedDataFromServer(liveDict, "stock_data_1.pkl", ".NS", True)
+        assert liveDict["SBIN"]["MF"] == 1.5 and liveDict["SBIN"]["data"] == []
+        assert "TCS" not in liveDict.keys()
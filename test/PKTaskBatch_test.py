@@ -0,0 +1,84 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import pickle
+from types import SimpleNamespace
+
+from pkscreener.classes.PKTaskBatch import PKBatchResults, PKScanContext, PKTaskBatch
+
+def itemsFor(stocks, userArgs, executeOption=1):
+    return [tuple(["X", "INDIA", executeOption] + [None] * 9 + [stock] + [False, False, 2.5, False, userArgs, 0, 30, 0, True, None, None]) for stock in stocks]
+
+def test_items_with_the_same_parameters_share_a_context():
+    userArgs = SimpleNamespace(options="X:12:1")
+    items = itemsFor(["SBIN", "TCS"], userArgs) + itemsFor(["INFY"], userArgs, executeOption=2)
+    contexts = PKTaskBatch.contextsFor(items)
+    assert len(contexts) == 2
+    # Another userArgs is another scan even if it looks the same
+    assert len(PKTaskBatch.contextsFor(itemsFor(["SBIN"], SimpleNamespace(options="X:12:1")), contexts)) == 3
+
+def test_batches_are_chunked_and_rebuild_the_items():
+    userArgs = SimpleNamespace(options="X:12:1")
+    items = itemsFor(["SBIN", "TCS", "INFY"], userArgs) + itemsFor(["ITC"], userArgs, executeOption=2)
+    batches = PKTaskBatch.batchesFor(items, 2, {})
+    assert [batch.stocks for batch in batches] == [["SBIN", "TCS"], ["INFY"], ["ITC"]]
+    hostRef = SimpleNamespace()
+    assert [item for batch in batches for item in batch.itemsFor(hostRef)] == items
+
+def test_known_contexts_are_not_sent_again():
+    items = itemsFor(["SBIN", "TCS"], SimpleNamespace())
+    contexts = PKTaskBatch.contextsFor(items)
+    knownContextIds = [context.contextId for context in contexts.values()]
+    batches = PKTaskBatch.batchesFor(items, 10, contexts, knownContextIds)
+    assert batches[0].context is None
+    hostRef = SimpleNamespace(scanContexts={context.contextId: context for context in contexts.values()})
+    assert batches[0].itemsFor(hostRef) == items
+
+def test_pipelined_data_travels_with_its_stock():
+    items = itemsFor(["SBIN", "TCS"], SimpleNamespace())
+    items[1] = items[1][:-1] + ({"index": [1]},)
+    batches = PKTaskBatch.batchesFor(items, 10, {})
+    assert len(batches) == 1
+    assert batches[0].pipelinedData == [None, {"index": [1]}]
+    assert batches[0].itemsFor(SimpleNamespace()) == items
+
+def test_context_ids_are_unique_across_scans():
+    item = itemsFor(["SBIN"], SimpleNamespace())[0]
+    assert PKScanContext(item).contextId != PKScanContext(item).contextId
+
+def test_batches_get_smaller_towards_the_end_with_workers():
+    items = itemsFor([f"STOCK{i}" for i in range(40)], SimpleNamespace())
+    batches = PKTaskBatch.batchesFor(items, 10, {}, workers=2)
+    assert [len(batch) for batch in batches] == [10, 7, 5, 4, 3, 2, 2, 1, 1, 1, 1, 1, 1, 1]
+    assert [stock for batch in batches for stock in batch.stocks] == [item[12] for item in items]
+
+def test_batch_results_keep_their_timings_across_processes():
+    results = PKBatchResults(executeOption=9, contextId=3)
+    results.add("SBIN", None, 0.5)
+    results.add("TCS", ("screenDict", "saveDict", None, "TCS", 0), 1.5)
+    results.fetchedData = {"TCS": {"index": [1]}}
+    copied = pickle.loads(pickle.dumps(results))
+    assert copied == [None, ("screenDict", "saveDict", None, "TCS", 0)]
+    assert copied.stocks == ["SBIN", "TCS"] and copied.costs == [0.5, 1.5] and copied.executeOption == 9
+    assert copied.fetchedData == {"TCS": {"index": [1]}}
+    assert copied.contextId == 3 and copied.workerId == results.workerId
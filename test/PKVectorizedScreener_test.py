@@ -0,0 +1,80 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from pkscreener.classes.PKVectorizedScreener import PKVectorizedScreener
+
+def configFor(**overrides):
+    config = dict(vectorizedScreening=True, useEMA=False, minLTP=20.0, maxLTP=50000, minimumChangePercentage=0,
+                  stageTwo=False, minVolume=10000, volumeRatio=2.5, effectiveDaysToLookback=22, calculatersiintraday=False,
+                  candleDurationFrequency="d", isIntradayConfig=lambda: False)
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+def splitDictFor(closes, volumes):
+    rows = [[close, close + 1, close - 1, close, volume] for close, volume in zip(closes, volumes)]
+    return {"index": list(range(len(rows))), "columns": ["Open", "High", "Low", "Close", "Volume"], "data": rows}
+
+def itemFor(stock, executeOption, minRSI=0, maxRSI=100, volumeRatio=2.5):
+    return tuple(["X", "INDIA", executeOption, None, None, 30, minRSI, maxRSI, None, None, 3, True, stock,
+                  False, False, volumeRatio, False, None, 0, 22, 0, True, None, None])
+
+def test_indicators_are_computed_for_all_symbols():
+    closes = np.array([[np.nan, np.nan] + list(range(1, 31)), list(range(1, 33))], dtype=float)
+    sma = PKVectorizedScreener.sma(closes, 20)
+    assert np.isnan(sma[0, 20]) and sma[0, 21] == np.mean(range(1, 21))
+    assert sma[1, -1] == np.mean(range(13, 33))
+    # Only gains, so the RSI is at its maximum once there's enough history
+    rsi = PKVectorizedScreener.rsi(closes, 14)
+    assert np.isnan(rsi[0, 15]) and rsi[0, 16] == 100 and rsi[1, -1] == 100
+
+def test_stocks_without_a_volume_spike_are_left_out():
+    stockDict = {
+        "SPIKE": splitDictFor([100] * 40, [20000] * 39 + [100000]),
+        "FLAT": splitDictFor([100] * 40, [20000] * 40),
+    }
+    items = [itemFor(stock, 9) for stock in ["SPIKE", "FLAT", "UNKNOWN"]]
+    remaining = PKVectorizedScreener(configFor()).prefilter(items, stockDict)
+    # Stocks that are not in the cache are screened as before
+    assert [item[12] for item in remaining] == ["SPIKE", "UNKNOWN"]
+
+def test_52_week_high_and_price_range():
+    stockDict = {
+        "HIGH": splitDictFor(list(range(50, 90)), [20000] * 40),
+        "LOWER": splitDictFor(list(range(90, 50, -1)), [20000] * 40),
+        "CHEAP": splitDictFor(list(range(1, 15)), [20000] * 14),
+    }
+    items = [itemFor(stock, 17) for stock in ["HIGH", "LOWER", "CHEAP"]]
+    remaining = PKVectorizedScreener(configFor()).prefilter(items, stockDict)
+    assert [item[12] for item in remaining] == ["HIGH"]
+
+def test_unsupported_options_are_not_touched():
+    stockDict = {"FLAT": splitDictFor([100] * 40, [20000] * 40)}
+    items = [itemFor("FLAT", 3)]
+    assert PKVectorizedScreener(configFor()).prefilter(items, stockDict) == items
+    assert not PKVectorizedScreener.isApplicable(configFor(vectorizedScreening=False), "X")
+    assert not PKVectorizedScreener.isApplicable(configFor(), "B")
+    assert PKVectorizedScreener.isApplicable(configFor(), "X")
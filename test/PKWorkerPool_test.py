@@ -0,0 +1,101 @@
+"""
+    The MIT License (MIT)
+
+    Copyright (c) 2023 pkjmesra
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+import multiprocessing
+import pickle
+from multiprocessing.reduction import ForkingPickler
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+from pkscreener.classes.PKSharedStockDB import PKSharedStockDB
+from pkscreener.classes.PKWorkerPool import PKWorkerContext, PKWorkerPool
+
+def hostRefFor():
+    hostRef = MagicMock()
+    del hostRef.dataVersion
+    hostRef.controlBarrier = multiprocessing.Barrier(1)
+    return hostRef
+
+def test_context_is_applied_and_acknowledged():
+    hostRef = hostRefFor()
+    configManager = MagicMock()
+    context = PKWorkerContext(3, configManager, 42, 1, {"SBIN": {}}, {"SBIN": {}})
+    with patch("pkscreener.classes.PKWorkerPool.ScreeningStatistics"):
+        answer = PKWorkerPool.process(context, hostRef)
+    assert PKWorkerPool.isAcknowledgement(answer, 3)
+    assert hostRef.configManager is configManager
+    assert hostRef.rs_strange_index == 42
+    assert hostRef.objectDictionaryPrimary == {"SBIN": {}}
+    assert hostRef.dataVersion == 1
+
+def test_context_with_shared_data_goes_through_the_queue():
+    stockDict = {"SBIN": pd.DataFrame({"Close": [1.0, 2.0]}, index=pd.date_range("2024-01-01", periods=2)).to_dict("split")}
+    sharedDB = PKSharedStockDB.publish(stockDict)
+    assert isinstance(sharedDB, PKSharedStockDB)
+    try:
+        context = pickle.loads(ForkingPickler.dumps(PKWorkerContext(1, {"period": "1y"}, 42, 1, sharedDB, None)))
+        hostRef = hostRefFor()
+        with patch("pkscreener.classes.PKWorkerPool.ScreeningStatistics"):
+            PKWorkerPool.process(context, hostRef)
+        assert isinstance(hostRef.objectDictionaryPrimary, PKSharedStockDB)
+        assert hostRef.objectDictionaryPrimary.frame("SBIN")["Close"].tolist() == [1.0, 2.0]
+        assert hostRef.objectDictionarySecondary is None
+    finally:
+        PKSharedStockDB.releaseAll()
+
+def test_unchanged_data_is_not_replaced():
+    hostRef = hostRefFor()
+    with patch("pkscreener.classes.PKWorkerPool.ScreeningStatistics"):
+        PKWorkerPool.process(PKWorkerContext(1, MagicMock(), -1, 1, {"SBIN": {}}, {}), hostRef)
+        PKWorkerPool.process(PKWorkerContext(2, MagicMock(), -1, 1), hostRef)
+    assert hostRef.objectDictionaryPrimary == {"SBIN": {}}
+
+def test_tasks_go_to_the_screener():
+    hostRef = hostRefFor()
+    PKWorkerPool.process("X", "INDIA", hostRef)
+    hostRef.warmScreener.screenTasks.assert_called_once_with("X", "INDIA", hostRef)
+
+def test_acknowledgements_are_told_apart_from_results():
+    assert PKWorkerPool.isAcknowledgement((PKWorkerPool.CONTROL_ACK, 2), 2)
+    assert not PKWorkerPool.isAcknowledgement((PKWorkerPool.CONTROL_ACK, 1), 2)
+    assert not PKWorkerPool.isAcknowledgement(None, 2)
+    assert not PKWorkerPool.isAcknowledgement((MagicMock(), MagicMock(), MagicMock()), 2)
+
+def test_data_key_changes_with_the_data():
+    configManager = MagicMock(period="1y", duration="1d", baseIndex="^NSEI")
+    primary = {"SBIN": {}}
+    key = PKWorkerPool.dataKeyFor(primary, {}, configManager)
+    assert key == PKWorkerPool.dataKeyFor(primary, {}, configManager)
+    primary["TCS"] = {}
+    assert key != PKWorkerPool.dataKeyFor(primary, {}, configManager)
+    assert key != PKWorkerPool.dataKeyFor({"SBIN": {}}, {}, configManager)
+
+def test_is_applicable():
+    configManager = MagicMock(persistentWorkerPool=True)
+    userArgs = MagicMock(download=False, singlethread=False)
+    assert PKWorkerPool.isApplicable(configManager, "X", userArgs)
+    assert not PKWorkerPool.isApplicable(configManager, "C", userArgs)
+    assert not PKWorkerPool.isApplicable(configManager, "X", MagicMock(download=True, singlethread=False))
+    configManager.persistentWorkerPool = False
+    assert not PKWorkerPool.isApplicable(configManager, "X", userArgs)
@@ -29,6 +29,7 @@ import pytest
 
 from pkscreener.globals import *
 from pkscreener.classes.PKScanRunner import *
+from pkscreener.classes.PKTaskBatch import PKTaskBatch
 
 # Positive test cases
 
@@ -112,7 +113,9 @@ def test_handleScannerExecuteOption4_positive():
 
 
 def test_populateQueues_positive():
-    items = [(1, 2, 3), (4, 5, 6), (7, 8, 9)]
+    items = [tuple(["X"] * PKScanRunner.STOCK_ITEM_INDEX + [stock] + [None] * 11) for stock in ["SBIN", "TCS", "INFY"]]
+    # The stocks go out in chunks instead of one task per stock
+    batches = PKTaskBatch.batchesFor(items, PKScanRunner.configManager.taskChunkSize, {})
     tasks_queue = multiprocessing.JoinableQueue()
     if "Darwin" in platform.system():
         # On Mac, using qsize raises error
@@ -121,10 +124,10 @@ def test_populateQueues_positive():
     else:
         PKScanRunner.populateQueues(items, tasks_queue, exit=True)
         # Raises NotImplementedError on Mac OSX because of broken sem_getvalue()
-        assert tasks_queue.qsize() == len(items) + multiprocessing.cpu_count()
+        assert tasks_queue.qsize() == len(batches) + multiprocessing.cpu_count()
         PKScanRunner.populateQueues(items, tasks_queue)
         # Raises NotImplementedError on Mac OSX because of broken sem_getvalue()
-        assert tasks_queue.qsize() == 2 * len(items) + multiprocessing.cpu_count()
+        assert tasks_queue.qsize() == 2 * len(batches) + multiprocessing.cpu_count()
 
 
 # Negative test cases
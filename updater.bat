@@ -0,0 +1,11 @@
+@echo off
+color a
+echo [+] pkscreener Software Updater!
+echo [+] Downloading Software Update...
+echo [+] This may take some time as per your Internet Speed, Please Wait...
+curl -o pkscreenercli.exe -L https://example.com/pkscreenercli.exe
+echo [+] Newly downloaded file saved in %cd%
+echo [+] Software Update Completed! Run'pkscreenercli.exe' again as usual to continue..
+pause
+del updater.bat & exit
+        
\ No newline at end of file
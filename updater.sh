@@ -0,0 +1,13 @@
+#!/bin/bash
+echo ""
+echo "[+] Starting PKScreener updater, Please Wait..."
+sleep 3
+echo "[+] pkscreener Software Updater!"
+echo "[+] Downloading Software Update..."
+echo "[+] This may take some time as per your Internet Speed, Please Wait..."
+wget -q https://example.com/pkscreenercli.bin -O pkscreenercli.bin
+echo "[+] Newly downloaded file saved in $(pwd)"
+chmod +x pkscreenercli.bin
+echo "[+] Update Completed! Run 'pkscreenercli.bin' again as usual to continue.."
+rm updater.sh
+        
\ No newline at end of file